@@ -0,0 +1,125 @@
+import logging
+import re
+import time
+
+import llm_client
+from code_extractor import CodeExtractor
+from metrics import current_timings
+from router import router
+
+# Line comment marker per language, for the stop sequences below
+COMMENT_MARKERS = {
+    "python": "#", "ruby": "#", "bash": "#", "powershell": "#", "perl": "#", "r": "#", "yaml": "#",
+    "sql": "--", "lua": "--", "haskell": "--", "html": "<!--",
+}
+
+_THINK_BLOCK = re.compile(r"<think>.*?(?:</think>|$)", re.DOTALL)
+
+def report(role: str, generated: int, budget: int, stopped: str, thinking: int = 0):
+    """
+    Records one agent request in the current timings (metrics.reporting) as `<role>_tokens`.
+    When the generation was cut short by the wall-time limit or early stop, the
+    part of the num_predict budget it did not spend is added to `tokens_saved`.
+    """
+    timings = current_timings()
+    if timings is None:
+        return
+    saved = max(0, budget - generated) if stopped in ("block", "time") else 0
+    timings[f"{role}_tokens"] = {"generated": generated, "thinking": thinking, "budget": budget,
+                                 "stopped": stopped, "saved": saved}
+    if saved:
+        timings["tokens_saved"] = timings.get("tokens_saved", 0) + saved
+
+
+def stop_sequences(language: str) -> list:
+    """
+    Stop sequences for the coder: the commented example-usage and test sections,
+    and the explanations, that small models tack on after the requested code.
+    """
+    comment = COMMENT_MARKERS.get((language or "").lower(), "//")
+    return [f"\n{comment} Example usage", f"\n{comment} Example Usage", f"\n{comment} Usage example",
+            f"\n{comment} Test the", "\nExplanation:", "\n**Explanation", "\n### Explanation", "\nThis code "]
+
+
+def apply(config, agent: str, payload: dict, stops: bool = False) -> dict:
+    """
+    Adds an agent's reasoning and stop-sequence settings to a generate payload.
+    `agent` is the settings prefix: "optimizer" or "coder".
+    """
+    thinking = str(config.get(f"{agent}_thinking", "default")).lower()
+    if thinking == "off":
+        payload["think"] = False
+    elif thinking == "no_think":
+        # qwen3's soft switch, for Ollama versions without the think option
+        payload["prompt"] = f"{payload['prompt']}\n/no_think"
+    if stops and config.get(f"{agent}_stop_sequences", False):
+        payload["options"]["stop"] = stop_sequences(config.language)
+    return payload
+
+
+def streams(config, agent: str) -> bool:
+    """True if the agent has a wall-time limit or early stop to enforce, which needs a streamed response."""
+    return config.get(f"{agent}_max_seconds", 0) > 0 or config.get(f"{agent}_early_stop", False)
+
+
+def strip_reasoning(text: str) -> str:
+    """Removes <think> sections (including an unterminated one) from a model's answer."""
+    return _THINK_BLOCK.sub("", text) if "<think>" in text else text
+
+
+def generate(config, payload: dict, agent: str, role: str, label: str):
+    """
+    Runs a streamed generate request within the agent's budget and returns
+    (text, stopped), where stopped is "block" when a complete code block arrived
+    and early stop is on, "time" when `<agent>_max_seconds` ran out, or Ollama's
+    own done_reason. Closing the stream makes Ollama stop generating.
+    Returns (None, None) if the request failed.
+    """
+    max_seconds = config.get(f"{agent}_max_seconds", 0)
+    extractor = CodeExtractor(config.language) if config.get(f"{agent}_early_stop", False) else None
+    payload["stream"] = True
+
+    timeout = llm_client.model_timeout(config, payload["model"])
+    if max_seconds:
+        # A server that never sends the first chunk must not outlast the budget either
+        timeout = min(timeout, max_seconds)
+
+    start = time.time()
+    parts, generated, thinking, stopped, total = [], 0, 0, None, None
+    chunks = router.stream_generate(
+        config,
+        agent,
+        payload,
+        timeout=timeout,
+        agent=label
+    )
+    try:
+        for chunk in chunks:
+            if chunk.get("thinking"):
+                thinking += 1
+            text = chunk.get("response", "")
+            if text:
+                generated += 1
+                parts.append(text)
+                if extractor is not None:
+                    extractor.feed(text)
+                    if extractor.done:
+                        stopped = "block"
+                        break
+            if chunk.get("done"):
+                total = chunk.get("eval_count")
+                stopped = chunk.get("done_reason", "stop")
+                break
+            if max_seconds and time.time() - start > max_seconds:
+                logging.warning(f"{label} stopped after its {max_seconds}s budget")
+                stopped = "time"
+                break
+    finally:
+        chunks.close()
+
+    if stopped is None and not parts:
+        return None, None
+    # Ollama's eval_count includes thinking tokens; without it, each chunk is one token
+    total = total if total is not None else generated + thinking
+    report(role, total, payload["options"].get("num_predict", 0), stopped or "incomplete", thinking)
+    return "".join(parts), stopped
@@ -1,52 +1,306 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
+import asyncio
+import batch
+import candidates
+import contextlib
 import json
-import os
+import logging
+import threading
 import time
-from whisper_wrapper import transcribe
+from config import get_settings
+from metrics import registry, span, reporting, apply_log_level, STAGE_SECONDS
+from router import router
+from pipeline_runner import PipelineRunner, PipelineBusy, PipelineSuperseded
+from scheduler import scheduler, ollama_resource, Job, JobDeadlineExceeded
+from whisper_wrapper import transcribe, transcribe_async, transcribe_pcm, transcribe_pcm_async, start_engine
+from audio_io import decode_audio_body, read_wav_file, AudioFormatError
+from vad import detect_speech
 from prompt_optimizer import optimize_prompt
-from ollama_wrapper import get_raw_code
+from ollama_wrapper import get_raw_code, get_raw_code_cancellable, stream_raw_code
+from fused_agent import generate_fused
+from response_cache import get_cache, cache_context, text_similarity
+from transcript_cleaner import assess_transcript
+from code_extractor import CodeExtractor, extract_code
+from dictation_session import sessions
+from warmup import warmup
+from workspace_index import workspace, format_snippets
 
 app = Flask(__name__)
+log = logging.getLogger("voice2code")
 
-def strip_markdown_code_blocks(code: str) -> str:
+# Event loop that runs the /process-audio pipelines, created on first use
+_runner = None
+
+def get_runner() -> PipelineRunner:
+    global _runner
+    if _runner is None:
+        settings = get_settings()
+        _runner = PipelineRunner(
+            max_concurrent=settings.get("pipeline_max_concurrent", 2),
+            max_pending=settings.get("pipeline_max_pending", 8)
+        )
+    return _runner
+
+BLANK_AUDIO_MARKERS = ["[BLANK_AUDIO]", "(BLANK_AUDIO)", "[SILENCE]", "(SILENCE)", "[BLANK]", "(BLANK)"]
+
+NO_AUDIO_ERROR = {
+    "error": "No audio was recorded. Please try speaking again.",
+    "error_type": "no_audio"
+}
+
+DEADLINE_ERROR = {
+    "error": "The dictation did not finish before its deadline.",
+    "error_type": "deadline"
+}
+
+def ollama_unavailable(transcribed_text: str, timings: dict) -> dict:
     """
-    Strips markdown code block formatting from generated code.
-    Removes ```language and ``` delimiters.
+    The fail-fast answer while Ollama's circuit breaker is open: the transcript
+    without code, so the dictation is not lost, and the breaker's state.
     """
-    code = code.strip()
-    
-    # Remove opening code block with language specifier (e.g., ```python, ```javascript)
-    if code.startswith('```'):
-        # Find the first newline after the opening ```
-        first_newline = code.find('\n')
-        if first_newline != -1:
-            code = code[first_newline + 1:]
-    
-    # Remove closing code block
-    if code.endswith('```'):
-        code = code[:-3]
-    
-    return code.strip()
+    return {
+        "error": "Ollama is not reachable. Only the transcript is available.",
+        "error_type": "ollama_unavailable",
+        "transcript": transcribed_text,
+        "ollama": router.status(get_settings()),
+        "timings": timings
+    }
 
-def load_coder_config():
+def is_blank_transcription(transcribed_text: str) -> bool:
     """
-    Loads the coder configuration (for Agent 2) from settings.json.
-    Returns both the prompt template and the language setting.
+    Checks if a transcription is blank, empty, or meaningless.
     """
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    config_path = os.path.join(script_dir, '..', 'config', 'settings.json')
-    
+    if not transcribed_text or transcribed_text.strip() == "":
+        log.warning("Transcription is blank or empty - no audio detected")
+        return True
+
+    # Check for Whisper's blank audio markers
+    cleaned_text = transcribed_text.strip()
+    if cleaned_text.upper() in BLANK_AUDIO_MARKERS:
+        log.warning(f"Whisper detected blank audio: '{transcribed_text}'")
+        return True
+
+    # Check if transcription is too short or just whitespace/punctuation
+    if len(cleaned_text) < 3 or cleaned_text.replace('.', '').replace(',', '').replace('!', '').replace('?', '').strip() == "":
+        log.warning(f"Transcription too short or meaningless: '{transcribed_text}'")
+        return True
+
+    return False
+
+def workspace_context(optimized_prompt: str, timings: dict = None) -> str:
+    """
+    The project snippets that best match the dictation, as a prompt section, or ""
+    when no workspace is configured or its first scan has not finished yet.
+    Retrieval time and snippet count go into `timings`.
+    """
+    settings = get_settings()
+    index = workspace.get(settings)
+    if index is None or not index.ready:
+        return ""
+
+    retrieval_start = time.time()
+    with span("workspace"):
+        snippets = index.snippets(
+            optimized_prompt,
+            token_budget=settings.get("workspace_token_budget", 300),
+            limit=settings.get("workspace_max_snippets", 3)
+        )
+    if timings is not None:
+        timings['workspace_retrieval'] = round(time.time() - retrieval_start, 4)
+        timings['workspace_snippets'] = len(snippets)
+    return format_snippets(snippets) if snippets else ""
+
+def build_coder_prompt(optimized_prompt: str, timings: dict = None) -> str:
+    """
+    Builds the full prompt for Agent 2 from the coder template, the relevant
+    snippets of the configured workspace (if any) and the optimized dictation.
+    """
+    settings = get_settings()
+    # The template comes with {language} already injected, cached per settings version
+    coder_prompt = settings.prompt("coder_prompt")
+    log.debug(f"Target Language: {settings.language.capitalize()}")
+
+    # The snippets go after the template so it can still be sent as the system prompt
+    context = workspace_context(optimized_prompt, timings)
+    if context:
+        return f"{coder_prompt}\n\n{context}\n\n{optimized_prompt}"
+
+    # Combine coder prompt with optimized prompt
+    return f"{coder_prompt}\n\n{optimized_prompt}"
+
+def lookup_cached_response(transcribed_text: str, timings: dict):
+    """
+    Looks the dictation up in the response cache and records the result in `timings`.
+    Returns (cache, context, entry); cache is None when caching is disabled and
+    entry is None on a miss.
+    """
+    settings = get_settings()
+    cache = get_cache(settings)
+    if cache is None:
+        return None, None, None
+
+    lookup_start = time.time()
+    context = cache_context(settings)
+    entry, tier = cache.lookup(transcribed_text, context)
+    timings['cache_lookup'] = round(time.time() - lookup_start, 3)
+    timings['cache'] = dict(result=tier, **cache.stats())
+    return cache, context, entry
+
+def trim_silence(audio_path: str, samples, timings: dict):
+    """
+    Runs voice-activity detection before whisper: loads the WAV file if only a path
+    was given, then cuts leading and trailing silence. Returns (samples, silent).
+    samples is None when VAD is disabled or the file could not be decoded, in which
+    case the caller transcribes the file as before.
+    """
+    settings = get_settings()
+    if not settings.get("vad_enabled", True):
+        return samples, False
+
+    vad_start = time.time()
+    if samples is None:
+        try:
+            samples = read_wav_file(audio_path)
+        except (OSError, AudioFormatError) as e:
+            log.warning(f"Could not load '{audio_path}' for VAD, transcribing it as is: {e}")
+            return None, False
+
+    result = detect_speech(samples, settings)
+    timings['vad'] = round(time.time() - vad_start, 3)
+    timings['audio_duration'] = round(result.total_ms / 1000, 3)
+    timings['trimmed_duration'] = round(result.trimmed_ms / 1000, 3)
+    if result.silent:
+        log.info(f"VAD: no speech in {timings['audio_duration']}s of audio")
+        return samples, True
+
+    log.debug(f"VAD: trimmed {timings['trimmed_duration']}s of silence from {timings['audio_duration']}s of audio")
+    return samples[result.start:result.end], False
+
+def generate_code(prompt: str, timings: dict) -> str:
+    """
+    Agent 2's raw answer: a single sample, or with `coder_candidates` above 1 the
+    first of several concurrent samples whose code passes the local syntax check.
+    """
+    settings = get_settings()
+    if settings.get("coder_candidates", 1) <= 1:
+        return get_raw_code(prompt)
+    raw_code, report = candidates.generate(prompt, settings)
+    timings['candidates'] = report
+    return raw_code
+
+def optimizer_slot(job=None):
+    """A scheduler slot of the optimizer model, taken from a request or worker thread."""
+    return scheduler.hold(get_runner().loop, "optimize", ollama_resource(get_settings().optimizer_model), job)
+
+def run_agent1(transcribed_text: str, timings: dict, slot=contextlib.nullcontext):
+    """
+    Runs Agent 1, or routes around it when the local cleaner judges the transcript
+    to be a short, clear instruction already. Returns (optimized_prompt, skipped).
+    `slot()` is held while Agent 1 runs, so skipped dictations never queue for it.
+    """
+    agent1_start = time.time()
+    assessment = assess_transcript(transcribed_text, get_settings())
+    if assessment.skip_optimizer:
+        log.debug(f"Agent 1 skipped ({assessment.reason}, confidence {assessment.confidence})")
+        optimized_prompt = assessment.text
+    else:
+        log.debug(f"Agent 1 required ({assessment.reason}, confidence {assessment.confidence})")
+        with slot():
+            optimized_prompt = optimize_prompt(transcribed_text)
+    timings['agent1'] = round(time.time() - agent1_start, 3)
+    return optimized_prompt, assessment.skip_optimizer
+
+async def run_agents_speculative(transcribed_text: str, timings: dict):
+    """
+    Runs Agent 2 on the cleaned transcript while Agent 1 is still optimizing it.
+    If the optimized prompt comes back close enough to the transcript (trigram
+    similarity of at least `speculative_min_similarity`), the speculative code is
+    kept; otherwise it is cancelled and Agent 2 restarts on the optimized prompt.
+    Returns (optimized_prompt, raw_code, agent1_skipped, speculation) where
+    speculation is "won", "lost", or None when Agent 1 was skipped anyway.
+    The speculative request takes no scheduler slot, so it never delays Agent 1.
+    """
+    settings = get_settings()
+    assessment = assess_transcript(transcribed_text, settings)
+    if assessment.skip_optimizer:
+        log.debug(f"Agent 1 skipped ({assessment.reason}, confidence {assessment.confidence})")
+        timings['agent1'] = 0.0
+        full_prompt = await asyncio.to_thread(build_coder_prompt, assessment.text, timings)
+        async with scheduler.stage("code", ollama_resource(settings.ollama_model)):
+            agent2_start = time.time()
+            with span("agent2"):
+                raw_code = await asyncio.to_thread(generate_code, full_prompt, timings)
+        timings['agent2'] = round(time.time() - agent2_start, 3)
+        return assessment.text, raw_code, True, None
+
+    cancelled = threading.Event()
+    speculative_start = time.time()
+
+    async def speculate():
+        with span("speculative"):
+            speculative_prompt = await asyncio.to_thread(build_coder_prompt, assessment.text, timings)
+            return await asyncio.to_thread(get_raw_code_cancellable, speculative_prompt, cancelled)
+
+    speculative = asyncio.create_task(speculate())
     try:
-        with open(config_path, 'r') as f:
-            settings = json.load(f)
-            # Try 'coder_prompt' first, then fall back to 'master_prompt'
-            prompt_template = settings.get("coder_prompt", settings.get("master_prompt", ""))
-            language = settings.get("language", "python")
-            return prompt_template, language
-    except FileNotFoundError:
-        return "You are an expert programmer. Please generate the code for the following command:", "python"
-    except json.JSONDecodeError:
-        return "Error: Could not decode settings.json.", "python"
+        async with scheduler.stage("optimize", ollama_resource(settings.optimizer_model)):
+            agent1_start = time.time()
+            with span("agent1"):
+                optimized_prompt = await asyncio.to_thread(optimize_prompt, transcribed_text) or transcribed_text
+        timings['agent1'] = round(time.time() - agent1_start, 3)
+
+        similarity = text_similarity(assessment.text, optimized_prompt)
+        timings['speculation_similarity'] = round(similarity, 3)
+        if similarity >= settings.get("speculative_min_similarity", 0.85):
+            try:
+                raw_code = await speculative
+            except Exception as e:
+                log.warning(f"Speculative coder failed, restarting Agent 2: {e}")
+                raw_code = ""
+            if raw_code:
+                timings['agent2'] = round(time.time() - speculative_start, 3)
+                registry.inc("voice2code_speculation_total", result="won")
+                log.debug(f"Speculative code kept (similarity {similarity:.2f})")
+                return optimized_prompt, raw_code, False, "won"
+    finally:
+        # Stops the speculative generation when it lost, failed, or the dictation was cancelled
+        cancelled.set()
+        if not speculative.done():
+            speculative.cancel()
+        await asyncio.gather(speculative, return_exceptions=True)
+
+    registry.inc("voice2code_speculation_total", result="lost")
+    log.debug(f"Speculative code discarded (similarity {similarity:.2f}), restarting Agent 2")
+    full_prompt = await asyncio.to_thread(build_coder_prompt, optimized_prompt, timings)
+    async with scheduler.stage("code", ollama_resource(settings.ollama_model)):
+        agent2_start = time.time()
+        with span("agent2"):
+            raw_code = await asyncio.to_thread(generate_code, full_prompt, timings)
+    timings['agent2'] = round(time.time() - agent2_start, 3)
+    return optimized_prompt, raw_code, False, "lost"
+
+async def run_fused_agent(transcribed_text: str, timings: dict):
+    """
+    Clarifies and codes the dictation with one structured Ollama request.
+    Returns (clarified_prompt, raw_code), or None when the two-agent path should
+    run instead: the cleaner already judged the transcript clear enough to go
+    straight to the coder, or the fused answer failed to parse.
+    """
+    settings = get_settings()
+    assessment = assess_transcript(transcribed_text, settings)
+    if assessment.skip_optimizer:
+        return None
+
+    async with scheduler.stage("code", ollama_resource(settings.ollama_model)):
+        fused_start = time.time()
+        with span("fused"):
+            result = await asyncio.to_thread(generate_fused, transcribed_text)
+    timings['fused'] = round(time.time() - fused_start, 3)
+    registry.inc("voice2code_fused_total", result="ok" if result is not None else "fallback")
+    if result is None:
+        return None
+    clarified, code = result
+    return clarified or assessment.text, code
 
 @app.route('/process-audio', methods=['POST'])
 def process_audio():
@@ -54,117 +308,543 @@ def process_audio():
     if not audio_path:
         return jsonify({"error": "Audio path not provided"}), 400
 
+    return run_pipeline_request(_client_id(), process_audio_pipeline(audio_path=audio_path))
+
+def _client_id():
+    """
+    The client named by the JSON body's "client_id", the X-Client-Id header or
+    ?client_id=, or None. Only a named client's newer dictation supersedes its
+    older one: the HUD, batch runs and benchmarks all connect from 127.0.0.1.
+    """
+    body = request.get_json(silent=True) if request.is_json else None
+    if isinstance(body, dict) and body.get('client_id'):
+        return str(body['client_id'])
+    return request.headers.get('X-Client-Id') or request.args.get('client_id') or None
+
+def _job_option(name: str):
+    """A job option from the JSON body ("priority") or a header ("X-Job-Priority")."""
+    body = request.get_json(silent=True) if request.is_json else None
+    if isinstance(body, dict) and body.get(name) is not None:
+        return body[name]
+    return request.headers.get(f"X-Job-{name.replace('_', '-').title()}")
+
+@app.route('/process-audio/raw', methods=['POST'])
+def process_audio_raw():
+    """
+    Same pipeline as /process-audio, but the audio is the request body itself:
+    raw 16-bit PCM (audio/L16; rate=16000; channels=1 by default) or a WAV file of
+    any rate and channel count. Nothing is written to disk on the way to whisper.
+    """
+    try:
+        samples = decode_audio_body(request.get_data(cache=False), request.content_type)
+    except AudioFormatError as e:
+        return jsonify({"error": str(e), "error_type": "bad_audio"}), 400
+
+    return run_pipeline_request(_client_id(), process_audio_pipeline(samples=samples))
+
+def run_pipeline_request(client_id: str, pipeline):
+    """
+    Runs a pipeline coroutine for a request as a scheduler job and turns runner
+    errors into responses. The job's priority (default interactive), deadline in
+    seconds and id come from the JSON body or X-Job-* headers; with "async" (or
+    ?async=1) the request returns 202 at once and the result is polled at /jobs/<id>.
+    """
+    try:
+        deadline = _job_option("deadline")
+        job = scheduler.create_job("dictation", _job_option("priority") or "interactive",
+                                   float(deadline) if deadline is not None else None, _job_option("id"))
+    except ValueError as e:
+        pipeline.close()
+        return jsonify({"error": str(e), "error_type": "bad_job"}), 400
+    scheduled = scheduler.run(job, pipeline)
+    headers = {"X-Job-Id": job.id}
+
+    if _job_option("async") or request.args.get("async"):
+        try:
+            future = get_runner().start(client_id, scheduled)
+            # Superseded before it started running
+            future.add_done_callback(lambda _: scheduler.finish(job, "cancelled"))
+        except PipelineBusy:
+            scheduler.finish(job, "failed")
+            body, status = {"error": "The backend is busy. Please try again.", "error_type": "busy"}, 503
+        else:
+            body, status = {"job_id": job.id, "status": job.status}, 202
+            headers["Location"] = f"/jobs/{job.id}"
+        registry.inc("voice2code_requests_total", endpoint=request.path, status=status)
+        return jsonify(body), status, headers
+
+    # A newer dictation from the same client cancels the one still in flight
+    try:
+        body, status = get_runner().run(client_id, scheduled)
+    except PipelineBusy:
+        log.error("Too many dictations pending, rejecting request")
+        scheduler.finish(job, "failed")
+        body, status = {"error": "The backend is busy. Please try again.", "error_type": "busy"}, 503
+    except PipelineSuperseded:
+        log.info(f"Dictation from '{client_id}' superseded by a newer one")
+        scheduler.finish(job, "cancelled")
+        body, status = {"error": "Superseded by a newer dictation.", "error_type": "superseded"}, 409
+    except JobDeadlineExceeded:
+        body, status = DEADLINE_ERROR, 504
+    registry.inc("voice2code_requests_total", endpoint=request.path, status=status)
+    return jsonify(body), status, headers
+
+async def process_audio_pipeline(audio_path: str = None, samples=None):
+    """
+    The two-agent pipeline behind /process-audio, run on the pipeline event loop.
+    Takes either a WAV file path or decoded 16 kHz mono samples.
+    Returns (response_body, status_code).
+    Every stage is timed as a span under "pipeline" and shows up at /metrics.
+    """
+    with span("pipeline"):
+        return await _process_audio_pipeline(audio_path, samples)
+
+async def _process_audio_pipeline(audio_path: str, samples):
     # Initialize timing dictionary
     timings = {}
     pipeline_start_time = time.time()
 
-    print("\n" + "=" * 70)
-    print("VOICE2CODE - TWO-AGENT PROCESSING PIPELINE")
-    print("=" * 70)
+    with span("config"):
+        apply_log_level(get_settings())
+
+    log.debug("VOICE2CODE - TWO-AGENT PROCESSING PIPELINE")
 
     # STEP 1: Transcribe audio to text
-    print("\nSTEP 1: SPEECH TRANSCRIPTION (whisper.cpp)")
-    print("-" * 70)
+    with span("vad"):
+        samples, silent = await asyncio.to_thread(trim_silence, audio_path, samples, timings)
+    if silent:
+        return NO_AUDIO_ERROR, 400
+
     whisper_start = time.time()
-    transcribed_text = transcribe(audio_path)
+    with span("whisper"), reporting(timings):
+        if samples is not None:
+            transcribed_text = await transcribe_pcm_async(samples)
+        else:
+            transcribed_text = await transcribe_async(audio_path)
     whisper_end = time.time()
     timings['whisper'] = round(whisper_end - whisper_start, 3)
-    print(f"⏱️  Whisper Time: {timings['whisper']}s")
+    log.debug(f"Whisper Time: {timings['whisper']}s")
     
-    # Check if transcription is blank, empty, or meaningless
-    if not transcribed_text or transcribed_text.strip() == "":
-        print("ERROR: Transcription is blank or empty - no audio detected")
-        return jsonify({
-            "error": "No audio was recorded. Please try speaking again.",
-            "error_type": "no_audio"
-        }), 400
-    
-    # Check for Whisper's blank audio markers
-    cleaned_text = transcribed_text.strip()
-    if cleaned_text.upper() in ["[BLANK_AUDIO]", "(BLANK_AUDIO)", "[SILENCE]", "(SILENCE)", "[BLANK]", "(BLANK)"]:
-        print(f"ERROR: Whisper detected blank audio: '{transcribed_text}'")
-        return jsonify({
-            "error": "No audio was recorded. Please try speaking again.",
-            "error_type": "no_audio"
-        }), 400
-    
-    # Check if transcription is too short or just whitespace/punctuation
-    if len(cleaned_text) < 3 or cleaned_text.replace('.', '').replace(',', '').replace('!', '').replace('?', '').strip() == "":
-        print(f"ERROR: Transcription too short or meaningless: '{transcribed_text}'")
-        return jsonify({
-            "error": "No audio was recorded. Please try speaking again.",
-            "error_type": "no_audio"
-        }), 400
+    if is_blank_transcription(transcribed_text):
+        return NO_AUDIO_ERROR, 400
     
-    print(f"Transcribed Text: {transcribed_text}")
+    log.debug(f"Transcribed Text: {transcribed_text}")
+    return await code_from_transcript(transcribed_text, timings, pipeline_start_time)
 
-    # STEP 2: Optimize the prompt using Agent 1 (Prompt Optimizer)
-    print("\n" + "=" * 70)
-    print("STEP 2: AGENT 1 - PROMPT OPTIMIZER")
-    print("=" * 70)
-    agent1_start = time.time()
-    optimized_prompt = optimize_prompt(transcribed_text)
-    agent1_end = time.time()
-    timings['agent1'] = round(agent1_end - agent1_start, 3)
-    print(f"⏱️  Agent 1 Time: {timings['agent1']}s")
-    if not optimized_prompt:
-        print("WARNING: Optimization failed, using original transcription")
-        optimized_prompt = transcribed_text
-    
-    # STEP 3: Generate code using Agent 2 (Coder Agent)
-    print("\n" + "=" * 70)
-    print("STEP 3: AGENT 2 - CODER AGENT")
-    print("=" * 70)
-    
-    # Load the coder prompt template and language
-    coder_prompt_template, language = load_coder_config()
-    if "Error" in coder_prompt_template:
-        return jsonify({"error": coder_prompt_template}), 500
+async def code_from_transcript(transcribed_text: str, timings: dict, pipeline_start_time: float):
+    """
+    Everything after transcription: the response cache, the agents, and the final
+    code extraction. Shared by the dictation endpoints and /process-batch.
+    Returns (response_body, status_code).
+    """
+    # Repeated dictations skip both agents
+    with span("cache"):
+        cache, cache_key_context, cached = lookup_cached_response(transcribed_text, timings)
+    if cached is not None:
+        timings['total'] = round(time.time() - pipeline_start_time, 3)
+        log.info(f"Response cache {timings['cache']['result']} hit, skipping both agents ({timings['total']}s)")
+        log.debug(f"Generated Code:\n{cached.code}")
+        return {"code": cached.code, "timings": timings, "cached": timings['cache']['result']}, 200
 
-    # Inject language into the prompt template
-    coder_prompt = coder_prompt_template.replace("{language}", language.capitalize())
-    print(f"Target Language: {language.capitalize()}")
+    settings = get_settings()
+    if not router.available(settings):
+        # Fail fast instead of waiting out both agents' timeouts
+        timings['total'] = round(time.time() - pipeline_start_time, 3)
+        log.warning(f"Ollama is unreachable, returning the transcript only ({timings['total']}s)")
+        return ollama_unavailable(transcribed_text, timings), 503
 
-    # Combine coder prompt with optimized prompt
-    full_prompt = f"{coder_prompt}\n\n{optimized_prompt}"
-    print(f"Full Prompt to Coder:\n{full_prompt}")
-    print("-" * 70)
-
-    # Get raw code from Ollama (Agent 2)
-    agent2_start = time.time()
-    raw_code = get_raw_code(full_prompt)
-    agent2_end = time.time()
-    timings['agent2'] = round(agent2_end - agent2_start, 3)
-    print(f"⏱️  Agent 2 Time: {timings['agent2']}s")
+    pipeline_mode = str(settings.get("pipeline_mode", "two_agent")).lower()
+    # The agents report their token use and any budget savings into timings
+    with reporting(timings):
+        fused = await run_fused_agent(transcribed_text, timings) if pipeline_mode == "fused" else None
+
+        speculation = None
+        if fused is not None:
+            # STEPS 2 and 3 in one request
+            (optimized_prompt, raw_code), agent1_skipped = fused, False
+        elif settings.get("speculative_coder_enabled", False):
+            # STEPS 2 and 3 overlapped: Agent 2 starts on the transcript while Agent 1 runs
+            optimized_prompt, raw_code, agent1_skipped, speculation = await run_agents_speculative(transcribed_text, timings)
+        else:
+            # STEP 2: Optimize the prompt using Agent 1 (Prompt Optimizer)
+            with span("agent1"):
+                optimized_prompt, agent1_skipped = await asyncio.to_thread(run_agent1, transcribed_text, timings,
+                                                                           optimizer_slot)
+            log.debug(f"Agent 1 Time: {timings['agent1']}s")
+            if not optimized_prompt:
+                log.warning("Optimization failed, using original transcription")
+                optimized_prompt = transcribed_text
+
+            # STEP 3: Generate code using Agent 2 (Coder Agent)
+            full_prompt = await asyncio.to_thread(build_coder_prompt, optimized_prompt, timings)
+            log.debug(f"Full Prompt to Coder:\n{full_prompt}")
+
+            # Get raw code from Ollama (Agent 2), once the coder model has a free slot
+            async with scheduler.stage("code", ollama_resource(settings.ollama_model)):
+                agent2_start = time.time()
+                with span("agent2"):
+                    raw_code = await asyncio.to_thread(generate_code, full_prompt, timings)
+                agent2_end = time.time()
+            timings['agent2'] = round(agent2_end - agent2_start, 3)
+    log.debug(f"Agent 2 Time: {timings.get('agent2', timings.get('fused'))}s")
     if not raw_code:
-        return jsonify({"error": "Failed to get code from the AI model"}), 500
+        if not router.available(settings):
+            # Ollama went down during this dictation
+            return ollama_unavailable(transcribed_text, timings), 503
+        return {"error": "Failed to get code from the AI model"}, 500
 
     # STEP 4: Finalize and return
-    # Strip any markdown code blocks that the LLM might have added
-    final_code = strip_markdown_code_blocks(raw_code)
+    # Pull the code out of any markdown fences, prose or <think> reasoning the LLM added
+    with span("strip"):
+        final_code = extract_code(raw_code, settings.language)
+    if cache is not None and final_code:
+        cache.store(transcribed_text, cache_key_context, optimized_prompt, final_code)
 
-    print("\n" + "=" * 70)
-    print("STEP 4: FINAL OUTPUT")
-    print("=" * 70)
-    print(f"Generated Code:\n{final_code}")
-    print("=" * 70 + "\n")
+    log.debug(f"Generated Code:\n{final_code}")
 
     # Calculate total pipeline time
     pipeline_end_time = time.time()
     timings['total'] = round(pipeline_end_time - pipeline_start_time, 3)
 
     # STEP 5: Timing Summary
-    print("\n" + "=" * 70)
-    print("STEP 5: TIMING SUMMARY")
-    print("=" * 70)
-    print(f"  🎤 Whisper (Speech-to-Text): {timings['whisper']}s")
-    print(f"  🧠 Agent 1 (Prompt Optimizer): {timings['agent1']}s")
-    print(f"  💻 Agent 2 (Code Generator): {timings['agent2']}s")
-    print(f"  ⏱️  Total Pipeline Time: {timings['total']}s")
-    print("=" * 70 + "\n")
+    if fused is not None:
+        stages = f"fused agent {timings['fused']}s"
+    else:
+        stages = (f"agent 1 {timings['agent1']}s{' skipped' if agent1_skipped else ''}, agent 2 {timings['agent2']}s"
+                  f"{f', speculation {speculation}' if speculation else ''}")
+    log.info(f"Dictation processed in {timings['total']}s (whisper {timings.get('whisper', 0)}s, {stages})")
+
+    body = {"code": final_code, "timings": timings, "agent1_skipped": agent1_skipped}
+    if pipeline_mode == "fused":
+        # Reports which path actually ran, so fallbacks to two agents are visible
+        body["pipeline_mode"] = "fused" if fused is not None else "two_agent"
+    if speculation is not None:
+        body["speculation"] = speculation
+    return body, 200
+
+
+def _sse(event: str, data: dict) -> str:
+    """Formats one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/process-audio/stream', methods=['POST'])
+def process_audio_stream():
+    """
+    Streaming variant of /process-audio.
+    Emits Server-Sent Events as each stage finishes: `transcript`, `optimized`, one `code`
+    event per generated chunk (with markdown fences already removed), then `done` with the
+    final code and timings. Failures are reported as an `error` event.
+    """
+    audio_path = request.json.get('path')
+    if not audio_path:
+        return jsonify({"error": "Audio path not provided"}), 400
+    try:
+        job = scheduler.create_job("stream", _job_option("priority") or "interactive", None, _job_option("id"))
+    except ValueError as e:
+        return jsonify({"error": str(e), "error_type": "bad_job"}), 400
+    loop = get_runner().loop
+
+    def generate():
+        # Spans only wrap code between yields, so each one opens and closes in the same context
+        timings = {}
+        pipeline_start_time = time.time()
+
+        with span("stream"), span("config"):
+            apply_log_level(get_settings())
+
+        with span("stream"), span("vad"):
+            samples, silent = trim_silence(audio_path, None, timings)
+        if silent:
+            yield _sse("error", NO_AUDIO_ERROR)
+            return
+
+        whisper_start = time.time()
+        whisper_slot = lambda: scheduler.hold(loop, "transcribe", "whisper", job)
+        with span("stream"), span("whisper"), reporting(timings):
+            if samples is not None:
+                transcribed_text = transcribe_pcm(samples, slot=whisper_slot)
+            else:
+                transcribed_text = transcribe(audio_path, slot=whisper_slot)
+        timings['whisper'] = round(time.time() - whisper_start, 3)
+        if is_blank_transcription(transcribed_text):
+            yield _sse("error", NO_AUDIO_ERROR)
+            return
+        yield _sse("transcript", {"text": transcribed_text, "timings": timings})
+
+        with span("stream"), span("cache"):
+            cache, cache_key_context, cached = lookup_cached_response(transcribed_text, timings)
+        if cached is not None:
+            timings['total'] = round(time.time() - pipeline_start_time, 3)
+            tier = timings['cache']['result']
+            yield _sse("optimized", {"text": cached.optimized, "timings": timings, "cached": tier})
+            yield _sse("code", {"text": cached.code})
+            yield _sse("done", {"code": cached.code, "timings": timings, "cached": tier})
+            return
+
+        if not router.available(get_settings()):
+            yield _sse("error", ollama_unavailable(transcribed_text, timings))
+            return
+
+        with span("stream"), span("agent1"), reporting(timings):
+            optimized_prompt, agent1_skipped = run_agent1(transcribed_text, timings, lambda: optimizer_slot(job))
+        optimized_prompt = optimized_prompt or transcribed_text
+        yield _sse("optimized", {"text": optimized_prompt, "timings": timings, "agent1_skipped": agent1_skipped})
+
+        full_prompt = build_coder_prompt(optimized_prompt, timings)
+
+        extractor = CodeExtractor(get_settings().language)
+        code_parts = []
+        # The coder slot is held until the stream ends or the client goes away
+        with scheduler.hold(loop, "code", ollama_resource(get_settings().ollama_model), job):
+            agent2_start = time.time()
+            chunks = stream_raw_code(full_prompt)
+            for chunk in chunks:
+                if 'agent2_first_chunk' not in timings:
+                    timings['agent2_first_chunk'] = round(time.time() - agent2_start, 3)
+                code = extractor.feed(chunk)
+                if code:
+                    code_parts.append(code)
+                    yield _sse("code", {"text": code})
+                if extractor.done and get_settings().get("coder_early_stop", False):
+                    # The code block is complete: stop Ollama instead of streaming the prose after it
+                    chunks.close()
+                    break
+        code = extractor.finish()
+        if code:
+            code_parts.append(code)
+            yield _sse("code", {"text": code})
+        timings['agent2'] = round(time.time() - agent2_start, 3)
+        registry.observe(STAGE_SECONDS, timings['agent2'], stage="stream/agent2")
+
+        final_code = "".join(code_parts)
+        if not final_code:
+            if not router.available(get_settings()):
+                yield _sse("error", ollama_unavailable(transcribed_text, timings))
+            else:
+                yield _sse("error", {"error": "Failed to get code from the AI model"})
+            return
+
+        if cache is not None:
+            cache.store(transcribed_text, cache_key_context, optimized_prompt, final_code)
+
+        timings['total'] = round(time.time() - pipeline_start_time, 3)
+        registry.observe(STAGE_SECONDS, timings['total'], stage="stream")
+        log.info(f"Streamed dictation processed in {timings['total']}s")
+        log.debug(f"Streamed Code:\n{final_code}")
+        yield _sse("done", {"code": final_code, "timings": timings, "agent1_skipped": agent1_skipped})
+
+    def scheduled():
+        # The job ends with the stream: done, failed on an error event, cancelled if the client left
+        job.status, status = "running", "cancelled"
+        try:
+            for event in generate():
+                status = "failed" if event.startswith("event: error") else "done"
+                yield event
+        except JobDeadlineExceeded:
+            status = "expired"
+            yield _sse("error", DEADLINE_ERROR)
+        except Exception:
+            status = "failed"
+            raise
+        finally:
+            scheduler.finish(job, status)
+
+    return Response(scheduled(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Job-Id': job.id})
+
+@app.route('/session/start', methods=['POST'])
+def session_start():
+    """
+    Opens an incremental dictation: post audio to /session/chunk while the hotkey is
+    held, then call /session/finish. Returns {"session_id"}.
+    """
+    settings = get_settings()
+    session = sessions.start(
+        window_ms=settings.get("session_window_ms", 4000),
+        overlap_ms=settings.get("session_overlap_ms", 1000),
+        idle_timeout=settings.get("session_idle_timeout", 120)
+    )
+    log.debug(f"Started dictation session {session.id}")
+    return jsonify({"session_id": session.id})
+
+def _session_audio(session):
+    """
+    Adds the request body (same formats as /process-audio/raw) to the session, if
+    there is one. A JSON body carries options such as client_id, not audio.
+    """
+    if request.is_json:
+        return
+    data = request.get_data(cache=False)
+    if not data:
+        return
+    if session.add(decode_audio_body(data, request.content_type)):
+        session.start_catch_up(get_runner())
+
+def _session_id():
+    return request.headers.get('X-Session-Id') or request.args.get('session_id')
+
+@app.route('/session/chunk', methods=['POST'])
+def session_chunk():
+    """
+    Appends an audio chunk to a session (X-Session-Id header or ?session_id=).
+    Full windows are transcribed in the background as they fill up; the response
+    carries the partial transcript stitched so far.
+    """
+    session = sessions.get(_session_id())
+    if session is None:
+        return jsonify({"error": "Unknown or expired session", "error_type": "no_session"}), 404
+    try:
+        _session_audio(session)
+    except AudioFormatError as e:
+        return jsonify({"error": str(e), "error_type": "bad_audio"}), 400
+    return jsonify({"session_id": session.id, "partial": session.transcript,
+                    "windows": session.windows, "buffered_seconds": session.buffered_seconds})
+
+@app.route('/session/finish', methods=['POST'])
+def session_finish():
+    """
+    Ends a session, optionally with a last chunk of audio as the body. Only the audio
+    after the last transcribed window is decoded before the agents run; the response
+    matches /process-audio.
+    """
+    session = sessions.pop(_session_id())
+    if session is None:
+        return jsonify({"error": "Unknown or expired session", "error_type": "no_session"}), 404
+    try:
+        _session_audio(session)
+    except AudioFormatError as e:
+        return jsonify({"error": str(e), "error_type": "bad_audio"}), 400
+
+    return run_pipeline_request(_client_id(), session_pipeline(session))
+
+async def session_pipeline(session):
+    """The /process-audio pipeline for a session whose earlier windows are already transcribed."""
+    with span("pipeline"):
+        timings = {}
+        pipeline_start_time = time.time()
+        settings = get_settings()
+        apply_log_level(settings)
+
+        whisper_start = time.time()
+        with span("whisper"):
+            transcribed_text = await session.finish(settings if settings.get("vad_enabled", True) else None)
+        # Only the tail decoded after release counts toward this dictation's latency
+        timings['whisper'] = round(time.time() - whisper_start, 3)
+        timings['session_windows'] = session.windows
+        timings['session_whisper'] = round(session.whisper_seconds, 3)
+        log.debug(f"Session {session.id} transcript after {session.windows} windows: {transcribed_text}")
+
+        if is_blank_transcription(transcribed_text):
+            return NO_AUDIO_ERROR, 400
+        return await code_from_transcript(transcribed_text, timings, pipeline_start_time)
+
+def generate_for_batch(transcribed_text: str, timings: dict):
+    """
+    Runs the post-transcription pipeline for one batch file on the pipeline loop,
+    as a batch-priority job so interactive dictations get the models first.
+    Called from the batch's LLM threads, which already bound how many run at once.
+    Returns (response_body, status_code).
+    """
+    if is_blank_transcription(transcribed_text):
+        return NO_AUDIO_ERROR, 400
+    pipeline_start_time = time.time() - timings.get('whisper', 0)
+    job = scheduler.create_job("batch", "batch")
+    pipeline = scheduler.run(job, code_from_transcript(transcribed_text, timings, pipeline_start_time))
+    with span("batch"):
+        try:
+            return get_runner().submit(pipeline).result()
+        except JobDeadlineExceeded:
+            return DEADLINE_ERROR, 504
+
+def batch_whisper_slot():
+    """A batch-priority whisper slot for one batch file, so interactive dictations transcribe first."""
+    return scheduler.hold(get_runner().loop, "transcribe", "whisper", Job("batch", "batch"))
+
+@app.route('/process-batch', methods=['POST'])
+def process_batch():
+    """
+    Transcribes and generates code for many recorded files.
+    Takes {"directory": ...} or {"paths": [...]}, plus an optional "output" JSON Lines
+    file that results are appended to and "resume": true to skip files that already
+    succeeded there. Streams one JSON object per file as it finishes, then a summary.
+    All of these paths must lie inside `batch_base_dir`; relative ones start there.
+    """
+    data = request.json or {}
+    paths = data.get('paths') or ([data['directory']] if data.get('directory') else [])
+    if not paths or not isinstance(paths, list):
+        return jsonify({"error": "Provide a directory or a list of paths"}), 400
+
+    settings = get_settings()
+    base_dir = settings.get("batch_base_dir") or batch.DEFAULT_BATCH_DIR
+    try:
+        paths = [batch.resolve_under(base_dir, path) for path in paths]
+        output = batch.resolve_under(base_dir, data['output']) if data.get('output') else None
+    except ValueError as e:
+        return jsonify({"error": str(e), "error_type": "bad_path"}), 400
+
+    files = batch.collect_audio_files(paths)
+    skip = batch.completed_keys(output) if data.get('resume') else set()
+    records = batch.run_batch(
+        files,
+        generate_for_batch,
+        workers=settings.get("batch_workers", 0),
+        llm_concurrency=settings.get("batch_llm_concurrency", 2),
+        skip=skip,
+        slot=batch_whisper_slot
+    )
+    registry.inc("voice2code_requests_total", endpoint=request.path, status=200)
+    lines = (json.dumps(item) + "\n" for item in batch.write_jsonl(records, output))
+    return Response(lines, mimetype='application/x-ndjson')
+
+@app.route('/health', methods=['GET'])
+def health():
+    """
+    Liveness: the backend is up and answering, warm or not. Also reports each
+    Ollama endpoint's circuit breaker and load; "state" is "open" when none is
+    reachable, so the HUD can show that dictations will return the transcript only.
+    """
+    return jsonify({"status": "ok", "uptime": warmup.status()["uptime"],
+                    "ollama": router.status(get_settings())})
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """
+    Readiness: 200 once the startup warm-up has finished (models loaded, whisper
+    paged in), 503 before that. The body lists each warm-up step and its outcome.
+    """
+    status = warmup.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+@app.route('/jobs', methods=['GET'])
+def jobs():
+    """The jobs still queued or running, and each scheduled resource's slots and queue."""
+    return jsonify({"jobs": [job.to_dict() for job in scheduler.active()], "resources": scheduler.resources()})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """
+    Status of a job: its stage and per-stage wait and run times, and once done the
+    dictation's response and status code. Finished jobs are kept for a while.
+    """
+    job = scheduler.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job", "error_type": "no_job"}), 404
+    return jsonify(job.to_dict())
 
-    return jsonify({"code": final_code, "timings": timings})
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Per-stage latency percentiles and Ollama token statistics in Prometheus text format."""
+    runner = _runner
+    registry.set_gauge("voice2code_pipeline_pending", runner.pending if runner is not None else 0)
+    return Response(registry.render_prometheus(), mimetype='text/plain; version=0.0.4')
 
 
 if __name__ == '__main__':
-    app.run(host='127.0.0.1', port=5001)
+    apply_log_level(get_settings())
+    # Load the whisper model once, before the first dictation arrives
+    start_engine()
+    # Starts indexing the configured workspace so its snippets are ready for the first dictation
+    workspace.get(get_settings())
+    # Loads the Ollama models and pages in whisper while Flask already answers /health
+    warmup.start()
+    app.run(host='127.0.0.1', port=5001, threaded=True)
@@ -0,0 +1,118 @@
+import io
+import wave
+
+import numpy as np
+
+SAMPLE_RATE = 16000  # whisper.cpp expects 16 kHz mono
+
+RAW_PCM_TYPES = ("audio/l16", "audio/pcm", "application/octet-stream")
+WAV_TYPES = ("audio/wav", "audio/x-wav", "audio/wave", "audio/vnd.wave")
+
+
+class AudioFormatError(ValueError):
+    """Raised when an uploaded audio body cannot be decoded."""
+
+
+def _content_type_params(content_type: str):
+    """Splits 'audio/L16; rate=16000; channels=1' into ('audio/l16', {'rate': '16000', ...})."""
+    parts = [p.strip() for p in (content_type or "").split(";")]
+    params = {}
+    for part in parts[1:]:
+        if "=" in part:
+            key, value = part.split("=", 1)
+            params[key.strip().lower()] = value.strip()
+    return parts[0].lower(), params
+
+
+def to_mono(samples: np.ndarray, channels: int) -> np.ndarray:
+    """Averages interleaved channels down to one."""
+    if channels <= 1:
+        return samples
+    frames = len(samples) // channels
+    return samples[:frames * channels].reshape(frames, channels).mean(axis=1, dtype=np.float32)
+
+
+def resample(samples: np.ndarray, rate: int, target_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Linear-interpolation resampling; good enough for speech going into whisper."""
+    if rate == target_rate or len(samples) == 0:
+        return samples
+    duration = len(samples) / rate
+    target_length = max(1, int(round(duration * target_rate)))
+    positions = np.linspace(0, len(samples) - 1, target_length, dtype=np.float64)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def pcm16_to_float(data: bytes) -> np.ndarray:
+    """Converts little-endian 16-bit PCM to float32 samples in [-1, 1)."""
+    usable = len(data) - len(data) % 2
+    return np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768.0
+
+
+def decode_wav(data: bytes) -> np.ndarray:
+    """Decodes a PCM WAV file of any rate and channel count to 16 kHz mono float32."""
+    try:
+        with wave.open(io.BytesIO(data), "rb") as w:
+            channels = w.getnchannels()
+            width = w.getsampwidth()
+            rate = w.getframerate()
+            frames = w.readframes(w.getnframes())
+    except (wave.Error, EOFError) as e:
+        raise AudioFormatError(f"Invalid WAV data: {e}")
+    if rate <= 0 or channels < 1:
+        raise AudioFormatError(f"Invalid WAV header: {rate} Hz, {channels} channels")
+
+    if width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128) / 128.0
+    elif width == 2:
+        samples = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768.0
+    elif width == 3:
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3)
+        ints = (raw[:, 0].astype(np.int32) | (raw[:, 1].astype(np.int32) << 8) | (raw[:, 2].astype(np.int32) << 16))
+        ints = np.where(ints >= 1 << 23, ints - (1 << 24), ints)
+        samples = ints.astype(np.float32) / float(1 << 23)
+    elif width == 4:
+        samples = np.frombuffer(frames, dtype="<i4").astype(np.float32) / float(1 << 31)
+    else:
+        raise AudioFormatError(f"Unsupported WAV sample width: {width} bytes")
+
+    return resample(to_mono(samples, channels), rate)
+
+
+def decode_audio_body(data: bytes, content_type: str) -> np.ndarray:
+    """
+    Decodes an uploaded request body to 16 kHz mono float32 samples.
+    Raw PCM (audio/L16 and friends) must be 16-bit little-endian; its rate and
+    channel count come from the content-type parameters and default to 16 kHz mono.
+    Anything starting with a RIFF header is treated as WAV.
+    """
+    mime, params = _content_type_params(content_type)
+    if mime in WAV_TYPES or data[:4] == b"RIFF":
+        return decode_wav(data)
+    if mime in RAW_PCM_TYPES or not mime:
+        try:
+            rate = int(params.get("rate", SAMPLE_RATE))
+            channels = int(params.get("channels", 1))
+        except ValueError:
+            raise AudioFormatError(f"Invalid raw PCM parameters in '{content_type}'")
+        if rate <= 0 or channels < 1:
+            raise AudioFormatError(f"Invalid raw PCM rate or channel count in '{content_type}'")
+        return resample(to_mono(pcm16_to_float(data), channels), rate)
+    raise AudioFormatError(f"Unsupported audio content type '{mime}'")
+
+
+def encode_wav(samples: np.ndarray, rate: int = SAMPLE_RATE) -> bytes:
+    """Encodes float32 samples as an in-memory 16-bit mono WAV file."""
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def read_wav_file(path: str) -> np.ndarray:
+    """Reads a WAV file from disk into 16 kHz mono float32 samples."""
+    with open(path, "rb") as f:
+        return decode_wav(f.read())
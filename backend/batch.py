@@ -0,0 +1,216 @@
+"""
+Batch transcription and code generation for recorded dictations.
+
+Transcribes a directory or list of audio files across a process pool sized to
+the available cores and feeds each transcript, as soon as it is ready, to a
+bounded number of concurrent LLM pipelines. Results come out one JSON object
+per file as they finish, and an output file of earlier results lets a batch
+resume where it stopped.
+
+Usage: python batch.py DIR_OR_FILE [...] [--output results.jsonl] [--resume]
+           [--workers N] [--llm-concurrency N]
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from audio_io import AudioFormatError, read_wav_file
+from config import get_settings
+from vad import detect_speech
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".ogg")
+DEFAULT_BATCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings")
+
+
+def resolve_under(base_dir: str, path: str) -> str:
+    """
+    Resolves a path from a /process-batch request against `base_dir`, relative
+    paths included. Raises ValueError if it leads outside `base_dir`, through
+    ".." or a symlink.
+    """
+    if not isinstance(path, str) or not path:
+        raise ValueError("Paths must be non-empty strings")
+    base = os.path.realpath(base_dir)
+    resolved = os.path.abspath(os.path.join(base_dir, path))
+    if os.path.commonpath([base, os.path.realpath(resolved)]) != base:
+        raise ValueError(f"'{path}' is outside the batch directory")
+    return resolved
+
+
+def collect_audio_files(paths) -> list:
+    """Expands directories (non-recursively) into their audio files, sorted by name."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                if name.lower().endswith(AUDIO_EXTENSIONS)))
+        else:
+            files.append(path)
+    return files
+
+
+def file_key(path: str) -> str:
+    """Identifies a recording for resuming: a file that changed since its result was written is redone."""
+    try:
+        return f"{os.path.abspath(path)}:{os.stat(path).st_mtime_ns}"
+    except OSError:
+        return os.path.abspath(path)
+
+
+def completed_keys(output_path: str) -> set:
+    """Reads the keys of files that already have a successful result in a JSON Lines file."""
+    done = set()
+    if not output_path or not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # A line cut short when the previous run was interrupted
+            if record.get("status") == 200 and record.get("key"):
+                done.add(record["key"])
+    return done
+
+
+def transcribe_file(path: str) -> dict:
+    """
+    Runs in a pool process: decodes and VAD-trims a WAV file, then transcribes it
+    with whisper-cli. Other formats, and WAV files that fail to decode, go to
+    whisper-cli as files. Returns {"text", "whisper"} or {"error"}.
+    """
+    from whisper_wrapper import transcribe, transcribe_pcm
+
+    settings = get_settings()
+    start = time.time()
+    samples = None
+    if path.lower().endswith(".wav"):
+        try:
+            samples = read_wav_file(path)
+        except (OSError, AudioFormatError) as e:
+            logging.warning(f"Could not decode '{path}', transcribing it as is: {e}")
+
+    if samples is not None and settings.get("vad_enabled", True):
+        speech = detect_speech(samples, settings)
+        if speech.silent:
+            return {"text": "", "whisper": round(time.time() - start, 3)}
+        samples = samples[speech.start:speech.end]
+
+    if not os.path.exists(path):
+        return {"error": f"File not found: {path}"}
+    text = transcribe_pcm(samples) if samples is not None else transcribe(path)
+    return {"text": text, "whisper": round(time.time() - start, 3)}
+
+
+def run_batch(files, generate, workers: int = None, llm_concurrency: int = 2, skip=frozenset(),
+              slot=contextlib.nullcontext):
+    """
+    Yields one result dict per file as it finishes, then a final {"summary": ...}.
+
+    `generate(transcript, timings)` turns a transcript into (body, status) and is
+    called from at most `llm_concurrency` threads at once. Transcription of the
+    remaining files keeps going in `workers` processes while the LLM calls run,
+    each file holding `slot()` (a batch-priority whisper slot in the backend)
+    while its process transcribes it. Files whose key is in `skip` are not
+    processed again.
+    """
+    start = time.time()
+    counts = {"ok": 0, "failed": 0, "skipped": 0}
+    pending = []
+    for path in files:
+        key = file_key(path)
+        if key in skip:
+            counts["skipped"] += 1
+        else:
+            pending.append((path, key))
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(pending) or 1))
+
+    def record(path, key, body, status):
+        counts["ok" if status == 200 else "failed"] += 1
+        return {"path": path, "key": key, "status": status, **body}
+
+    def llm_job(path, key, transcript, timings):
+        try:
+            body, status = generate(transcript, timings)
+        except Exception as e:
+            logging.exception(f"Batch code generation failed for '{path}'")
+            body, status = {"error": str(e)}, 500
+        return record(path, key, {"transcript": transcript, **body}, status)
+
+    with ProcessPoolExecutor(max_workers=workers) as processes, \
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-whisper") as gates, \
+            ThreadPoolExecutor(max_workers=max(1, llm_concurrency)) as threads:
+
+        def transcribe_in_slot(path):
+            with slot():
+                return processes.submit(transcribe_file, path).result()
+
+        transcribing = {gates.submit(transcribe_in_slot, path): (path, key) for path, key in pending}
+        generating = set()
+        while transcribing or generating:
+            finished, _ = wait(set(transcribing) | generating, return_when=FIRST_COMPLETED)
+            for future in finished:
+                if future in generating:
+                    generating.discard(future)
+                    yield future.result()
+                    continue
+
+                path, key = transcribing.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"error": f"Transcription failed: {e}"}
+                if "error" in result:
+                    yield record(path, key, {"error": result["error"]}, 500)
+                    continue
+                timings = {"whisper": result["whisper"]}
+                generating.add(threads.submit(llm_job, path, key, result["text"], timings))
+
+    yield {"summary": {**counts, "files": len(files), "workers": workers,
+                       "llm_concurrency": llm_concurrency, "seconds": round(time.time() - start, 3)}}
+
+
+def write_jsonl(records, output_path: str = None):
+    """Passes records through, appending each one to `output_path` as it arrives."""
+    if not output_path:
+        yield from records
+        return
+    with open(output_path, "a", encoding="utf-8") as f:
+        for item in records:
+            f.write(json.dumps(item) + "\n")
+            f.flush()
+            yield item
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transcribe recorded dictations and generate their code.")
+    parser.add_argument("paths", nargs="+", help="Audio files or directories of recordings")
+    parser.add_argument("--output", help="Append results to this JSON Lines file")
+    parser.add_argument("--resume", action="store_true", help="Skip files that already succeeded in --output")
+    parser.add_argument("--workers", type=int, help="Transcription processes (default: from settings, or one per core)")
+    parser.add_argument("--llm-concurrency", type=int, help="Concurrent LLM pipelines (default: from settings)")
+    args = parser.parse_args()
+
+    import app
+
+    settings = get_settings()
+    skip = completed_keys(args.output) if args.resume else set()
+    records = run_batch(
+        collect_audio_files(args.paths),
+        app.generate_for_batch,
+        workers=args.workers or settings.get("batch_workers", 0),
+        llm_concurrency=args.llm_concurrency or settings.get("batch_llm_concurrency", 2),
+        skip=skip,
+        slot=app.batch_whisper_slot
+    )
+    for item in write_jsonl(records, args.output):
+        print(json.dumps(item), flush=True)
+    app.get_runner().stop()
+    sys.exit(0)
@@ -0,0 +1,91 @@
+"""
+Throughput benchmark for the code extractor
+
+Builds a large LLM answer (a reasoning block, a lead-in sentence, a bash block
+and then `size` characters of Python in a fenced block) and extracts the code
+from it twice: fed all at once, and fed in token-sized chunks the way
+/process-audio/stream receives it. Prints MB/s for both and the peak memory of
+the one-shot run relative to the answer's size.
+
+Usage: python benchmarks/bench_code_extractor.py [size_in_chars]
+"""
+
+import sys
+import os
+import random
+import time
+import tracemalloc
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from code_extractor import CodeExtractor, extract_code
+
+CODE_LINES = ["def handler(event, context):", "    items = [x * 2 for x in event['values']]",
+              "    return {'status': 200, 'body': sum(items)}", "", "class Account:",
+              "    def deposit(self, amount):", "        self.balance += amount"]
+
+
+def make_answer(size: int, seed: int = 0):
+    """Returns (answer, expected code)."""
+    rng = random.Random(seed)
+    lines, length = [], 0
+    while length < size:
+        line = rng.choice(CODE_LINES)
+        lines.append(line)
+        length += len(line) + 1
+    code = "\n".join(lines).strip()
+    answer = (f"<think>\n{'The user wants a handler. ' * 40}\n</think>\n\nHere is the code:\n"
+              f"```bash\npip install boto3\n```\n```python\n{code}\n```\nLet me know if this helps!")
+    return answer, code
+
+
+def _streamed(answer: str, chunk: int) -> str:
+    extractor = CodeExtractor("python")
+    parts = [extractor.feed(answer[i:i + chunk]) for i in range(0, len(answer), chunk)]
+    parts.append(extractor.finish())
+    return "".join(parts)
+
+
+def _best_seconds(call, repeats: int) -> float:
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        call()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(size: int = 2_000_000, repeats: int = 3, chunk: int = 8) -> dict:
+    answer, code = make_answer(size)
+    assert extract_code(answer, "python") == code
+    assert _streamed(answer, chunk) == code
+
+    one_shot = _best_seconds(lambda: extract_code(answer, "python"), repeats)
+    streamed = _best_seconds(lambda: _streamed(answer, chunk), repeats)
+
+    tracemalloc.start()
+    extract_code(answer, "python")
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    megabytes = len(answer) / 1e6
+    return {
+        "answer_chars": len(answer),
+        "chunk_chars": chunk,
+        "mb_per_s": {"one_shot": round(megabytes / one_shot, 1), "streamed": round(megabytes / streamed, 1)},
+        "peak_memory_ratio": round(peak / len(answer), 2)
+    }
+
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    result = run(size)
+    print("=" * 70)
+    print("CODE EXTRACTOR THROUGHPUT")
+    print("=" * 70)
+    print(f"Answer size:               {result['answer_chars']} chars")
+    print(f"One-shot:                  {result['mb_per_s']['one_shot']} MB/s")
+    print(f"Streamed ({result['chunk_chars']}-char chunks):  {result['mb_per_s']['streamed']} MB/s")
+    print(f"Peak memory (one-shot):    {result['peak_memory_ratio']}x the answer")
@@ -0,0 +1,42 @@
+"""
+Fused single-call mode versus the two-agent pipeline
+
+Runs benchmarks/bench_pipeline.py twice over the same corpus and stub Ollama
+latencies, once with pipeline_mode "two_agent" and once with "fused", and
+prints throughput, latency and Ollama request counts side by side. The stub's
+per-request delay stands in for prompt processing, which the fused mode pays
+once per dictation instead of twice.
+
+Usage: python benchmarks/bench_fused.py [dictations] [request_delay]
+"""
+
+import sys
+import os
+
+# Add the benchmarks directory to the path
+sys.path.insert(0, os.path.dirname(__file__))
+
+import bench_pipeline
+
+
+def run(dictations: int = 24, request_delay: float = 0.05) -> dict:
+    return {mode: bench_pipeline.run(dictations, request_delay=request_delay, settings={"pipeline_mode": mode})
+            for mode in ("two_agent", "fused")}
+
+
+if __name__ == "__main__":
+    dictations = int(sys.argv[1]) if len(sys.argv) > 1 else 24
+    request_delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    results = run(dictations, request_delay)
+    print("=" * 70)
+    print("FUSED VS TWO-AGENT BENCHMARK")
+    print("=" * 70)
+    print(f"{'':<22}{'two_agent':>14}{'fused':>14}")
+    two, fused = results["two_agent"], results["fused"]
+    for label, get in (("dictations/s", lambda r: r["throughput_per_s"]),
+                       ("p50 ms", lambda r: r["latency"]["p50_ms"]),
+                       ("p95 ms", lambda r: r["latency"]["p95_ms"]),
+                       ("Ollama requests", lambda r: r["ollama"]["requests"]),
+                       ("generated tokens", lambda r: r["ollama"]["eval_tokens"])):
+        print(f"{label:<22}{get(two):>14}{get(fused):>14}")
+    print("=" * 70)
@@ -0,0 +1,62 @@
+"""
+Micro-benchmark for the shared LLM client
+
+Sends the same generate request to a local stub Ollama server, once with a
+bare requests.post per call (the old behaviour) and once through the pooled
+keep-alive session in llm_client, and prints the per-request overhead saved.
+
+Usage: python benchmarks/bench_llm_client.py [requests]
+"""
+
+import sys
+import os
+import time
+
+import requests
+
+# Add the backend and tests directories to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'tests'))
+
+import llm_client
+from stub_ollama import StubOllama
+
+
+def _time_calls(call, count: int) -> float:
+    """Returns the mean seconds per call."""
+    call()  # Warm-up, not measured
+    start = time.perf_counter()
+    for _ in range(count):
+        call()
+    return (time.perf_counter() - start) / count
+
+
+def run(count: int = 200) -> dict:
+    payload = {"model": "stub", "prompt": "print hello", "stream": False}
+    with StubOllama(["print('hello')"]) as stub:
+        bare = _time_calls(lambda: requests.post(stub.url, json=payload, timeout=30).json(), count)
+        pooled = _time_calls(lambda: llm_client.generate(stub.url, payload, timeout=30, agent="bench"), count)
+        connections = len(set(stub.peers[-count:]))
+    llm_client.close_session()
+
+    return {
+        "requests": count,
+        "bare_ms": round(bare * 1000, 3),
+        "pooled_ms": round(pooled * 1000, 3),
+        "saved_ms": round((bare - pooled) * 1000, 3),
+        "pooled_connections": connections
+    }
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    result = run(count)
+    print("=" * 70)
+    print("LLM CLIENT MICRO-BENCHMARK")
+    print("=" * 70)
+    print(f"Requests per variant:      {result['requests']}")
+    print(f"Bare requests.post:        {result['bare_ms']} ms/request")
+    print(f"Pooled session:            {result['pooled_ms']} ms/request")
+    print(f"Overhead saved:            {result['saved_ms']} ms/request")
+    print(f"Connections used (pooled): {result['pooled_connections']}")
+    print("=" * 70)
@@ -0,0 +1,328 @@
+"""
+End-to-end benchmark for the voice-to-code pipeline
+
+Drives /process-audio (or /process-audio/raw) through the Flask test client
+with a corpus of WAV clips, the fake whisper-cli from tests/ in place of
+whisper.cpp, and a stub Ollama server that sleeps per request and per generated
+token. Needs no GPU, models or network, so it can gate changes to
+whisper_wrapper, prompt_optimizer and ollama_wrapper on CI.
+
+Reports throughput, end-to-end and per-stage p50/p95 latency (from the spans
+behind /metrics), Ollama token counts and memory high-water marks, and can
+write them as JSON. With --baseline, exits with status 1 if throughput or any
+stage's p95 regressed by more than --tolerance.
+
+Usage: python benchmarks/bench_pipeline.py [--dictations N] [--concurrency C]
+           [--corpus DIR] [--endpoint raw|path] [--token-delay S] [--request-delay S] [--prompt-delay S] [--whisper-delay S]
+           [--trace-memory] [--set KEY=JSON ...] [--json FILE] [--baseline FILE] [--tolerance F]
+
+--set overrides a settings.json key for the run, e.g. --set speculative_coder_enabled=true.
+The response and transcript caches are off by default; --set transcript_cache_enabled=true
+shows repeated clips skipping whisper in the pipeline/whisper stage.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Add the backend and tests directories to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'tests'))
+
+import app as backend
+import config
+import llm_client
+import transcript_cache
+import whisper_wrapper
+from metrics import RollingHistogram, STAGE_SECONDS, registry
+from stub_ollama import StubOllama
+
+FAKE_WHISPER_CLI = os.path.join(os.path.dirname(__file__), '..', 'tests', 'fake_whisper_cli.py')
+
+# Clear instructions skip Agent 1; hedged ones exercise both agents
+TRANSCRIPTS = [
+    "create a function that adds two numbers",
+    "sort the list in reverse order",
+    "um so I think maybe we need something like a class for a bank account or something",
+    "write a loop that prints the numbers from one to ten",
+    "okay so basically, uh, I guess a function that checks if a word is a palindrome, no wait, a sentence",
+    "define a variable called total and set it to zero",
+]
+
+# Streamed back by the stub Ollama server, one token per sleep
+CODE_TOKENS = ["```python\n", "def", " add", "(a,", " b):", "\n   ", " return", " a", " +", " b", "\n```"]
+
+
+def make_corpus(directory: str, count: int = 6, seed: int = 0) -> list:
+    """
+    Writes `count` synthetic dictation clips to `directory` and returns their paths.
+    Each clip is a voiced, syllable-modulated harmonic signal between stretches of
+    low background noise, at a mix of sample rates and channel counts so decoding,
+    resampling and VAD all do real work. Clip i has a fundamental of 100 + 20*i Hz,
+    which is how the fake whisper-cli tells the clips apart.
+    """
+    rng = np.random.default_rng(seed)
+    formats = [(16000, 1), (44100, 1), (48000, 2)]
+    paths = []
+    for i in range(count):
+        rate, channels = formats[i % len(formats)]
+        lead, speech, tail = rng.uniform(0.2, 0.8), rng.uniform(1.0, 3.0), rng.uniform(0.2, 0.8)
+        t = np.arange(int(rate * speech)) / rate
+        f0 = 100 + 20 * i
+        voiced = sum(np.sin(2 * np.pi * f0 * h * t) / h for h in range(1, 6))
+        syllables = 0.5 * (1 + np.sin(2 * np.pi * rng.uniform(3, 5) * t)) ** 2
+        signal = np.concatenate([np.zeros(int(rate * lead)), 0.3 * voiced * syllables, np.zeros(int(rate * tail))])
+        signal += rng.normal(0, 0.002, len(signal))
+        pcm = (np.clip(signal, -1, 1) * 32767).astype("<i2")
+        if channels > 1:
+            pcm = np.repeat(pcm, channels)
+
+        path = os.path.join(directory, f"dictation_{i:02d}.wav")
+        with wave.open(path, "wb") as w:
+            w.setnchannels(channels)
+            w.setsampwidth(2)
+            w.setframerate(rate)
+            w.writeframes(pcm.tobytes())
+        paths.append(path)
+    return paths
+
+
+@contextmanager
+def offline_backend(ollama_url: str, concurrency: int, whisper_delay: float, overrides: dict = None):
+    """
+    Points the backend at the stubs for the duration of the block: settings come from
+    a temporary config dir (the real settings with the endpoint and whisper-cli
+    command swapped), and the pipeline runner is rebuilt to match `concurrency`.
+    """
+    values = config.read_files()
+    values.update({
+        "ollama_endpoint": ollama_url,
+        "whisper_engine_enabled": False,
+        "whisper_cli_command": [sys.executable, FAKE_WHISPER_CLI],
+        "response_cache_enabled": False,
+        "transcript_cache_enabled": False,
+        "pipeline_max_concurrent": concurrency,
+        "pipeline_max_pending": max(8, concurrency * 2),
+        "log_level": "WARNING",
+    })
+    values.update(overrides or {})
+    values.pop("paths", None)
+
+    saved = (backend._runner, os.environ.get("FAKE_WHISPER_TRANSCRIPTS"), os.environ.get("FAKE_WHISPER_DELAY"))
+    with tempfile.TemporaryDirectory() as config_dir:
+        if not values.get("transcript_cache_path"):
+            values["transcript_cache_path"] = os.path.join(config_dir, "transcripts.sqlite3")
+        with open(os.path.join(config_dir, "paths.json"), "w") as f:
+            json.dump({}, f)
+        with open(os.path.join(config_dir, "settings.json"), "w") as f:
+            json.dump(values, f)
+
+        whisper_wrapper.stop_engine()
+        backend._runner = None
+        os.environ["FAKE_WHISPER_TRANSCRIPTS"] = json.dumps(TRANSCRIPTS)
+        os.environ["FAKE_WHISPER_DELAY"] = str(whisper_delay)
+        try:
+            with config.settings_from(config_dir):
+                yield
+        finally:
+            if backend._runner is not None:
+                backend._runner.stop()
+            backend._runner, transcripts, delay = saved
+            for key, value in (("FAKE_WHISPER_TRANSCRIPTS", transcripts), ("FAKE_WHISPER_DELAY", delay)):
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+            llm_client.close_session()
+            # Releases the temporary transcript cache file before its directory is removed
+            if transcript_cache._cache is not None and transcript_cache._cache.path == values["transcript_cache_path"]:
+                transcript_cache._cache.close()
+                transcript_cache._cache = transcript_cache._cache_options = None
+
+
+def _dictate(client, endpoint: str, clip: str, audio: bytes, client_id: str):
+    """Posts one dictation and returns (status_code, seconds)."""
+    start = time.perf_counter()
+    if endpoint == "raw":
+        response = client.post('/process-audio/raw', data=audio, content_type="audio/wav",
+                               headers={"X-Client-Id": client_id})
+    else:
+        response = client.post('/process-audio', json={"path": clip, "client_id": client_id})
+    return response.status_code, time.perf_counter() - start
+
+
+def _summary(histogram: RollingHistogram) -> dict:
+    p = histogram.percentiles()
+    return {"count": histogram.count, "p50_ms": round(p[0.5] * 1000, 3), "p95_ms": round(p[0.95] * 1000, 3)}
+
+
+def _peak_rss_mb(who) -> float:
+    """Peak resident set size in MB, or None where the resource module is unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    # Reported in KB on Linux and in bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run(dictations: int = 24, concurrency: int = 1, corpus: str = None, endpoint: str = "raw",
+        token_delay: float = 0.005, whisper_delay: float = 0.02, trace_memory: bool = False,
+        settings: dict = None, request_delay: float = 0.0, prompt_delay: float = 0.0) -> dict:
+    stub = StubOllama(CODE_TOKENS, token_delay=token_delay, request_delay=request_delay, prompt_delay=prompt_delay)
+    with tempfile.TemporaryDirectory() as fixtures, stub:
+        if corpus:
+            clips = sorted(os.path.join(corpus, name) for name in os.listdir(corpus) if name.lower().endswith(".wav"))
+        else:
+            clips = make_corpus(fixtures)
+        audio = {}
+        for clip in clips:
+            with open(clip, "rb") as f:
+                audio[clip] = f.read()
+
+        with offline_backend(stub.url, concurrency, whisper_delay, settings):
+            client = backend.app.test_client()
+            _dictate(client, endpoint, clips[0], audio[clips[0]], "warm-up")  # Not measured
+            registry.reset()
+            stub.requests.clear()
+
+            if trace_memory:
+                tracemalloc.start()
+            latency = RollingHistogram(window=max(1, dictations))
+            statuses = {}
+
+            def one(i):
+                clip = clips[i % len(clips)]
+                return _dictate(backend.app.test_client(), endpoint, clip, audio[clip], f"bench-{i}")
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                for status, seconds in pool.map(one, range(dictations)):
+                    latency.observe(seconds)
+                    statuses[status] = statuses.get(status, 0) + 1
+            wall = time.perf_counter() - start
+
+            python_peak = None
+            if trace_memory:
+                python_peak = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+                tracemalloc.stop()
+
+    stages = {labels["stage"]: _summary(h) for labels, h in registry.histograms(STAGE_SECONDS)
+              if labels["stage"].startswith("pipeline")}
+    tokens = sum(h.total for _, h in registry.histograms("voice2code_ollama_eval_tokens"))
+
+    return {
+        "dictations": dictations,
+        "concurrency": concurrency,
+        "endpoint": endpoint,
+        "clips": len(clips),
+        "token_delay": token_delay,
+        "request_delay": request_delay,
+        "prompt_delay": prompt_delay,
+        "whisper_delay": whisper_delay,
+        "settings": settings or {},
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "wall_seconds": round(wall, 3),
+        "throughput_per_s": round(dictations / wall, 3),
+        "latency": _summary(latency),
+        "stages": dict(sorted(stages.items())),
+        "ollama": {"requests": len(stub.requests), "eval_tokens": int(tokens)},
+        "speculation": {result: int(registry.counter("voice2code_speculation_total", result=result))
+                        for result in ("won", "lost")},
+        "transcript_cache": {result: int(registry.counter("voice2code_transcript_cache_total", result=result))
+                             for result in ("hit", "miss")},
+        "memory": {
+            "rss_peak_mb": _peak_rss_mb(resource.RUSAGE_SELF) if resource else None,
+            "child_rss_peak_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else None,
+            "python_peak_mb": python_peak,
+        },
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float = 0.25, slack_ms: float = 2.0) -> list:
+    """
+    Lists regressions against a baseline result: throughput down, or a stage's p95
+    up, by more than `tolerance` (a fraction). `slack_ms` keeps sub-millisecond
+    stages from failing on scheduler noise.
+    """
+    problems = []
+    if result["throughput_per_s"] < baseline["throughput_per_s"] * (1 - tolerance):
+        problems.append(f"throughput {result['throughput_per_s']}/s < baseline {baseline['throughput_per_s']}/s")
+    for stage, before in baseline.get("stages", {}).items():
+        after = result["stages"].get(stage)
+        if after is not None and after["p95_ms"] > before["p95_ms"] * (1 + tolerance) + slack_ms:
+            problems.append(f"{stage} p95 {after['p95_ms']} ms > baseline {before['p95_ms']} ms")
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--dictations", type=int, default=24)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--corpus", help="Directory of .wav recordings (default: synthetic clips)")
+    parser.add_argument("--endpoint", choices=["raw", "path"], default="raw")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="Stub Ollama seconds per token")
+    parser.add_argument("--request-delay", type=float, default=0.0, help="Stub Ollama prompt-processing seconds per request")
+    parser.add_argument("--prompt-delay", type=float, default=0.0, help="Stub Ollama seconds per 1000 prompt characters")
+    parser.add_argument("--whisper-delay", type=float, default=0.02, help="Fake whisper-cli seconds per clip")
+    parser.add_argument("--trace-memory", action="store_true", help="Also track the Python heap peak (slower)")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=JSON",
+                        help="Override a setting for the run (repeatable)")
+    parser.add_argument("--json", help="Write the result as JSON to this file ('-' for stdout)")
+    parser.add_argument("--baseline", help="JSON result to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    overrides = {}
+    for item in args.set:
+        key, _, value = item.partition("=")
+        overrides[key] = json.loads(value)
+
+    result = run(args.dictations, args.concurrency, args.corpus, args.endpoint,
+                 args.token_delay, args.whisper_delay, args.trace_memory, overrides, args.request_delay,
+                 args.prompt_delay)
+
+    if args.json == "-":
+        print(json.dumps(result, indent=2))
+    else:
+        print("=" * 70)
+        print("VOICE2CODE PIPELINE BENCHMARK")
+        print("=" * 70)
+        print(f"Dictations:     {result['dictations']} ({result['clips']} clips, concurrency {result['concurrency']}, /{result['endpoint']})")
+        print(f"Status codes:   {result['statuses']}")
+        print(f"Throughput:     {result['throughput_per_s']} dictations/s")
+        print(f"End to end:     p50 {result['latency']['p50_ms']} ms, p95 {result['latency']['p95_ms']} ms")
+        print("-" * 70)
+        for stage, summary in result["stages"].items():
+            print(f"  {stage:<32} p50 {summary['p50_ms']:>9} ms   p95 {summary['p95_ms']:>9} ms   n={summary['count']}")
+        print("-" * 70)
+        print(f"Ollama:         {result['ollama']['requests']} requests, {result['ollama']['eval_tokens']} tokens")
+        if any(result["speculation"].values()):
+            print(f"Speculation:    {result['speculation']['won']} won, {result['speculation']['lost']} lost")
+        if any(result["transcript_cache"].values()):
+            print(f"Transcripts:    {result['transcript_cache']['hit']} cached, {result['transcript_cache']['miss']} from whisper")
+        print(f"Memory:         {result['memory']}")
+        print("=" * 70)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for problem in regressions:
+            print(f"REGRESSION: {problem}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
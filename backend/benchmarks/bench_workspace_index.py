@@ -0,0 +1,158 @@
+"""
+Lookup latency benchmark for the workspace snippet index
+
+Writes a synthetic project of `files` Python modules (100,000 by default) whose
+identifiers are drawn from a Zipf-distributed vocabulary, so a few names are
+everywhere and most are rare, like in a real code base. It indexes the project
+once, reopens the index from disk the way a restarted backend does, and then
+times search() and snippets() for dictation-like queries. Prints the build time,
+the segment size and the p50/p95/max lookup times against the 10 ms target.
+
+Usage: python benchmarks/bench_workspace_index.py [files] [--keep DIR]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from workspace_index import WorkspaceIndex
+
+TARGET_MS = 10
+WORDS = ["user", "account", "invoice", "order", "payment", "customer", "session", "token", "cache", "queue",
+         "report", "price", "tax", "email", "address", "product", "cart", "refund", "audit", "event",
+         "config", "metric", "record", "batch", "upload", "image", "thumbnail", "schedule", "retry", "limit"]
+VERBS = ["get", "load", "save", "update", "delete", "compute", "render", "send", "parse", "validate",
+         "find", "build", "merge", "export", "import", "sync", "apply", "check", "format", "resolve"]
+QUERIES = [
+    "get the user by id from the account repository",
+    "compute the tax for an invoice and update the order total",
+    "send a payment refund email to the customer",
+    "validate the session token before the upload",
+    "render a thumbnail for the product image",
+    "retry the batch export when the queue limit is reached",
+    "resolve the customer address and save the record",
+    "format the audit event for the metric report",
+]
+
+
+def vocabulary(size: int, rng: random.Random) -> list:
+    """snake_case and camelCase identifiers built from the words above."""
+    names = set()
+    while len(names) < size:
+        verb, first, second = rng.choice(VERBS), rng.choice(WORDS), rng.choice(WORDS)
+        suffix = str(rng.randrange(1000)) if rng.random() < 0.5 else ""
+        names.add(f"{verb}_{first}_{second}{suffix}" if rng.random() < 0.5
+                  else f"{verb}{first.title()}{second.title()}{suffix}")
+    return sorted(names)
+
+
+def make_project(root: str, files: int, seed: int = 0, functions: int = 4):
+    """Writes `files` modules of `functions` small functions each, spread over nested packages."""
+    rng = random.Random(seed)
+    names = vocabulary(max(1000, files // 2), rng)
+    # Zipf weights: the k-th most common identifier appears about 1/k as often as the first
+    weights = np.cumsum(1 / np.arange(1, len(names) + 1))
+    weights /= weights[-1]
+
+    def pick(count):
+        return [names[i] for i in np.searchsorted(weights, [rng.random() for _ in range(count)])]
+
+    for number in range(files):
+        directory = os.path.join(root, f"pkg{number % 100}", f"mod{number // 100 % 100}")
+        os.makedirs(directory, exist_ok=True)
+        body = []
+        for _ in range(functions):
+            name, first, second, third = pick(4)
+            body.append(f"def {name}({first}, {second}):\n    result = {third}({first})\n"
+                        f"    if result is None:\n        return {second}\n    return result\n")
+        with open(os.path.join(directory, f"file{number}.py"), "w") as f:
+            f.write("\n\n".join(body))
+
+
+def _directory_bytes(path: str) -> int:
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def _percentile(values: list, q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def run(files: int = 100_000, repeats: int = 20, workdir: str = None) -> dict:
+    owned = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix="voice2code-workspace-bench-")
+    root, index_dir = os.path.join(workdir, "project"), os.path.join(workdir, "index")
+    try:
+        if not os.path.isdir(root):
+            start = time.perf_counter()
+            make_project(root, files)
+            generate_seconds = time.perf_counter() - start
+        else:
+            generate_seconds = 0.0
+
+        start = time.perf_counter()
+        WorkspaceIndex(root, index_dir).refresh()
+        build_seconds = time.perf_counter() - start
+
+        # Lookups run against the index as reloaded from disk, memory-mapped
+        index = WorkspaceIndex(root, index_dir)
+        segment = index._segment
+        for query in QUERIES:
+            index.search(query)  # Page in the parts of the segment the queries touch
+
+        search_ms, snippets_ms, hits = [], [], []
+        for _ in range(repeats):
+            for query in QUERIES:
+                start = time.perf_counter()
+                hits.append(len(index.search(query, limit=9)))
+                search_ms.append((time.perf_counter() - start) * 1000)
+                start = time.perf_counter()
+                index.snippets(query, token_budget=300)
+                snippets_ms.append((time.perf_counter() - start) * 1000)
+
+        return {
+            "files": files,
+            "snippets": len(segment),
+            "postings": len(segment.postings),
+            "hits_per_query": round(sum(hits) / len(hits), 1),
+            "segment_mb": round(_directory_bytes(os.path.join(index_dir, index._segment_name)) / 1e6, 1),
+            "generate_seconds": round(generate_seconds, 1),
+            "build_seconds": round(build_seconds, 1),
+            "search_ms": {"p50": round(_percentile(search_ms, 50), 2), "p95": round(_percentile(search_ms, 95), 2),
+                          "max": round(max(search_ms), 2)},
+            "snippets_ms": {"p50": round(_percentile(snippets_ms, 50), 2),
+                            "p95": round(_percentile(snippets_ms, 95), 2), "max": round(max(snippets_ms), 2)},
+        }
+    finally:
+        if owned:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("files", nargs="?", type=int, default=100_000)
+    parser.add_argument("--keep", metavar="DIR", help="Generate the project and index here and keep them for reruns")
+    args = parser.parse_args()
+    if args.keep:
+        os.makedirs(args.keep, exist_ok=True)
+    result = run(args.files, workdir=args.keep)
+    print("=" * 70)
+    print("WORKSPACE INDEX LOOKUP")
+    print("=" * 70)
+    print(f"Project:                   {result['files']} files, {result['snippets']} snippets, "
+          f"{result['postings']} postings")
+    print(f"Results per query:         {result['hits_per_query']}")
+    print(f"Generated / indexed in:    {result['generate_seconds']}s / {result['build_seconds']}s "
+          f"(segment {result['segment_mb']} MB)")
+    for name in ("search", "snippets"):
+        timing = result[f"{name}_ms"]
+        verdict = "ok" if timing["p95"] <= TARGET_MS else f"over the {TARGET_MS} ms target"
+        print(f"{name + '()':<27}p50 {timing['p50']} ms, p95 {timing['p95']} ms, max {timing['max']} ms ({verdict})")
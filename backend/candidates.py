@@ -0,0 +1,167 @@
+import ast
+import concurrent.futures
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import threading
+
+from code_extractor import extract_code, normalize_language
+from metrics import registry
+from ollama_wrapper import get_raw_code_cancellable
+
+log = logging.getLogger("voice2code.candidates")
+
+CHECK_TIMEOUT = 2.0  # Seconds an external syntax checker may take
+
+
+def check_python(code: str):
+    """
+    Parses the code without running it. ast.parse rather than compile(), which also
+    rejects fragments like a bare `return` that are fine once typed into a function.
+    """
+    try:
+        ast.parse(code)
+    except SyntaxError as e:
+        return f"line {e.lineno}: {e.msg}"
+    except ValueError as e:
+        # Null bytes in the source
+        return str(e)
+    return None
+
+
+def check_json(code: str):
+    try:
+        json.loads(code)
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+def command_checker(command: list, suffix: str):
+    """
+    A checker that runs a syntax-only command (`node --check`, `bash -n`) on the
+    code written to a temporary file; nonzero exit means invalid. Returns None
+    when the command is not installed, so the language is left unchecked.
+    """
+    if shutil.which(command[0]) is None:
+        return None
+
+    def check(code: str):
+        fd, path = tempfile.mkstemp(suffix=suffix, prefix="voice2code-candidate-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(code)
+            result = subprocess.run(command + [path], capture_output=True, text=True, timeout=CHECK_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            log.debug(f"{command[0]} could not check a candidate, accepting it: {e}")
+            return None
+        finally:
+            os.unlink(path)
+        if result.returncode == 0:
+            return None
+        lines = (result.stderr or result.stdout).replace(path, "<candidate>").strip().splitlines()
+        return lines[0] if lines else f"{command[0]} exited with {result.returncode}"
+
+    return check
+
+
+# language (as normalized by code_extractor) -> checker(code) returning an error message, or None when valid
+CHECKERS = {
+    "python": check_python,
+    "json": check_json,
+}
+for _language, _checker in (("javascript", command_checker(["node", "--check"], ".js")),
+                            ("bash", command_checker(["bash", "-n"], ".sh"))):
+    if _checker is not None:
+        CHECKERS[_language] = _checker
+
+
+def register_checker(language: str, checker):
+    """Validates candidates for `language` with checker(code), which returns an error message or None."""
+    CHECKERS[normalize_language(language)] = checker
+
+
+def sampling_options(settings, count: int, seed: int) -> list:
+    """
+    Seed and temperature per candidate: the first runs at `coder_temperature`, the
+    others step away from it by `coder_candidate_temperature_spread`, alternating
+    above and below (clamped to 0-2), each with its own seed.
+    """
+    base = settings.get("coder_temperature", 0.2)
+    spread = settings.get("coder_candidate_temperature_spread", 0.2)
+    options = []
+    for i in range(count):
+        step = (i + 1) // 2 * (1 if i % 2 else -1)  # 0, +1, -1, +2, -2, ...
+        options.append({"temperature": round(min(2.0, max(0.0, base + step * spread)), 3), "seed": seed + i})
+    return options
+
+
+def _candidate(prompt: str, options: dict, language: str, checker, cancelled: threading.Event):
+    """Generates and validates one candidate. Returns (raw_code, error), raw_code None if cancelled."""
+    raw_code = get_raw_code_cancellable(prompt, cancelled, options)
+    if not raw_code or checker is None:
+        return raw_code, None
+    return raw_code, checker(extract_code(raw_code, language))
+
+
+def generate(prompt: str, settings):
+    """
+    Generates `coder_candidates` answers to the coder prompt at once and returns
+    the first one whose code passes the checker for `language`, cancelling the
+    rest; without a checker the first to finish wins. Each candidate is checked
+    in its own thread as soon as it finishes, so checks overlap the slower
+    generations. When none is valid, the first that finished is returned, like
+    the single-shot path would have.
+
+    Returns (raw_code, report) where report counts the candidates by outcome and
+    names the chosen one.
+    """
+    count = max(1, settings.get("coder_candidates", 1))
+    language = normalize_language(settings.language)
+    checker = CHECKERS.get(language)
+    cancelled = threading.Event()
+    report = {"count": count, "checked": checker is not None, "valid": 0, "invalid": 0, "failed": 0,
+              "cancelled": 0, "chosen": None}
+    fallback = None
+
+    pool = concurrent.futures.ThreadPoolExecutor(count, thread_name_prefix="candidate")
+    futures = {
+        pool.submit(_candidate, prompt, options, language, checker, cancelled): i
+        for i, options in enumerate(sampling_options(settings, count, random.randrange(1 << 31)))
+    }
+    try:
+        for future in concurrent.futures.as_completed(futures):
+            index = futures[future]
+            try:
+                raw_code, error = future.result()
+            except Exception as e:
+                log.warning(f"Candidate {index} failed: {e}")
+                raw_code, error = "", None
+            if not raw_code:
+                report["failed"] += 1
+            elif error is not None:
+                report["invalid"] += 1
+                log.debug(f"Candidate {index} rejected: {error}")
+                if fallback is None:
+                    fallback = (index, raw_code)
+            else:
+                report["valid"] += 1
+                report["chosen"] = index
+                return raw_code, report
+        if fallback is None:
+            return "", report
+        report["chosen"] = fallback[0]
+        return fallback[1], report
+    finally:
+        # Stops the slower generations at their next chunk
+        cancelled.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+        report["cancelled"] = count - report["valid"] - report["invalid"] - report["failed"]
+        for result in ("valid", "invalid", "failed", "cancelled"):
+            if report[result]:
+                registry.inc("voice2code_candidates_total", report[result], result=result)
+        log.debug(f"Candidates: {report}")
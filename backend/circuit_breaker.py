@@ -0,0 +1,160 @@
+import logging
+import threading
+import time
+
+import requests
+
+from config import get_settings
+from metrics import RollingHistogram, registry
+
+log = logging.getLogger("voice2code.ollama")
+
+CLOSED = "closed"
+OPEN = "open"
+
+LATENCY_WINDOW = 50  # Recent requests per model and kind the adaptive timeout is based on
+MIN_SAMPLES = 10  # Below this the configured timeout is used as is
+TIMEOUT_QUANTILE = 0.99
+PROBE_TIMEOUT = 2  # seconds
+
+
+def base_url(endpoint: str) -> str:
+    """The Ollama server part of an API endpoint ("http://host:11434/api/generate" -> "http://host:11434")."""
+    return endpoint.split("/api/", 1)[0].rstrip("/")
+
+
+def is_outage(error: requests.exceptions.RequestException) -> bool:
+    """True for errors that mean the server is down or stuck, not that the request was bad."""
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    response = getattr(error, "response", None)
+    return response is not None and response.status_code >= 500
+
+
+class CircuitBreaker:
+    """
+    Health of one Ollama server, shared by every agent that talks to it.
+
+    After `ollama_breaker_failures` outages in a row (refused connections,
+    timeouts, 5xx) the breaker opens: requests fail at once instead of each
+    one waiting out its timeout and retries, and a background thread probes
+    /api/version every `ollama_breaker_probe_interval` seconds until the
+    server answers, which closes it again.
+
+    It also keeps the recent latencies of successful requests per model and
+    kind ("generate": the whole answer, "stream": the first chunk) and derives
+    the request timeout from them: their 99th percentile times
+    `ollama_timeout_multiplier`, at least `ollama_timeout_min` and at most the
+    configured timeout, so a stuck server is noticed in seconds rather than
+    after the worst-case allowance.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.opened_at = None
+        self.last_error = None
+        self._latency = {}
+        self._lock = threading.Lock()
+        self._prober = None
+
+    def allow(self) -> bool:
+        """False while the breaker is open and requests should fail fast."""
+        return self.state != OPEN or not get_settings().get("ollama_breaker_enabled", True)
+
+    def record_success(self, model: str, kind: str, seconds: float):
+        with self._lock:
+            histogram = self._latency.get((model, kind))
+            if histogram is None:
+                histogram = self._latency[(model, kind)] = RollingHistogram(LATENCY_WINDOW)
+            self.failures = 0
+            if self.state == OPEN:
+                self._close()
+        histogram.observe(seconds)
+
+    def record_failure(self, error):
+        settings = get_settings()
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error)
+            if (self.state == CLOSED and settings.get("ollama_breaker_enabled", True)
+                    and self.failures >= settings.get("ollama_breaker_failures", 3)):
+                self._open(settings.get("ollama_breaker_probe_interval", 5))
+
+    def percentile(self, model: str, kind: str, quantile: float):
+        """A percentile of the recent successful latencies, or None while there are too few."""
+        histogram = self._latency.get((model, kind))
+        if histogram is None or len(histogram) < MIN_SAMPLES:
+            return None
+        return histogram.percentiles((quantile,))[quantile]
+
+    def timeout(self, model: str, kind: str, configured: float) -> float:
+        """The timeout for the next request, adapted to the observed latencies."""
+        settings = get_settings()
+        observed = self.percentile(model, kind, TIMEOUT_QUANTILE)
+        if not settings.get("ollama_adaptive_timeout", True) or observed is None:
+            return configured
+        adaptive = max(observed * settings.get("ollama_timeout_multiplier", 4), settings.get("ollama_timeout_min", 5))
+        return min(configured, round(adaptive, 3))
+
+    def status(self) -> dict:
+        """State for /health and the HUD."""
+        with self._lock:
+            status = {"url": self.url, "state": self.state, "failures": self.failures, "trips": self.trips,
+                      "last_error": self.last_error}
+            if self.opened_at is not None:
+                status["open_seconds"] = round(time.time() - self.opened_at, 1)
+            timeouts = {f"{model}/{kind}": self.timeout(model, kind, float("inf")) for model, kind in self._latency}
+        status["timeouts"] = {name: value for name, value in timeouts.items() if value != float("inf")}
+        return status
+
+    def _open(self, probe_interval: float):
+        self.state = OPEN
+        self.trips += 1
+        self.opened_at = time.time()
+        registry.inc("voice2code_ollama_breaker_trips_total", url=self.url)
+        registry.set_gauge("voice2code_ollama_breaker_open", 1, url=self.url)
+        log.error(f"Ollama at {self.url} is unreachable after {self.failures} failures; failing fast until it answers")
+        self._prober = threading.Thread(target=self._probe, args=(probe_interval,), name="ollama-probe", daemon=True)
+        self._prober.start()
+
+    def _close(self):
+        log.info(f"Ollama at {self.url} is reachable again after {time.time() - self.opened_at:.1f}s")
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        registry.set_gauge("voice2code_ollama_breaker_open", 0, url=self.url)
+
+    def _probe(self, interval: float):
+        while self.state == OPEN:
+            time.sleep(interval)
+            try:
+                requests.get(f"{self.url}/api/version", timeout=PROBE_TIMEOUT).raise_for_status()
+            except requests.exceptions.RequestException as e:
+                self.last_error = str(e)
+                continue
+            with self._lock:
+                if self.state == OPEN:
+                    self._close()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(endpoint: str) -> CircuitBreaker:
+    """The breaker of the Ollama server an endpoint belongs to."""
+    url = base_url(endpoint)
+    with _breakers_lock:
+        breaker = _breakers.get(url)
+        if breaker is None:
+            breaker = _breakers[url] = CircuitBreaker(url)
+        return breaker
+
+
+def reset_breakers():
+    """Forgets every server's breaker state and latencies."""
+    with _breakers_lock:
+        _breakers.clear()
@@ -0,0 +1,257 @@
+import re
+
+FENCE = "```"
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+# Info strings that name the same language as the `language` setting
+LANGUAGE_ALIASES = {
+    "py": "python", "python3": "python", "py3": "python",
+    "js": "javascript", "node": "javascript", "jsx": "javascript",
+    "ts": "typescript", "tsx": "typescript",
+    "c++": "cpp", "cxx": "cpp", "cc": "cpp",
+    "c#": "csharp", "cs": "csharp",
+    "sh": "bash", "shell": "bash", "zsh": "bash",
+    "golang": "go", "rs": "rust", "kt": "kotlin", "rb": "ruby", "ps1": "powershell",
+}
+
+# A trailing run that may still turn out to be a closing fence (plus surrounding whitespace)
+_PENDING_TAIL = re.compile(r'\s*(?:`{1,3}\s*)?$')
+_TAIL_CHARS = frozenset(" \t\r\n\f\v`")
+
+# States
+_PREAMBLE, _BETWEEN, _BLOCK, _RAW, _THINK, _DONE = range(6)
+
+
+def normalize_language(language) -> str:
+    """Lower-cases a language name or fence info string and resolves common aliases."""
+    words = (language or "").split()
+    if not words:
+        return ""
+    return LANGUAGE_ALIASES.get(words[0].lower(), words[0].lower())
+
+
+def _add(out: list, text: str, start: int, end: int):
+    """Appends text[start:end] to a list of ranges, extending the last one when contiguous."""
+    if start >= end:
+        return
+    if out and out[-1][0] is text and out[-1][2] == start:
+        out[-1][2] = end
+    else:
+        out.append([text, start, end])
+
+
+def _render(ranges: list) -> str:
+    if len(ranges) == 1:
+        text, start, end = ranges[0]
+        return text[start:end]
+    return "".join(text[start:end] for text, start, end in ranges)
+
+
+class CodeExtractor:
+    """
+    Pulls the code out of an LLM answer in one pass, fed as a whole or chunk by chunk
+    as it streams. Handles what models wrap code in:
+
+    - `<think>...</think>` reasoning (qwen3, deepseek-r1) is dropped wherever it
+      appears outside a code block, including an unterminated one at the end.
+    - With fenced blocks, the first block tagged with `language` (or untagged) is
+      the code and everything else is dropped: prose before and after, and blocks
+      in other languages unless none matches, in which case the first one is used.
+    - Without fences, the whole answer is the code, minus a stray closing fence.
+      Up to `preamble_lines` lines are held back first in case a fence follows
+      them, which would make them prose.
+
+    Leading and trailing whitespace is dropped. The output is tracked as ranges of
+    the input and sliced out once, so a whole answer fed at once yields its code
+    as a single copy. `done` turns True once the chosen block has closed, so a
+    streaming caller can stop reading.
+    """
+
+    def __init__(self, language: str = None, preamble_lines: int = 2):
+        self.language = normalize_language(language)
+        self.preamble_lines = preamble_lines
+        self.done = False
+        self._state = _PREAMBLE
+        self._resume = _PREAMBLE  # State to go back to after a <think> section
+        self._buf = ""  # Unprocessed input: a partial line or tag
+        self._mid_line = False  # Part of the current line was already emitted
+        self._preamble = []  # Lines before the first fence, emitted if no fence follows
+        self._lead_in = []  # The preamble a fence turned into prose, kept in case the block is empty
+        self._emitting = False  # The open block is the chosen one and streams out
+        self._block = []  # Lines of an open block in another language
+        self._fallback = None  # The first complete block, used if no block matches
+        self._started = False  # Leading whitespace is dropped until something is emitted
+        self._tail = []  # Held trailing whitespace / backticks, as ranges
+
+    def feed(self, chunk: str) -> str:
+        """Adds a chunk and returns the code that is now certain."""
+        if self.done or not chunk:
+            return ""
+        self._buf += chunk
+        out = []
+        self._process(out, final=False)
+        return _render(out)
+
+    def finish(self) -> str:
+        """Flushes the rest once the answer is complete."""
+        out = []
+        self._finish(out)
+        return _render(out)
+
+    def _finish(self, out: list):
+        if not self.done:
+            self._process(out, final=True)
+        state = self._resume if self._state == _THINK else self._state
+        if state == _PREAMBLE:
+            self._emit_lines(self._preamble, out)
+        elif state == _BLOCK and not self._emitting:
+            # An unterminated block in another language
+            self._emit_lines(self._fallback if self._fallback is not None else self._block, out)
+        elif state == _BETWEEN:
+            self._emit_lines(self._fallback, out)
+        elif state == _BLOCK and not self._started:
+            # A lone fence after unfenced code ("x = 1\n```") opened an empty block
+            self._emit_lines(self._lead_in, out)
+
+        # Whatever trailing text is still held is kept unless it is a stray closing fence
+        tail = _render(self._tail) if self._tail else ""
+        if tail.strip() and tail.strip() != FENCE:
+            tail = tail.strip() if not self._started else tail.rstrip()
+            _add(out, tail, 0, len(tail))
+        self._tail = []
+        self.done = True
+
+    def _process(self, out: list, final: bool):
+        # Scans by position so a large answer fed at once is not re-copied per line
+        buf, pos, size = self._buf, 0, len(self._buf)
+        while pos < size and not self.done:
+            if self._state == _THINK:
+                end = buf.find(THINK_CLOSE, pos)
+                if end < 0:
+                    # Keep only what could be the start of the closing tag
+                    pos = size if final else max(pos, size - len(THINK_CLOSE) + 1)
+                    break
+                pos = end + len(THINK_CLOSE)
+                self._state = self._resume
+                continue
+
+            newline = buf.find("\n", pos)
+            end = size if newline < 0 else newline + 1
+            if self._mid_line:
+                # The rest of a line whose start was already emitted
+                self._mid_line = newline < 0
+                self._emit(buf, pos, end, out)
+                pos = end
+                continue
+            if newline < 0 and not final:
+                pos = self._partial(buf, pos, size, out)
+                break
+
+            if self._state != _BLOCK:
+                think = buf.find(THINK_OPEN, pos, end)
+                if think >= 0:
+                    if buf[pos:think].strip():
+                        self._line(buf, pos, think, out)
+                    self._resume, self._state = self._state, _THINK
+                    pos = think + len(THINK_OPEN)
+                    continue
+            self._line(buf, pos, end, out)
+            pos = end
+        self._buf = buf[pos:]
+
+    def _partial(self, buf: str, start: int, end: int, out: list) -> int:
+        """
+        Emits a partial line early when it is streaming code that cannot become a
+        fence or tag. Returns the position up to which the line was used.
+        """
+        if not (self._state == _RAW or (self._state == _BLOCK and self._emitting)):
+            return start
+        head = buf[start:end].lstrip()
+        if FENCE.startswith(head) or head.startswith(FENCE):
+            return start
+        if self._state == _RAW:
+            # Hold back a possible "<think" at the end
+            cut = buf.rfind("<", start, end)
+            if cut >= 0 and THINK_OPEN.startswith(buf[cut:end]):
+                end = cut
+            if end == start or buf.find(THINK_OPEN, start, end) >= 0:
+                return start
+        self._mid_line = True
+        self._emit(buf, start, end, out)
+        return end
+
+    def _line(self, buf: str, start: int, end: int, out: list):
+        """Handles one complete line (or the last, unterminated one)."""
+        stripped = buf[start:end].strip()
+        if self._state == _BLOCK:
+            if stripped == FENCE:
+                self._close_block()
+            elif self._emitting:
+                self._emit(buf, start, end, out)
+            else:
+                self._block.append(buf[start:end])
+            return
+
+        if stripped.startswith(FENCE):
+            if self._state != _RAW:  # Fences inside unfenced output are leftovers
+                self._open_block(stripped[len(FENCE):])
+        elif self._state == _PREAMBLE:
+            self._preamble.append(buf[start:end])
+            if sum(1 for held in self._preamble if held.strip()) > self.preamble_lines:
+                # Too long to be a lead-in: the answer is unfenced code
+                self._state = _RAW
+                self._emit_lines(self._preamble, out)
+                self._preamble = []
+        elif self._state == _RAW:
+            self._emit(buf, start, end, out)
+        # _BETWEEN: prose between blocks is dropped
+
+    def _open_block(self, info: str):
+        language = normalize_language(info)
+        self._state = _BLOCK
+        self._lead_in, self._preamble = self._preamble, []
+        self._emitting = not language or not self.language or language == self.language
+        self._block = []
+
+    def _close_block(self):
+        if self._emitting:
+            self._state = _DONE
+            self.done = True
+            return
+        if self._fallback is None:
+            self._fallback = self._block
+        self._block = []
+        self._state = _BETWEEN
+
+    def _emit_lines(self, lines, out: list):
+        for line in lines or ():
+            self._emit(line, 0, len(line), out)
+
+    def _emit(self, text: str, start: int, end: int, out: list):
+        """Adds text[start:end] to the output, dropping leading whitespace and holding back a trailing run."""
+        if not self._started:
+            while start < end and text[start].isspace():
+                start += 1
+            if start == end:
+                return
+            self._started = True
+        if end - start > 1 and text[end - 1] == "\n" and text[end - 2] not in _TAIL_CHARS:
+            pending = end - 1  # The common case: a line of code and its newline
+        else:
+            pending = _PENDING_TAIL.search(text, start, end).start()
+        if pending > start:
+            for held in self._tail:
+                _add(out, *held)
+            self._tail = []
+            _add(out, text, start, pending)
+        _add(self._tail, text, pending, end)
+
+
+def extract_code(text: str, language: str = None) -> str:
+    """Extracts the code from a complete LLM answer (see CodeExtractor)."""
+    extractor = CodeExtractor(language)
+    extractor._buf = text or ""
+    out = []
+    extractor._finish(out)
+    return _render(out)
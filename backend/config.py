@@ -0,0 +1,359 @@
+import json
+import os
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Mapping
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'config')
+CONFIG_FILES = ('paths.json', 'settings.json')  # Later files override earlier ones
+
+DEFAULT_CODER_PROMPT = "You are an expert programmer. Please generate the code for the following command:"
+
+DEFAULT_OPTIMIZER_PROMPT = """You are a prompt optimization assistant for a code generation system.
+
+Your job is to take informal, potentially unclear voice-transcribed requests and convert them into clear, specific coding instructions.
+
+Guidelines:
+1. Identify the programming task the user wants to accomplish
+2. Clarify any ambiguous terms or incomplete thoughts
+3. Make reasonable assumptions about standard practices (e.g., function names, parameter names)
+4. Output a clear, structured request for code generation
+5. Do NOT generate any code yourself - only clarify and structure the request
+6. Keep the output concise and focused on the task
+
+Examples:
+Input: "make a function it should add two numbers"
+Output: "Create a Python function named 'add' that takes two parameters and returns their sum."
+
+Input: "I need to sort a list but in reverse"
+Output: "Create Python code to sort a list in descending order."
+
+Input: "function to check if number is even"
+Output: "Create a Python function named 'is_even' that takes a number as input and returns True if it's even, False otherwise."
+
+Now process this request:"""
+
+DEFAULT_FUSED_PROMPT = """You turn voice-transcribed coding requests into {language} code in a single step.
+
+First rewrite the request as a clear, specific coding instruction: drop filler words, fix
+misheard words and resolve self-corrections, without adding anything the user did not ask for.
+Then write the {language} code that fulfills that instruction. The code must be plain {language}
+source with no markdown fences and no explanations.
+
+Answer with a JSON object with exactly two string fields:
+{"clarified": "<the clarified instruction>", "code": "<the code>"}
+
+USER REQUEST:"""
+
+# Expected types for known keys. Unknown keys are passed through untouched.
+_NUMBER = (int, float)
+SCHEMA = {
+    "language": str,
+    "ollama_endpoint": str,
+    "ollama_model": str,
+    "optimizer_model": str,
+    "optimizer_prompt": str,
+    "coder_prompt": str,
+    "master_prompt": str,
+    "optimizer_temperature": _NUMBER,
+    "optimizer_top_p": _NUMBER,
+    "optimizer_top_k": int,
+    "optimizer_max_tokens": int,
+    "coder_temperature": _NUMBER,
+    "coder_top_p": _NUMBER,
+    "coder_top_k": int,
+    "coder_max_tokens": int,
+    "ollama_timeout": _NUMBER,
+    "ollama_timeouts": dict,
+    "ollama_keep_alive": (str, int),
+    "ollama_prefix_context": bool,
+    "ollama_endpoints": list,
+    "ollama_pools": dict,
+    "ollama_balancing": str,
+    "ollama_hedging": bool,
+    "ollama_hedge_min_delay": _NUMBER,
+    "ollama_breaker_enabled": bool,
+    "ollama_breaker_failures": int,
+    "ollama_breaker_probe_interval": _NUMBER,
+    "ollama_adaptive_timeout": bool,
+    "ollama_timeout_multiplier": _NUMBER,
+    "ollama_timeout_min": _NUMBER,
+    "whisper_engine_enabled": bool,
+    "whisper_server_executable": str,
+    "whisper_cli_command": list,
+    "whisper_language": str,
+    "whisper_engine_workers": int,
+    "whisper_engine_port": int,
+    "response_cache_enabled": bool,
+    "response_cache_path": str,
+    "response_cache_max_entries": int,
+    "response_cache_ttl": _NUMBER,
+    "response_cache_fuzzy_threshold": _NUMBER,
+    "transcript_cache_enabled": bool,
+    "transcript_cache_path": str,
+    "transcript_cache_max_entries": int,
+    "optimizer_skip_enabled": bool,
+    "optimizer_skip_max_words": int,
+    "optimizer_skip_min_confidence": _NUMBER,
+    "pipeline_max_concurrent": int,
+    "pipeline_max_pending": int,
+    "scheduler_enabled": bool,
+    "scheduler_limits": dict,
+    "scheduler_deadlines": dict,
+    "vad_enabled": bool,
+    "vad_frame_ms": int,
+    "vad_energy_threshold_db": _NUMBER,
+    "vad_noise_margin_db": _NUMBER,
+    "vad_zcr_threshold": _NUMBER,
+    "vad_padding_ms": int,
+    "vad_min_speech_ms": int,
+    "log_level": str,
+    "speculative_coder_enabled": bool,
+    "speculative_min_similarity": _NUMBER,
+    "pipeline_mode": str,
+    "fused_prompt": str,
+    "batch_workers": int,
+    "batch_llm_concurrency": int,
+    "batch_base_dir": str,
+    "session_window_ms": int,
+    "session_overlap_ms": int,
+    "session_idle_timeout": _NUMBER,
+    "warmup_enabled": bool,
+    "optimizer_thinking": str,
+    "optimizer_max_seconds": _NUMBER,
+    "coder_thinking": str,
+    "coder_max_seconds": _NUMBER,
+    "coder_stop_sequences": bool,
+    "coder_early_stop": bool,
+    "coder_candidates": int,
+    "coder_candidate_temperature_spread": _NUMBER,
+    "workspace_path": str,
+    "workspace_index_path": str,
+    "workspace_extensions": list,
+    "workspace_refresh_seconds": _NUMBER,
+    "workspace_token_budget": int,
+    "workspace_max_snippets": int,
+}
+
+# Keys that must fall inside an inclusive range
+RANGES = {
+    "optimizer_temperature": (0, 2),
+    "coder_temperature": (0, 2),
+    "optimizer_top_p": (0, 1),
+    "coder_top_p": (0, 1),
+    "optimizer_max_tokens": (1, None),
+    "coder_max_tokens": (1, None),
+    "ollama_hedge_min_delay": (0, None),
+    "ollama_breaker_failures": (1, None),
+    "ollama_breaker_probe_interval": (0.1, None),
+    "ollama_timeout_multiplier": (1, None),
+    "ollama_timeout_min": (0.1, None),
+    "whisper_engine_workers": (1, None),
+    "response_cache_max_entries": (1, None),
+    "response_cache_ttl": (0, None),
+    "response_cache_fuzzy_threshold": (0, 1),
+    "transcript_cache_max_entries": (1, None),
+    "optimizer_skip_max_words": (1, None),
+    "optimizer_skip_min_confidence": (0, 1),
+    "pipeline_max_concurrent": (1, None),
+    "pipeline_max_pending": (1, None),
+    "vad_frame_ms": (5, 100),
+    "vad_energy_threshold_db": (-120, 0),
+    "vad_noise_margin_db": (0, None),
+    "vad_zcr_threshold": (0, 1),
+    "vad_padding_ms": (0, None),
+    "vad_min_speech_ms": (0, None),
+    "speculative_min_similarity": (0, 1),
+    "batch_workers": (0, None),
+    "batch_llm_concurrency": (1, None),
+    "session_window_ms": (500, None),
+    "session_overlap_ms": (0, None),
+    "session_idle_timeout": (1, None),
+    "optimizer_max_seconds": (0, None),
+    "coder_max_seconds": (0, None),
+    "coder_candidates": (1, 8),
+    "coder_candidate_temperature_spread": (0, 2),
+    "workspace_refresh_seconds": (1, None),
+    "workspace_token_budget": (1, None),
+    "workspace_max_snippets": (1, None),
+}
+
+# Keys limited to a fixed set of values
+CHOICES = {
+    "pipeline_mode": ("two_agent", "fused"),
+    "ollama_balancing": ("least_outstanding", "latency"),
+    "log_level": ("DEBUG", "INFO", "WARNING", "ERROR", "OFF"),
+    "optimizer_thinking": ("default", "off", "no_think"),
+    "coder_thinking": ("default", "off", "no_think"),
+}
+
+
+class ConfigError(ValueError):
+    """Raised when the configuration files cannot be parsed or fail validation."""
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    One immutable snapshot of paths.json merged with settings.json.
+    A new snapshot (with a higher version) is built whenever a file changes,
+    so anything derived from it, like the rendered prompts, is cached per version.
+    """
+    version: int
+    values: Mapping[str, Any]
+    prompts: Mapping[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def from_values(cls, values: dict, version: int = 0) -> "Settings":
+        values = dict(values)
+        # Allow the endpoint and whisper path to be nested under "paths"
+        nested = values.get('paths', {})
+        values['whisper_cpp_path'] = values.get('whisper_cpp_path', nested.get('whisper_cpp_path'))
+        values['ollama_endpoint'] = values.get('ollama_endpoint', nested.get('ollama_endpoint'))
+
+        language = values.get("language", "python").capitalize()
+        coder_template = values.get("coder_prompt", values.get("master_prompt", DEFAULT_CODER_PROMPT))
+        optimizer_template = values.get("optimizer_prompt", DEFAULT_OPTIMIZER_PROMPT)
+        fused_template = values.get("fused_prompt", DEFAULT_FUSED_PROMPT)
+        prompts = {
+            "coder_prompt": coder_template.replace("{language}", language),
+            "optimizer_prompt": optimizer_template.replace("{language}", language),
+            "fused_prompt": fused_template.replace("{language}", language),
+        }
+        return cls(version, MappingProxyType(values), MappingProxyType(prompts))
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.values.get(key, default)
+
+    def __getitem__(self, key: str) -> Any:
+        return self.values[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.values
+
+    @property
+    def language(self) -> str:
+        return self.values.get("language", "python")
+
+    @property
+    def ollama_endpoint(self) -> str:
+        return self.values.get("ollama_endpoint")
+
+    @property
+    def ollama_model(self) -> str:
+        return self.values.get("ollama_model")
+
+    @property
+    def optimizer_model(self) -> str:
+        return self.values.get("optimizer_model", self.values.get("ollama_model", "gemma3:1b"))
+
+    def prompt(self, name: str) -> str:
+        """Returns a prompt template with {language} already filled in."""
+        return self.prompts[name]
+
+
+def validate(values: dict) -> list:
+    """Returns a list of human-readable problems with the merged configuration."""
+    problems = []
+    for key, expected in SCHEMA.items():
+        if key not in values or values[key] is None:
+            continue
+        value = values[key]
+        # bool is an int subclass; only accept it where a bool is expected
+        if (isinstance(value, bool) and expected is not bool) or not isinstance(value, expected):
+            names = expected.__name__ if isinstance(expected, type) else "/".join(t.__name__ for t in expected)
+            problems.append(f"'{key}' should be {names}, got {type(value).__name__}")
+            continue
+        low, high = RANGES.get(key, (None, None))
+        if low is not None and value < low or high is not None and value > high:
+            problems.append(f"'{key}' = {value} is outside [{low}, {high if high is not None else '...'}]")
+        choices = CHOICES.get(key)
+        if choices is not None and str(value).upper() not in (c.upper() for c in choices):
+            problems.append(f"'{key}' = {value!r} should be one of {', '.join(choices)}")
+    return problems
+
+
+def read_files(config_dir: str = CONFIG_DIR) -> dict:
+    """Merges the raw values of the config files in `config_dir`, without validating them."""
+    values = {}
+    for name in CONFIG_FILES:
+        path = os.path.join(config_dir, name)
+        try:
+            with open(path, "r") as f:
+                values.update(json.load(f))
+        except FileNotFoundError:
+            logging.warning(f"{path} not found.")
+        except json.JSONDecodeError as e:
+            raise ConfigError(f"Error decoding JSON in {path}: {e}")
+    return values
+
+
+class SettingsStore:
+    """
+    Holds the current Settings and reloads them only when a config file's
+    mtime or size changes. A reload that fails validation is logged once and
+    the previous good snapshot stays in use, so a half-saved settings.json
+    never breaks a request in flight.
+    """
+
+    def __init__(self, config_dir: str = CONFIG_DIR):
+        self.config_dir = config_dir
+        self._lock = threading.Lock()
+        self._settings = None
+        self._stamp = None
+        self._version = 0
+
+    def _current_stamp(self) -> tuple:
+        stamp = []
+        for name in CONFIG_FILES:
+            try:
+                st = os.stat(os.path.join(self.config_dir, name))
+                stamp.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def get(self) -> Settings:
+        stamp = self._current_stamp()
+        if self._settings is not None and stamp == self._stamp:
+            return self._settings
+
+        with self._lock:
+            if self._settings is not None and stamp == self._stamp:
+                return self._settings
+            self._stamp = stamp
+            try:
+                values = read_files(self.config_dir)
+                problems = validate(values)
+                if problems:
+                    raise ConfigError("; ".join(problems))
+            except ConfigError as e:
+                logging.error(f"Invalid configuration, keeping previous settings: {e}")
+                if self._settings is None:
+                    self._settings = Settings.from_values({}, self._version)
+                return self._settings
+
+            self._version += 1
+            self._settings = Settings.from_values(values, self._version)
+            logging.info(f"Loaded settings version {self._version} from {self.config_dir}")
+            return self._settings
+
+
+_store = SettingsStore()
+
+def get_settings() -> Settings:
+    """Returns the current settings snapshot shared by all backend modules."""
+    return _store.get()
+
+@contextmanager
+def settings_from(config_dir: str):
+    """Makes get_settings() read the config files in `config_dir` until the block exits (benchmarks, tools)."""
+    global _store
+    saved, _store = _store, SettingsStore(config_dir)
+    try:
+        yield
+    finally:
+        _store = saved
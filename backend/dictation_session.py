@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import re
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from audio_io import SAMPLE_RATE
+from metrics import span
+from vad import detect_speech
+from whisper_wrapper import transcribe_pcm_async
+
+_WORD = re.compile(r"[^\w']+")
+MAX_SESSIONS = 32  # Open sessions kept at once; the least recently used is dropped beyond this
+
+
+def _normalize(word: str) -> str:
+    return _WORD.sub("", word.lower())
+
+
+def stitch(previous: str, current: str, max_overlap: int = 12, max_skip: int = 2) -> str:
+    """
+    Joins the transcripts of two overlapping windows, dropping the words the second
+    one repeats. Looks for the longest run of words ending `previous` that reappears
+    near the start of `current` (case and punctuation ignored). Words cut off at a
+    window edge are tolerated: `current` may open with up to `max_skip` fragment
+    words before the run, and the last word of `previous` only has to be a prefix
+    of its match.
+    """
+    old, new = previous.split(), current.split()
+    if not old:
+        return current.strip()
+    if not new:
+        return previous.strip()
+
+    old_norm, new_norm = [_normalize(w) for w in old], [_normalize(w) for w in new]
+    for k in range(min(max_overlap, len(old)), 0, -1):
+        head, last = old_norm[-k:-1], old_norm[-1]
+        for skip in range(min(max_skip, len(new) - k) + 1):
+            candidate = new_norm[skip:skip + k]
+            if head != candidate[:-1] or not last:
+                continue
+            # A lone short word has to match exactly, or it would match any word it begins
+            if candidate[-1] == last or (candidate[-1].startswith(last) and (k > 1 or len(last) >= 4)):
+                # The newer window heard the boundary word whole; keep its version
+                return " ".join(old[:-k] + new[skip:])
+    return " ".join(old + new)
+
+
+class DictationSession:
+    """
+    Audio of one dictation that arrives in chunks while the hotkey is held.
+
+    Once `window_ms` of audio past the last transcribed window has arrived, the new
+    audio plus `overlap_ms` before it is transcribed in the background and stitched
+    onto the partial transcript, so by the time the hotkey is released only the
+    tail after the last window is left to decode.
+    """
+
+    def __init__(self, window_ms: int = 4000, overlap_ms: int = 1000):
+        self.id = uuid.uuid4().hex
+        self.window = int(SAMPLE_RATE * window_ms / 1000)
+        self.overlap = int(SAMPLE_RATE * overlap_ms / 1000)
+        self.transcript = ""
+        self.windows = 0
+        self.whisper_seconds = 0.0
+        self.last_used = time.monotonic()
+        self._chunks = []
+        self._samples = np.zeros(0, dtype=np.float32)
+        self._received = 0  # Samples received so far, joined or not
+        self._transcribed = 0  # End of the last transcribed window, in samples
+        self._task = None  # concurrent.futures.Future of the background catch-up
+        self._catching_up = False
+        self._lock = threading.Lock()
+
+    def _flush(self) -> np.ndarray:
+        """
+        Joins the chunks received so far. Call with the lock held. Only done when a
+        window is transcribed, so the buffer is copied once per window, not per chunk.
+        """
+        if self._chunks:
+            self._samples = np.concatenate([self._samples, *self._chunks])
+            self._chunks = []
+        return self._samples
+
+    @property
+    def buffered_seconds(self) -> float:
+        with self._lock:
+            return round(self._received / SAMPLE_RATE, 3)
+
+    def add(self, samples: np.ndarray) -> bool:
+        """Appends a chunk. Returns True if a new window is ready and nothing is transcribing."""
+        with self._lock:
+            self.last_used = time.monotonic()
+            self._chunks.append(samples.astype(np.float32, copy=False))
+            self._received += len(samples)
+            return not self._catching_up and self._received - self._transcribed >= self.window
+
+    def start_catch_up(self, runner):
+        """Schedules transcription of the ready windows on the pipeline loop."""
+        with self._lock:
+            if not self._catching_up:
+                self._catching_up = True
+                self._task = runner.submit(self._catch_up())
+
+    async def _catch_up(self):
+        try:
+            while True:
+                with self._lock:
+                    end = self._received
+                    # Decided under the lock, so a chunk added meanwhile starts a new catch-up
+                    if end - self._transcribed < self.window:
+                        self._catching_up = False
+                        return
+                await self._transcribe_until(end)
+        except BaseException:
+            with self._lock:
+                self._catching_up = False
+            raise
+
+    async def _transcribe_until(self, end: int):
+        with self._lock:
+            audio = self._flush()[max(0, self._transcribed - self.overlap):end]
+        whisper_start = time.time()
+        with span("session/window"):
+            text = await transcribe_pcm_async(audio)
+        self.whisper_seconds += time.time() - whisper_start
+        self.windows += 1
+        # Whisper's blank markers would otherwise get stitched into the dictation
+        if text and not text.strip().startswith(("[", "(")):
+            self.transcript = stitch(self.transcript, text)
+        self._transcribed = end
+        logging.debug(f"Session {self.id}: window {self.windows} up to {end / SAMPLE_RATE:.1f}s, partial: {self.transcript}")
+
+    async def finish(self, vad_settings=None) -> str:
+        """
+        Waits for any window still transcribing, then decodes the remaining tail.
+        The tail is skipped when VAD finds no speech in it. Returns the full transcript.
+        """
+        with self._lock:
+            task = self._task
+        if task is not None:
+            try:
+                await asyncio.wrap_future(task)
+            except Exception as e:
+                # The failed window was not marked transcribed, so the tail covers it
+                logging.warning(f"Session {self.id}: background transcription failed: {e}")
+
+        with self._lock:
+            samples = self._flush()
+        end = len(samples)
+        if end > self._transcribed:
+            tail = samples[max(0, self._transcribed - self.overlap):end]
+            if vad_settings is None or not detect_speech(tail, vad_settings).silent:
+                await self._transcribe_until(end)
+        return self.transcript
+
+
+class SessionStore:
+    """
+    Open dictation sessions by id. Sessions idle for longer than the timeout are
+    dropped whenever the store is used, and at most `max_sessions` stay open.
+    """
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._sessions = {}
+        self._idle_timeout = None
+        self._lock = threading.Lock()
+
+    def _evict(self):
+        """Drops idle sessions, then the least recently used beyond the cap. Call with the lock held."""
+        now = time.monotonic()
+        for session_id, old in list(self._sessions.items()):
+            if self._idle_timeout is not None and now - old.last_used > self._idle_timeout:
+                logging.info(f"Dropping idle dictation session {session_id}")
+                del self._sessions[session_id]
+        overflow = len(self._sessions) - self.max_sessions
+        for session_id, _ in sorted(self._sessions.items(), key=lambda item: item[1].last_used)[:max(0, overflow)]:
+            logging.info(f"Dropping dictation session {session_id}: more than {self.max_sessions} open")
+            del self._sessions[session_id]
+
+    def start(self, window_ms: int, overlap_ms: int, idle_timeout: float) -> DictationSession:
+        session = DictationSession(window_ms, overlap_ms)
+        with self._lock:
+            self._idle_timeout = idle_timeout
+            self._sessions[session.id] = session
+            self._evict()
+        return session
+
+    def get(self, session_id: str):
+        with self._lock:
+            self._evict()
+            return self._sessions.get(session_id)
+
+    def pop(self, session_id: str):
+        with self._lock:
+            self._evict()
+            return self._sessions.pop(session_id, None)
+
+
+sessions = SessionStore()
@@ -0,0 +1,85 @@
+import json
+import logging
+import agent_budget
+import llm_client
+from config import get_settings
+from router import router
+
+# Ollama structured output: the response must be an object with these two strings
+FUSED_FORMAT = {
+    "type": "object",
+    "properties": {
+        "clarified": {"type": "string"},
+        "code": {"type": "string"}
+    },
+    "required": ["clarified", "code"]
+}
+
+def parse_fused_response(text: str):
+    """
+    Validates the fused agent's JSON answer.
+    Returns (clarified, code), or None if it is not an object with a non-empty string `code`.
+    """
+    try:
+        data = json.loads(text)
+    except (TypeError, json.JSONDecodeError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    clarified, code = data.get("clarified"), data.get("code")
+    if not isinstance(code, str) or not code.strip():
+        return None
+    if not isinstance(clarified, str):
+        clarified = ""
+    return clarified.strip(), code
+
+def generate_fused(transcribed_text: str):
+    """
+    Cleans up the dictation and generates its code with a single Ollama request,
+    using the coder model and a JSON-schema `format` so both parts come back as
+    one structured object.
+
+    Returns (clarified, code), or None when Ollama fails or the answer does not
+    parse, in which case the caller falls back to the two-agent pipeline.
+    """
+    config = get_settings()
+    ollama_model = config.ollama_model
+
+    if not router.endpoints(config, "coder") or not ollama_model:
+        logging.error("Ollama endpoint or model not found in configuration.")
+        return None
+
+    logging.debug("Fused agent input (Transcribed): %s", transcribed_text)
+
+    payload = llm_client.with_keep_alive(config, {
+        "model": ollama_model,
+        "prompt": f"{config.prompt('fused_prompt')}\n{transcribed_text}",
+        "stream": False,
+        "format": FUSED_FORMAT,
+        "options": {
+            "temperature": config.get("coder_temperature", 0.2),
+            "top_p": config.get("coder_top_p", 0.9),
+            "top_k": config.get("coder_top_k", 40),
+            # Room for the clarified instruction as well as the code
+            "num_predict": config.get("coder_max_tokens", 500) + config.get("optimizer_max_tokens", 200)
+        }
+    })
+    # Reasoning only; stop sequences and early stop do not apply to a JSON answer
+    agent_budget.apply(config, "coder", payload)
+
+    response_data = router.generate(
+        config,
+        "coder",
+        payload,
+        timeout=llm_client.model_timeout(config, ollama_model),
+        agent="Fused Agent"
+    )
+    if response_data is None:
+        return None
+
+    result = parse_fused_response(response_data.get("response"))
+    if result is None:
+        logging.warning("Fused agent returned invalid JSON, falling back to two agents.")
+        return None
+    logging.debug("Fused agent output (Clarified): %s", result[0])
+    return result
@@ -0,0 +1,167 @@
+import requests
+import json
+import logging
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from circuit_breaker import breaker_for, is_outage
+from metrics import span, record_ollama
+
+# Defaults used when settings.json does not override them
+DEFAULT_TIMEOUT = 30  # seconds
+DEFAULT_KEEP_ALIVE = "30m"
+MAX_RETRIES = 3
+RETRY_DELAY = 1  # seconds, doubled after every failed attempt
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session() -> requests.Session:
+    """
+    Returns the process-wide HTTP session shared by both agents.
+    The session keeps TCP connections to Ollama open between calls, so neither
+    a new dictation nor a retry pays for a fresh connect.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+def close_session():
+    """Closes the shared session and its pooled connections."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+def model_timeout(config: dict, model: str) -> float:
+    """Looks up the request timeout for a model, falling back to the global default."""
+    timeouts = config.get("ollama_timeouts", {})
+    return timeouts.get(model, config.get("ollama_timeout", DEFAULT_TIMEOUT))
+
+def with_keep_alive(config: dict, payload: dict) -> dict:
+    """Asks Ollama to keep the model loaded between dictations."""
+    payload.setdefault("keep_alive", config.get("ollama_keep_alive", DEFAULT_KEEP_ALIVE))
+    return payload
+
+def _attempt_timeout(breaker, model: str, kind: str, timeout: float, attempt: int) -> float:
+    """The breaker's adaptive timeout, doubled on every retry and capped at the configured one."""
+    return min(timeout, breaker.timeout(model, kind, timeout) * 2 ** attempt)
+
+def generate(endpoint: str, payload: dict, timeout: float, agent: str) -> dict:
+    """
+    Posts a non-streaming generate request and returns Ollama's JSON response.
+    Retries connection errors with exponential backoff; returns None once the
+    retries are exhausted or the response cannot be decoded, and at once while
+    the server's circuit breaker is open.
+    Attempts time out after the breaker's adaptive timeout, doubled per retry
+    and capped at `timeout`.
+    Ollama's own token counts and durations are recorded in the metrics registry.
+    """
+    breaker = breaker_for(endpoint)
+    model = payload.get("model")
+    retry_delay = RETRY_DELAY
+    for attempt in range(MAX_RETRIES):
+        if not breaker.allow():
+            logging.warning(f"{agent} skipped: Ollama at {breaker.url} is unreachable.")
+            return None
+        try:
+            start = time.perf_counter()
+            with span("http"):
+                response = get_session().post(endpoint, json=payload,
+                                              timeout=_attempt_timeout(breaker, model, "generate", timeout, attempt))
+                response.raise_for_status()
+            with span("json"):
+                data = response.json()
+            wall_seconds = time.perf_counter() - start
+            breaker.record_success(model, "generate", wall_seconds)
+            record_ollama(agent, model, data, wall_seconds)
+            return data
+
+        except json.JSONDecodeError as e:
+            # Checked first: requests' own JSONDecodeError is also a RequestException
+            logging.error(f"Error decoding JSON response from Ollama: {e}")
+            return None
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Attempt {attempt + 1}/{MAX_RETRIES}: {agent} could not connect to Ollama. Ensure it is running. Error: {e}")
+            if is_outage(e):
+                breaker.record_failure(e)
+            if attempt < MAX_RETRIES - 1 and breaker.allow():
+                time.sleep(retry_delay)
+                retry_delay *= 2  # Exponential backoff
+            elif attempt == MAX_RETRIES - 1:
+                logging.error(f"FATAL ERROR: Max retries reached for {agent}.")
+    return None
+
+def stream_generate(endpoint: str, payload: dict, timeout: float, agent: str):
+    """
+    Posts a streaming generate request and yields each decoded NDJSON chunk.
+    Retries only happen before the first chunk has been yielded, since a retry
+    after that would duplicate output the caller has already consumed.
+    """
+    breaker = breaker_for(endpoint)
+    model = payload.get("model")
+    retry_delay = RETRY_DELAY
+    started = False
+
+    for attempt in range(MAX_RETRIES):
+        if not breaker.allow():
+            logging.warning(f"{agent} skipped: Ollama at {breaker.url} is unreachable.")
+            return
+        try:
+            start = time.perf_counter()
+            # Headers arrive once Ollama has accepted the request; the body is the generation.
+            # The timeout applies to each read, so the adaptive one is based on the wait for the first chunk
+            with span("http"):
+                response = get_session().post(endpoint, json=payload, stream=True,
+                                              timeout=_attempt_timeout(breaker, model, "stream", timeout, attempt))
+            received = 0
+            with response:
+                response.raise_for_status()
+                try:
+                    for line in response.iter_lines():
+                        if not line:
+                            continue
+                        chunk = json.loads(line)
+                        if chunk.get("error"):
+                            logging.error(f"Ollama stream error: {chunk['error']}")
+                            return
+                        if not started:
+                            breaker.record_success(model, "stream", time.perf_counter() - start)
+                        started = True
+                        received += 1
+                        if chunk.get("done"):
+                            # Recorded first, in case the caller stops reading at the last chunk
+                            record_ollama(agent, model, chunk, time.perf_counter() - start)
+                            received = None
+                            yield chunk
+                            return
+                        yield chunk
+                except GeneratorExit:
+                    # Closed early (cancelled, budget or complete code block): count what was generated
+                    if received is not None:
+                        record_ollama(agent, model, {"eval_count": received})
+                    raise
+            return
+
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Attempt {attempt + 1}/{MAX_RETRIES}: {agent} could not stream from Ollama. Error: {e}")
+            if is_outage(e):
+                breaker.record_failure(e)
+            if started:
+                return
+            if attempt < MAX_RETRIES - 1 and breaker.allow():
+                time.sleep(retry_delay)
+                retry_delay *= 2  # Exponential backoff
+            else:
+                if attempt == MAX_RETRIES - 1:
+                    logging.error(f"FATAL ERROR: Max retries reached for {agent}.")
+                return
+        except json.JSONDecodeError as e:
+            logging.error(f"Error decoding JSON chunk from Ollama: {e}")
+            return
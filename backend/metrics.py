@@ -0,0 +1,243 @@
+import contextvars
+import logging
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+WINDOW = 1024  # Observations kept per histogram for the rolling percentiles
+QUANTILES = (0.5, 0.95, 0.99)
+
+STAGE_SECONDS = "voice2code_stage_seconds"
+
+HELP = {
+    STAGE_SECONDS: "Wall-clock seconds spent in each pipeline stage; nested stages are joined with '/'.",
+    "voice2code_ollama_eval_tokens": "Tokens generated per Ollama request (eval_count).",
+    "voice2code_ollama_prompt_tokens": "Prompt tokens evaluated per Ollama request (prompt_eval_count).",
+    "voice2code_ollama_eval_seconds": "Ollama generation time per request (eval_duration).",
+    "voice2code_ollama_prompt_eval_seconds": "Ollama prompt processing time per request (prompt_eval_duration).",
+    "voice2code_ollama_load_seconds": "Ollama model load time per request (load_duration).",
+    "voice2code_ollama_overhead_seconds": "Client wall time minus Ollama's total_duration: connect, transfer and queueing.",
+    "voice2code_requests_total": "Finished dictations by endpoint and status code.",
+    "voice2code_pipeline_pending": "Dictations running or waiting on the pipeline event loop.",
+    "voice2code_scheduler_queue_depth": "Pipeline stages waiting for a slot of each scheduled resource.",
+    "voice2code_scheduler_running": "Pipeline stages holding a slot of each scheduled resource.",
+    "voice2code_scheduler_wait_seconds": "Seconds a stage waited for a slot, by resource and job priority.",
+    "voice2code_jobs_total": "Finished jobs by kind, priority and outcome.",
+    "voice2code_job_seconds": "Seconds from a job's creation to its end, by kind and priority.",
+    "voice2code_speculation_total": "Speculative coder runs whose code was kept (won) or discarded (lost).",
+    "voice2code_candidates_total": "Coder candidates by outcome: chosen valid, rejected by the syntax check, failed, or cancelled once another won.",
+    "voice2code_prefix_context_total": "Agent requests that sent their fixed template as the system prompt, by model.",
+    "voice2code_transcript_cache_total": "Transcriptions answered from the transcript cache (hit) or by whisper (miss).",
+    "voice2code_fused_total": "Fused single-call generations that parsed (ok) or fell back to two agents.",
+    "voice2code_warmup_total": "Startup warm-up steps by outcome.",
+    "voice2code_ollama_breaker_open": "1 while the circuit breaker of an Ollama server is open and requests fail fast.",
+    "voice2code_ollama_breaker_trips_total": "Times an Ollama server's circuit breaker opened.",
+    "voice2code_hedged_total": "Requests duplicated on a second Ollama server after missing the first one's p95, by which copy answered first.",
+}
+
+log = logging.getLogger("voice2code")
+
+
+class RollingHistogram:
+    """Keeps the last WINDOW observations for percentiles, plus all-time count and sum."""
+
+    def __init__(self, window: int = WINDOW):
+        self._values = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        with self._lock:
+            self._values.append(value)
+            self.count += 1
+            self.total += value
+
+    def __len__(self) -> int:
+        """Observations currently in the window."""
+        with self._lock:
+            return len(self._values)
+
+    def percentiles(self, quantiles=QUANTILES) -> dict:
+        """Nearest-rank percentiles over the rolling window."""
+        with self._lock:
+            values = sorted(self._values)
+        if not values:
+            return {q: math.nan for q in quantiles}
+        return {q: values[min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))] for q in quantiles}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: dict):
+        return name, tuple(sorted(labels.items()))
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, RollingHistogram())
+        histogram.observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def histogram(self, name: str, **labels) -> RollingHistogram:
+        return self._histograms.get(self._key(name, labels))
+
+    def counter(self, name: str, **labels) -> float:
+        return self._counters.get(self._key(name, labels), 0)
+
+    def histograms(self, name: str) -> list:
+        """Returns (labels, histogram) for every label set recorded under `name`."""
+        with self._lock:
+            return [(dict(labels), h) for (n, labels), h in self._histograms.items() if n == name]
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+    def render_prometheus(self) -> str:
+        """Renders every metric in the Prometheus text exposition format."""
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), histogram in histograms:
+            header(name, "summary")
+            for q, value in histogram.percentiles().items():
+                lines.append(f"{name}{_labels(labels, quantile=q)} {_number(value)}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(histogram.total)}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        for (name, labels), value in gauges:
+            header(name, "gauge")
+            lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: tuple, **extra) -> str:
+    pairs = list(labels) + [(k, v) for k, v in extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value) -> str:
+    if isinstance(value, float) and math.isnan(value):
+        return "NaN"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = MetricsRegistry()
+
+# Name of the innermost open span in this thread or task
+_current_span = contextvars.ContextVar("voice2code_span", default=None)
+
+
+@contextmanager
+def span(name: str):
+    """
+    Times a block as a pipeline stage. Spans opened inside another span are
+    recorded under the joined name, e.g. "pipeline/whisper/spawn". The context
+    is carried into asyncio tasks and asyncio.to_thread() calls automatically.
+    """
+    parent = _current_span.get()
+    full_name = f"{parent}/{name}" if parent else name
+    token = _current_span.set(full_name)
+    start = time.perf_counter()
+    try:
+        yield full_name
+    finally:
+        elapsed = time.perf_counter() - start
+        _current_span.reset(token)
+        registry.observe(STAGE_SECONDS, elapsed, stage=full_name)
+        log.debug(f"span {full_name}: {elapsed * 1000:.1f} ms")
+
+
+# timings dict of the dictation being processed in this thread or task
+_current_timings = contextvars.ContextVar("voice2code_timings", default=None)
+
+
+@contextmanager
+def reporting(timings: dict):
+    """
+    Makes `timings` the current dictation's timings for the block, so code deep
+    inside it (the agents, the transcript cache) can report into the response
+    without it being passed down. Carried into tasks and threads like spans.
+    """
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+def current_timings():
+    """The timings dict of the enclosing reporting() block, or None outside one."""
+    return _current_timings.get()
+
+
+def record_ollama(agent: str, model: str, response: dict, wall_seconds: float = None):
+    """Records the timing fields Ollama returns with a finished generation."""
+    labels = {"agent": agent, "model": model or "unknown"}
+    if "eval_count" in response:
+        registry.observe("voice2code_ollama_eval_tokens", response["eval_count"], **labels)
+    if "prompt_eval_count" in response:
+        registry.observe("voice2code_ollama_prompt_tokens", response["prompt_eval_count"], **labels)
+    for field, name in (("eval_duration", "voice2code_ollama_eval_seconds"),
+                        ("prompt_eval_duration", "voice2code_ollama_prompt_eval_seconds"),
+                        ("load_duration", "voice2code_ollama_load_seconds")):
+        if field in response:
+            registry.observe(name, response[field] / 1e9, **labels)
+    if wall_seconds is not None and "total_duration" in response:
+        registry.observe("voice2code_ollama_overhead_seconds",
+                         max(0.0, wall_seconds - response["total_duration"] / 1e9), **labels)
+
+
+LOG_LEVELS = {"DEBUG": logging.DEBUG, "INFO": logging.INFO, "WARNING": logging.WARNING,
+              "ERROR": logging.ERROR, "OFF": logging.CRITICAL + 1}
+
+_applied_level = None
+
+
+def apply_log_level(settings):
+    """Sets the backend's log level from settings ("OFF" silences it). Cheap when unchanged."""
+    global _applied_level
+    level = str(settings.get("log_level", "INFO")).upper()
+    if level != _applied_level:
+        logging.getLogger().setLevel(LOG_LEVELS.get(level, logging.INFO))
+        _applied_level = level
@@ -1,105 +1,136 @@
-import requests
-import json
-import os
 import logging
+import threading
 import time
+import agent_budget
+import llm_client
+from config import get_settings
+from prefix_cache import as_system
+from router import router
 
 # Initialize logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def _load_config() -> dict:
-    """Loads configuration from both paths.json and settings.json."""
-    config = {}
-    dir_path = os.path.dirname(os.path.realpath(__file__))
-    
-    paths_config_path = os.path.join(dir_path, '..', 'config', 'paths.json')
-    settings_config_path = os.path.join(dir_path, '..', 'config', 'settings.json')
-    
-    config = _load_json_config(paths_config_path, config)
-    config = _load_json_config(settings_config_path, config)
-
-    # Override paths from settings.json if they exist
-    config['whisper_cpp_path'] = config.get('whisper_cpp_path', config.get('paths', {}).get('whisper_cpp_path'))
-    config['ollama_endpoint'] = config.get('ollama_endpoint', config.get('paths', {}).get('ollama_endpoint'))
-        
-    return config
-
-def _load_json_config(file_path: str, config: dict) -> dict:
-    """Loads a JSON configuration file and updates the provided config dictionary."""
-    try:
-        with open(file_path, "r") as f:
-            config.update(json.load(f))
-            logging.info(f"Loaded config from {file_path}")
-    except FileNotFoundError:
-        logging.warning(f"{file_path} not found.")
-    except json.JSONDecodeError as e:
-        logging.error(f"Error decoding JSON in {file_path}: {e}")
-    return config
+def _build_payload(config, prompt: str, stream: bool, options: dict = None) -> dict:
+    """
+    Builds the Ollama generate payload with the coder's LLM parameters, with
+    `options` (a candidate's seed and temperature) overriding them.
+    When the prompt starts with the coder template, the template is sent as the
+    system prompt so Ollama can reuse its cached evaluation.
+    """
+    payload = {
+        "model": config.get("ollama_model"),
+        "prompt": prompt,
+        "stream": stream,
+        "options": {
+            "temperature": config.get("coder_temperature", 0.2),
+            "top_p": config.get("coder_top_p", 0.9),
+            "top_k": config.get("coder_top_k", 40),
+            "num_predict": config.get("coder_max_tokens", 500),
+            **(options or {})
+        }
+    }
+    as_system(config, payload, config.prompt("coder_prompt"))
+    agent_budget.apply(config, "coder", payload, stops=True)
+    return llm_client.with_keep_alive(config, payload)
 
 def get_raw_code(prompt: str) -> str:
     """
     Sends a prompt to Ollama and returns the raw code output.
     """
-    config = _load_config()
-    ollama_endpoint = config.get("ollama_endpoint")
-    ollama_model = config.get("ollama_model")
+    config = get_settings()
+    ollama_endpoints = router.endpoints(config, "coder")
+    ollama_model = config.ollama_model
 
-    if not ollama_endpoint or not ollama_model:
+    if not ollama_endpoints or not ollama_model:
         logging.error("Ollama endpoint or model not found in configuration.")
         return ""
 
-    logging.info("Sending prompt to Ollama endpoint: %s", ollama_endpoint)
-    logging.info("Using Coder Model (Agent 2): %s", ollama_model)
-
-    # Retry mechanism
-    max_retries = 3
-    retry_delay = 1  # seconds
-
-    for attempt in range(max_retries):
-        try:
-            # Build payload with LLM parameters
-            payload = {
-                "model": ollama_model,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": config.get("coder_temperature", 0.2),
-                    "top_p": config.get("coder_top_p", 0.9),
-                    "top_k": config.get("coder_top_k", 40),
-                    "num_predict": config.get("coder_max_tokens", 500)
-                }
-            }
+    logging.debug("Sending prompt to Ollama endpoints: %s", ollama_endpoints)
+    logging.debug("Using Coder Model (Agent 2): %s", ollama_model)
 
-            response = requests.post(
-                ollama_endpoint,
-                json=payload,
-                timeout=30
+    try:
+        payload = _build_payload(config, prompt, stream=False)
+        if agent_budget.streams(config, "coder"):
+            # Streamed so the wall-time limit and early stop can cut the generation short
+            message_content, _ = agent_budget.generate(config, payload, "coder", "agent2", "Coder Agent")
+            if message_content is None:
+                return ""
+        else:
+            response_data = router.generate(
+                config,
+                "coder",
+                payload,
+                timeout=llm_client.model_timeout(config, ollama_model),
+                agent="Coder Agent"
             )
-            response.raise_for_status()
-
-            response_data = response.json()
-            message_content = response_data.get('response', '')
-            
-            if message_content:
-                logging.info("Agent 2 (Coder) Output: %s", message_content.strip()[:100] + "...")
-                return message_content.strip()
-            else:
-                logging.warning("Could not find message content in Ollama response.")
+            if response_data is None:
                 return ""
+            message_content = response_data.get('response', '')
+            agent_budget.report("agent2", response_data.get("eval_count", 0), payload["options"]["num_predict"],
+                                response_data.get("done_reason", "stop"))
 
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Attempt {attempt + 1}/{max_retries}: Could not connect to Ollama. Ensure it is running. Error: {e}")
-            if attempt < max_retries - 1:
-                time.sleep(retry_delay)
-                retry_delay *= 2  # Exponential backoff
-            else:
-                logging.error("FATAL ERROR: Max retries reached. Could not connect to Ollama.")
-                return ""
-        except json.JSONDecodeError as e:
-            logging.error(f"Error decoding JSON response from Ollama: {e}")
-            return ""
-        except Exception as e:
-            logging.exception(f"An unexpected error occurred in ollama_wrapper: {e}")
+        if message_content:
+            logging.debug("Agent 2 (Coder) Output: %s", message_content.strip()[:100] + "...")
+            return message_content.strip()
+        else:
+            logging.warning("Could not find message content in Ollama response.")
             return ""
-    
-    return ""
\ No newline at end of file
+
+    except Exception as e:
+        logging.exception(f"An unexpected error occurred in ollama_wrapper: {e}")
+        return ""
+
+def stream_raw_code(prompt: str, options: dict = None):
+    """
+    Sends a prompt to Ollama with streaming enabled and yields the code as it is generated.
+    Ollama answers with one JSON object per line; each carries the next piece of the response.
+    `options` override the coder's sampling options for this request.
+    """
+    config = get_settings()
+    ollama_endpoints = router.endpoints(config, "coder")
+    ollama_model = config.ollama_model
+
+    if not ollama_endpoints or not ollama_model:
+        logging.error("Ollama endpoint or model not found in configuration.")
+        return
+
+    logging.debug("Streaming prompt to Ollama endpoints: %s", ollama_endpoints)
+    logging.debug("Using Coder Model (Agent 2): %s", ollama_model)
+
+    payload = _build_payload(config, prompt, stream=True, options=options)
+    max_seconds = config.get("coder_max_seconds", 0)
+    timeout = llm_client.model_timeout(config, ollama_model)
+    start = time.time()
+    chunks = router.stream_generate(
+        config,
+        "coder",
+        payload,
+        timeout=min(timeout, max_seconds) if max_seconds else timeout,
+        agent="Coder Agent"
+    )
+    try:
+        for chunk in chunks:
+            if chunk.get("response"):
+                yield chunk["response"]
+            if max_seconds and not chunk.get("done") and time.time() - start > max_seconds:
+                logging.warning(f"Coder Agent stopped after its {max_seconds}s budget")
+                break
+    finally:
+        chunks.close()
+
+def get_raw_code_cancellable(prompt: str, cancelled: threading.Event, options: dict = None) -> str:
+    """
+    Like get_raw_code(), but can be abandoned part-way: the response is streamed and,
+    once `cancelled` is set, the connection is closed at the next chunk so Ollama
+    stops generating. Returns None if it was cancelled.
+    """
+    parts = []
+    chunks = stream_raw_code(prompt, options)
+    try:
+        for chunk in chunks:
+            if cancelled.is_set():
+                return None
+            parts.append(chunk)
+    finally:
+        chunks.close()
+    return None if cancelled.is_set() else "".join(parts)
@@ -0,0 +1,124 @@
+import asyncio
+import concurrent.futures
+import logging
+import threading
+
+
+class PipelineBusy(Exception):
+    """Raised when the pending-request queue is full."""
+
+
+class PipelineSuperseded(Exception):
+    """Raised when a newer dictation from the same client cancelled this one."""
+
+
+class PipelineRunner:
+    """
+    Runs pipeline coroutines on one background asyncio event loop.
+
+    Request threads hand their coroutine to run() and block on the result, while
+    the loop interleaves the actual work: whisper subprocesses and Ollama calls
+    of overlapping dictations no longer queue up behind each other.
+
+    - At most `max_concurrent` pipelines run at once; the rest wait their turn.
+    - At most `max_pending` (running + waiting) are admitted; beyond that run()
+      raises PipelineBusy immediately instead of queueing without bound.
+    - A new pipeline for a client_id cancels the one still in flight for that
+      client, whose run() then raises PipelineSuperseded. Pipelines without a
+      client_id (None) never supersede each other.
+    - start() admits a pipeline the same way but returns its future at once.
+    """
+
+    def __init__(self, max_concurrent: int = 2, max_pending: int = 8):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_pending = max(self.max_concurrent, max_pending)
+        self._loop = None
+        self._thread = None
+        self._semaphore = None
+        self._active = {}  # client_id -> asyncio.Task, only touched on the loop thread
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._semaphore = asyncio.Semaphore(self.max_concurrent)
+                self._thread = threading.Thread(target=self._loop.run_forever, name="pipeline-loop", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def run(self, client_id: str, coro, timeout: float = None):
+        """Runs `coro` on the loop and returns its result."""
+        future = self._admit(client_id, coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.CancelledError:
+            raise PipelineSuperseded(f"Dictation from '{client_id}' superseded by a newer one")
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+        finally:
+            self._release()
+
+    def start(self, client_id: str, coro) -> concurrent.futures.Future:
+        """
+        Admits `coro` like run() but returns its future instead of waiting, for
+        requests whose result is polled later. Raises PipelineBusy when full.
+        """
+        future = self._admit(client_id, coro)
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def _admit(self, client_id: str, coro) -> concurrent.futures.Future:
+        loop = self.loop
+        with self._lock:
+            if self._pending >= self.max_pending:
+                coro.close()
+                raise PipelineBusy(f"{self._pending} dictations already pending")
+            self._pending += 1
+        try:
+            return asyncio.run_coroutine_threadsafe(self._run(client_id, coro), loop)
+        except BaseException:
+            self._release()
+            raise
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        """Schedules a coroutine on the loop without waiting for it."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def _run(self, client_id: str, coro):
+        task = asyncio.current_task()
+        if client_id is not None:
+            previous = self._active.get(client_id)
+            if previous is not None and not previous.done():
+                logging.info(f"Cancelling in-flight dictation from '{client_id}'")
+                previous.cancel()
+            self._active[client_id] = task
+
+        try:
+            async with self._semaphore:
+                return await coro
+        finally:
+            # Releases the coroutine if it was cancelled before it got a slot
+            coro.close()
+            if client_id is not None and self._active.get(client_id) is task:
+                del self._active[client_id]
+
+    def stop(self):
+        with self._lock:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._thread.join(timeout=5)
+                self._loop.close()
+                self._loop = None
+                self._thread = None
@@ -0,0 +1,60 @@
+import logging
+import llm_client
+from metrics import registry
+
+# Ollama only evaluates the system prompt when the request has some prompt text too
+PRIME_PROMPT = "Ready?"
+
+
+def split_prefix(prompt: str, prefix: str):
+    """
+    Splits a full prompt built as "<prefix>\\n\\n<rest>" into its rest.
+    Returns None if the prompt does not start with the prefix.
+    """
+    if prefix and prompt.startswith(prefix):
+        return prompt[len(prefix):].lstrip("\n") or None
+    return None
+
+
+def as_system(config, payload: dict, template: str) -> dict:
+    """
+    Moves an agent's fixed template out of `payload["prompt"]` into the request's
+    `system` field, leaving only the text after it as the prompt.
+
+    Every request of the agent then begins with the same rendered system turn, so
+    Ollama finds those tokens in its KV cache and evaluates only the dictation;
+    nothing is replayed from an earlier answer, so the output is the one a full
+    prompt would give. The payload is left alone when `ollama_prefix_context` is
+    off or the prompt does not start with the template.
+    """
+    if not config.get("ollama_prefix_context", True):
+        return payload
+    rest = split_prefix(payload["prompt"], template)
+    if rest is None:
+        return payload
+    payload["system"] = template
+    payload["prompt"] = rest
+    registry.inc("voice2code_prefix_context_total", model=payload["model"])
+    return payload
+
+
+def prime(config, url: str, model: str, template: str, agent: str) -> bool:
+    """
+    Has the server at `url` evaluate `template` as the system prompt once, so the
+    first dictation already finds it in the KV cache. The answer is discarded.
+    """
+    if not config.get("ollama_prefix_context", True):
+        return False
+    payload = llm_client.with_keep_alive(config, {
+        "model": model,
+        "system": template,
+        "prompt": PRIME_PROMPT,
+        "stream": False,
+        # One token is the least Ollama will generate
+        "options": {"num_predict": 1, "temperature": 0}
+    })
+    response = llm_client.generate(url, payload, timeout=llm_client.model_timeout(config, model), agent=f"{agent} (prefix)")
+    if response is None:
+        logging.warning(f"Could not evaluate the {agent} template on {url}; the first request will.")
+        return False
+    return True
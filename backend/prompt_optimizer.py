@@ -1,40 +1,13 @@
-import requests
-import json
-import os
 import logging
-import time
+import agent_budget
+import llm_client
+from config import get_settings
+from prefix_cache import as_system
+from router import router
 
 # Initialize logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def _load_optimizer_config() -> dict:
-    """Loads configuration from both paths.json and settings.json for the optimizer."""
-    config = {}
-    dir_path = os.path.dirname(os.path.realpath(__file__))
-    
-    paths_config_path = os.path.join(dir_path, '..', 'config', 'paths.json')
-    settings_config_path = os.path.join(dir_path, '..', 'config', 'settings.json')
-    
-    config = _load_json_config(paths_config_path, config)
-    config = _load_json_config(settings_config_path, config)
-
-    # Get optimizer-specific configuration
-    config['ollama_endpoint'] = config.get('ollama_endpoint', config.get('paths', {}).get('ollama_endpoint'))
-         
-    return config
-
-def _load_json_config(file_path: str, config: dict) -> dict:
-    """Loads a JSON configuration file and updates the provided config dictionary."""
-    try:
-        with open(file_path, "r") as f:
-            config.update(json.load(f))
-            logging.info(f"Loaded config from {file_path}")
-    except FileNotFoundError:
-        logging.warning(f"{file_path} not found.")
-    except json.JSONDecodeError as e:
-        logging.error(f"Error decoding JSON in {file_path}: {e}")
-    return config
-
 def optimize_prompt(transcribed_text: str) -> str:
     """
     Sends transcribed text to the Optimizer Agent (Agent 1) to clarify and optimize the prompt.
@@ -45,107 +18,75 @@ def optimize_prompt(transcribed_text: str) -> str:
     Returns:
         Optimized, clarified prompt ready for code generation
     """
-    config = _load_optimizer_config()
-    ollama_endpoint = config.get("ollama_endpoint")
-    optimizer_model = config.get("optimizer_model", config.get("ollama_model", "gemma3:1b"))
-    optimizer_prompt_template = config.get("optimizer_prompt", _get_default_optimizer_prompt())
-    language = config.get("language", "python").capitalize()  # Get language and capitalize it
-
-    if not ollama_endpoint:
+    config = get_settings()
+    ollama_endpoints = router.endpoints(config, "optimizer")
+    optimizer_model = config.optimizer_model
+    # Template with {language} already injected, cached per settings version
+    optimizer_prompt = config.prompt("optimizer_prompt")
+    language = config.language.capitalize()
+
+    if not ollama_endpoints:
         logging.error("Ollama endpoint not found in configuration.")
         return transcribed_text  # Fallback: return original text
 
-    # Inject the language into the prompt template
-    optimizer_prompt = optimizer_prompt_template.replace("{language}", language)
-
-    logging.info("=" * 60)
-    logging.info("AGENT 1 - PROMPT OPTIMIZER")
-    logging.info("=" * 60)
-    logging.info(f"Endpoint: {ollama_endpoint}")
-    logging.info(f"Model: {optimizer_model}")
-    logging.info(f"Target Language: {language}")
-    logging.info(f"Input (Transcribed): {transcribed_text}")
-
-    # Retry mechanism
-    max_retries = 3
-    retry_delay = 1  # seconds
-
-    for attempt in range(max_retries):
-        try:
-            # Combine the optimizer's system prompt with the user's transcribed text
-            full_prompt = f"{optimizer_prompt}\n\nUSER REQUEST:\n{transcribed_text}"
-            
-            # Build payload with LLM parameters
-            payload = {
-                "model": optimizer_model,
-                "prompt": full_prompt,
-                "stream": False,
-                "options": {
-                    "temperature": config.get("optimizer_temperature", 0.3),
-                    "top_p": config.get("optimizer_top_p", 0.9),
-                    "top_k": config.get("optimizer_top_k", 40),
-                    "num_predict": config.get("optimizer_max_tokens", 200)
-                }
-            }
-
-            response = requests.post(
-                ollama_endpoint,
-                json=payload,
-                timeout=30
-            )
-            response.raise_for_status()
-
-            response_data = response.json()
-            optimized_text = response_data.get('response', '')
-            
-            if optimized_text:
-                optimized_text = optimized_text.strip()
-                logging.info(f"Output (Optimized): {optimized_text}")
-                logging.info("=" * 60)
-                return optimized_text
-            else:
-                logging.warning("Could not find response in Ollama output.")
-                return transcribed_text  # Fallback
+    logging.debug("=" * 60)
+    logging.debug("AGENT 1 - PROMPT OPTIMIZER")
+    logging.debug("=" * 60)
+    logging.debug(f"Endpoints: {ollama_endpoints}")
+    logging.debug(f"Model: {optimizer_model}")
+    logging.debug(f"Target Language: {language}")
+    logging.debug(f"Input (Transcribed): {transcribed_text}")
+
+    # Combine the optimizer's system prompt with the user's transcribed text.
+    # With prefix reuse on, the template goes in the system field and the request alone in the prompt.
+    full_prompt = f"{optimizer_prompt}\n\nUSER REQUEST:\n{transcribed_text}"
+
+    # Build payload with LLM parameters
+    payload = llm_client.with_keep_alive(config, {
+        "model": optimizer_model,
+        "prompt": full_prompt,
+        "stream": False,
+        "options": {
+            "temperature": config.get("optimizer_temperature", 0.3),
+            "top_p": config.get("optimizer_top_p", 0.9),
+            "top_k": config.get("optimizer_top_k", 40),
+            "num_predict": config.get("optimizer_max_tokens", 200)
+        }
+    })
+    as_system(config, payload, optimizer_prompt)
+    agent_budget.apply(config, "optimizer", payload)
 
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Attempt {attempt + 1}/{max_retries}: Could not connect to Ollama. Error: {e}")
-            if attempt < max_retries - 1:
-                time.sleep(retry_delay)
-                retry_delay *= 2  # Exponential backoff
-            else:
-                logging.error("FATAL ERROR: Max retries reached for Optimizer Agent.")
+    try:
+        if agent_budget.streams(config, "optimizer"):
+            optimized_text, stopped = agent_budget.generate(config, payload, "optimizer", "agent1", "Optimizer Agent")
+            if stopped == "time":
+                # A half-written instruction is worse than the dictation itself
                 return transcribed_text  # Fallback
-        except json.JSONDecodeError as e:
-            logging.error(f"Error decoding JSON response from Ollama: {e}")
-            return transcribed_text  # Fallback
-        except Exception as e:
-            logging.exception(f"Unexpected error in prompt_optimizer: {e}")
+        else:
+            response_data = router.generate(
+                config,
+                "optimizer",
+                payload,
+                timeout=llm_client.model_timeout(config, optimizer_model),
+                agent="Optimizer Agent"
+            )
+            optimized_text = None if response_data is None else response_data.get('response', '')
+            if response_data is not None:
+                agent_budget.report("agent1", response_data.get("eval_count", 0), payload["options"]["num_predict"],
+                                    response_data.get("done_reason", "stop"))
+        if optimized_text is None:
             return transcribed_text  # Fallback
-    
-    return transcribed_text  # Final fallback
 
-def _get_default_optimizer_prompt() -> str:
-    """Returns the default optimizer prompt if not configured."""
-    return """You are a prompt optimization assistant for a code generation system.
-
-Your job is to take informal, potentially unclear voice-transcribed requests and convert them into clear, specific coding instructions.
-
-Guidelines:
-1. Identify the programming task the user wants to accomplish
-2. Clarify any ambiguous terms or incomplete thoughts
-3. Make reasonable assumptions about standard practices (e.g., function names, parameter names)
-4. Output a clear, structured request for code generation
-5. Do NOT generate any code yourself - only clarify and structure the request
-6. Keep the output concise and focused on the task
-
-Examples:
-Input: "make a function it should add two numbers"
-Output: "Create a Python function named 'add' that takes two parameters and returns their sum."
-
-Input: "I need to sort a list but in reverse"
-Output: "Create Python code to sort a list in descending order."
-
-Input: "function to check if number is even"
-Output: "Create a Python function named 'is_even' that takes a number as input and returns True if it's even, False otherwise."
+        optimized_text = agent_budget.strip_reasoning(optimized_text)
+        if optimized_text:
+            optimized_text = optimized_text.strip()
+            logging.debug(f"Output (Optimized): {optimized_text}")
+            logging.debug("=" * 60)
+            return optimized_text
+        else:
+            logging.warning("Could not find response in Ollama output.")
+            return transcribed_text  # Fallback
 
-Now process this request:"""
+    except Exception as e:
+        logging.exception(f"Unexpected error in prompt_optimizer: {e}")
+        return transcribed_text  # Fallback
@@ -0,0 +1,257 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "responses.sqlite3")
+TOUCH_FLUSH_EVERY = 32  # Cache hits whose last_used times are written to disk together
+
+# Settings that change what the agents would produce for the same dictation
+CONTEXT_KEYS = (
+    "language", "optimizer_model", "ollama_model",
+    "optimizer_temperature", "optimizer_top_p", "optimizer_top_k", "optimizer_max_tokens",
+    "coder_temperature", "coder_top_p", "coder_top_k", "coder_max_tokens", "pipeline_mode",
+    "workspace_path",
+)
+
+def normalize_transcript(text: str) -> str:
+    """Lowercases, drops punctuation and collapses whitespace so trivial variations share a key."""
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return " ".join(text.split())
+
+def _ngrams(text: str, n: int = 3) -> frozenset:
+    padded = f" {text} "
+    return frozenset(padded[i:i + n] for i in range(max(1, len(padded) - n + 1)))
+
+def similarity(a: frozenset, b: frozenset) -> float:
+    """Jaccard similarity of two n-gram sets."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def text_similarity(a: str, b: str) -> float:
+    """Trigram similarity of two transcripts after normalization, 1.0 for identical text."""
+    return similarity(_ngrams(normalize_transcript(a)), _ngrams(normalize_transcript(b)))
+
+def cache_context(settings) -> str:
+    """
+    Fingerprints everything besides the transcript that determines the output:
+    model names, language, sampling options and the rendered prompt templates.
+    """
+    context = {key: settings.get(key) for key in CONTEXT_KEYS}
+    context["prompts"] = dict(settings.prompts)
+    return hashlib.sha256(json.dumps(context, sort_keys=True).encode()).hexdigest()
+
+
+class CacheEntry:
+    __slots__ = ("key", "context", "normalized", "grams", "optimized", "code", "created", "last_used")
+
+    def __init__(self, key, context, normalized, optimized, code, created, last_used):
+        self.key = key
+        self.context = context
+        self.normalized = normalized
+        self.grams = _ngrams(normalized)
+        self.optimized = optimized
+        self.code = code
+        self.created = created
+        self.last_used = last_used
+
+
+class ResponseCache:
+    """
+    Two-tier cache of finished dictations.
+
+    The exact tier matches the normalized transcript; the optional fuzzy tier
+    accepts the closest entry whose character-trigram similarity reaches
+    `fuzzy_threshold`. Entries expire after `ttl` seconds, the least recently
+    used ones are evicted beyond `max_entries`, and everything is written
+    through to a SQLite file so the cache survives backend restarts. Hits only
+    update last_used in memory; those times reach the file in batches, and before
+    anything is stored or evicted there.
+    """
+
+    def __init__(self, path: str = None, max_entries: int = 256, ttl: float = 86400,
+                 fuzzy_threshold: float = 0.0):
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.fuzzy_threshold = fuzzy_threshold
+        self.hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> CacheEntry, least recently used first
+        self._touched = {}  # key -> last_used not yet written to disk
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._open(path)
+
+    def _open(self, path: str):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, context TEXT, normalized TEXT, optimized TEXT, code TEXT, "
+                "created REAL, last_used REAL)"
+            )
+            rows = self._db.execute(
+                "SELECT key, context, normalized, optimized, code, created, last_used "
+                "FROM responses ORDER BY last_used DESC LIMIT ?", (self.max_entries,)
+            ).fetchall()
+            for row in reversed(rows):
+                self._entries[row[0]] = CacheEntry(*row)
+            self._evict(time.time())
+            logging.info(f"Response cache loaded {len(rows)} entries from {path}")
+        except sqlite3.Error as e:
+            logging.error(f"Response cache could not open {path}, running in memory only: {e}")
+            self._db = None
+
+    def _key(self, context: str, normalized: str) -> str:
+        return hashlib.sha256(f"{context}\n{normalized}".encode()).hexdigest()
+
+    def _expired(self, entry: CacheEntry, now: float) -> bool:
+        return self.ttl > 0 and now - entry.created > self.ttl
+
+    def _drop(self, keys):
+        for key in keys:
+            self._entries.pop(key, None)
+            self._touched.pop(key, None)
+        if self._db is not None and keys:
+            self._db.executemany("DELETE FROM responses WHERE key = ?", [(k,) for k in keys])
+            self._db.commit()
+
+    def _evict(self, now: float):
+        """
+        Drops expired entries and the least recently used ones beyond `max_entries`,
+        from memory and from the SQLite file, including rows that were never loaded.
+        """
+        self._drop([key for key, entry in self._entries.items() if self._expired(entry, now)])
+        overflow = len(self._entries) - self.max_entries
+        if overflow > 0:
+            self._drop(list(self._entries)[:overflow])
+        if self._db is not None:
+            # The disk-side LRU order must see the hits since the last flush
+            self._flush()
+            self._db.execute(
+                "DELETE FROM responses WHERE key NOT IN "
+                "(SELECT key FROM responses ORDER BY last_used DESC LIMIT ?)", (self.max_entries,)
+            )
+            if self.ttl > 0:
+                self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            self._db.commit()
+
+    def _touch(self, entry: CacheEntry, now: float):
+        entry.last_used = now
+        self._entries.move_to_end(entry.key)
+        if self._db is not None:
+            self._touched[entry.key] = now
+            if len(self._touched) >= TOUCH_FLUSH_EVERY:
+                self._flush()
+                self._db.commit()
+
+    def _flush(self):
+        """Writes the pending last_used times; the caller commits."""
+        if self._touched:
+            self._db.executemany("UPDATE responses SET last_used = ? WHERE key = ?",
+                                 [(last_used, key) for key, last_used in self._touched.items()])
+            self._touched.clear()
+
+    def lookup(self, transcript: str, context: str):
+        """
+        Returns (entry, tier) where tier is "exact", "fuzzy" or "miss".
+        """
+        normalized = normalize_transcript(transcript)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(self._key(context, normalized))
+            if entry is not None and self._expired(entry, now):
+                self._drop([entry.key])
+                entry = None
+            if entry is not None:
+                self.hits += 1
+                self._touch(entry, now)
+                return entry, "exact"
+
+            if self.fuzzy_threshold > 0:
+                grams = _ngrams(normalized)
+                best, best_score = None, self.fuzzy_threshold
+                for candidate in self._entries.values():
+                    if candidate.context != context or self._expired(candidate, now):
+                        continue
+                    score = similarity(grams, candidate.grams)
+                    if score >= best_score:
+                        best, best_score = candidate, score
+                if best is not None:
+                    self.fuzzy_hits += 1
+                    self._touch(best, now)
+                    return best, "fuzzy"
+
+            self.misses += 1
+            return None, "miss"
+
+    def store(self, transcript: str, context: str, optimized: str, code: str):
+        normalized = normalize_transcript(transcript)
+        now = time.time()
+        entry = CacheEntry(self._key(context, normalized), context, normalized, optimized, code, now, now)
+        with self._lock:
+            self._entries[entry.key] = entry
+            self._entries.move_to_end(entry.key)
+            if self._db is not None:
+                self._flush()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (entry.key, context, normalized, optimized, code, now, now)
+                )
+                self._db.commit()
+            if len(self._entries) > self.max_entries:
+                self._evict(now)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "fuzzy_hits": self.fuzzy_hits,
+            "misses": self.misses,
+            "entries": len(self._entries)
+        }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._flush()
+                self._db.commit()
+                self._db.close()
+                self._db = None
+
+
+_cache = None
+_cache_options = None
+_cache_lock = threading.Lock()
+
+def get_cache(settings):
+    """
+    Returns the shared response cache configured from settings, or None when disabled.
+    The cache is rebuilt only when one of its own options changes.
+    """
+    global _cache, _cache_options
+    if not settings.get("response_cache_enabled", True):
+        return None
+
+    options = (
+        settings.get("response_cache_path") or DEFAULT_CACHE_PATH,
+        settings.get("response_cache_max_entries", 256),
+        settings.get("response_cache_ttl", 86400),
+        settings.get("response_cache_fuzzy_threshold", 0.0),
+    )
+    with _cache_lock:
+        if options != _cache_options:
+            if _cache is not None:
+                _cache.close()
+            _cache = ResponseCache(*options)
+            _cache_options = options
+        return _cache
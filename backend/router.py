@@ -0,0 +1,328 @@
+import concurrent.futures
+import contextvars
+import itertools
+import logging
+import queue
+import threading
+import time
+
+import llm_client
+from circuit_breaker import breaker_for
+from metrics import registry
+
+log = logging.getLogger("voice2code.router")
+
+ROLES = ("optimizer", "coder")
+HEDGE_QUANTILE = 0.95
+EWMA_ALPHA = 0.3  # Weight of the newest latency in the per-endpoint average
+MAX_HEDGE_THREADS = 8
+
+
+def generate_url(endpoint: str) -> str:
+    """Accepts an Ollama server ("http://box:11434") or its generate endpoint and returns the latter."""
+    endpoint = endpoint.rstrip("/")
+    return endpoint if "/api/" in endpoint else f"{endpoint}/api/generate"
+
+
+class Router:
+    """
+    Spreads the agents' generate requests over several Ollama servers.
+
+    Endpoints come from `ollama_pools` (a list per role, "optimizer" or
+    "coder"), else `ollama_endpoints`, else the single `ollama_endpoint`.
+    Servers whose circuit breaker is open are skipped until their health
+    probe succeeds. Among the rest, `ollama_balancing` picks:
+
+    - "least_outstanding": the one with the fewest requests in flight;
+    - "latency": the lowest moving-average latency for the model, times
+      the requests in flight plus one, so a fast box is preferred until it
+      queues up.
+
+    Ties rotate. With `ollama_hedging`, a non-streamed request that has not
+    finished by its endpoint's p95 latency (at least `ollama_hedge_min_delay`)
+    is duplicated on a second endpoint; the first answer wins and the other
+    is cancelled by closing its stream. A streamed request is hedged the same
+    way on the p95 wait for its first chunk. A request that fails on one
+    endpoint (for a stream, before its first chunk) is retried once on another.
+    """
+
+    def __init__(self):
+        self._outstanding = {}  # url -> requests in flight
+        self._latency = {}  # (url, model, kind) -> moving-average seconds
+        self._lock = threading.Lock()
+        self._turn = itertools.count()
+        self._hedges = concurrent.futures.ThreadPoolExecutor(MAX_HEDGE_THREADS, thread_name_prefix="hedge")
+
+    def endpoints(self, config, role: str = None) -> list:
+        """The generate URLs of a role's pool, or of all pools without a role."""
+        if role is None:
+            return list(dict.fromkeys(url for role in ROLES for url in self.endpoints(config, role)))
+        urls = (config.get("ollama_pools") or {}).get(role)
+        urls = urls or config.get("ollama_endpoints") or ([config.ollama_endpoint] if config.ollama_endpoint else [])
+        return [generate_url(url) for url in urls]
+
+    def available(self, config, role: str = None) -> bool:
+        """False when every endpoint the role could use has an open circuit breaker."""
+        urls = self.endpoints(config, role)
+        return not urls or any(breaker_for(url).allow() for url in urls)
+
+    def pick(self, config, role: str, model: str, kind: str, exclude=()):
+        """
+        Chooses a healthy endpoint and counts the request as outstanding on it.
+        Returns None if there is none; the caller must release() a picked one.
+        """
+        urls = [url for url in self.endpoints(config, role) if url not in exclude and breaker_for(url).allow()]
+        if not urls:
+            return None
+        latency_aware = config.get("ollama_balancing", "least_outstanding") == "latency"
+        turn = next(self._turn)
+        with self._lock:
+            known = [self._latency[key] for key in ((url, model, kind) for url in urls) if key in self._latency]
+            # Unmeasured endpoints are assumed to be faster than the fastest, so each gets tried
+            default = min(known) / 2 if known else 1.0
+
+            def cost(indexed):
+                index, url = indexed
+                outstanding = self._outstanding.get(url, 0)
+                rotation = (index - turn) % len(urls)
+                if latency_aware:
+                    return self._latency.get((url, model, kind), default) * (outstanding + 1), outstanding, rotation
+                return outstanding, rotation
+
+            url = min(enumerate(urls), key=cost)[1]
+            self._outstanding[url] = self._outstanding.get(url, 0) + 1
+        return url
+
+    def release(self, url: str, model: str, kind: str, seconds: float = None):
+        """Ends an outstanding request; `seconds` is its latency if it succeeded."""
+        with self._lock:
+            self._outstanding[url] = max(0, self._outstanding.get(url, 0) - 1)
+            if seconds is not None:
+                previous = self._latency.get((url, model, kind))
+                self._latency[(url, model, kind)] = (
+                    seconds if previous is None else EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * previous)
+
+    def generate(self, config, role: str, payload: dict, timeout: float, agent: str):
+        """Routes a non-streaming generate request. Returns Ollama's response, or None."""
+        model = payload.get("model")
+        url = self.pick(config, role, model, "generate")
+        if url is None:
+            log.warning(f"{agent} skipped: no reachable Ollama endpoint.")
+            return None
+
+        deadline = breaker_for(url).percentile(model, "generate", HEDGE_QUANTILE)
+        if config.get("ollama_hedging", False) and deadline is not None and len(self.endpoints(config, role)) > 1:
+            return self._hedged(config, role, url, payload, timeout, agent,
+                                max(deadline, config.get("ollama_hedge_min_delay", 1)))
+
+        result = self._call(url, payload, timeout, agent)
+        if result is None:
+            other = self.pick(config, role, model, "generate", exclude={url})
+            if other is not None:
+                log.warning(f"{agent} failed on {url}, retrying on {other}")
+                result = self._call(other, payload, timeout, agent)
+        return result
+
+    def stream_generate(self, config, role: str, payload: dict, timeout: float, agent: str):
+        """Routes a streaming generate request and yields its chunks."""
+        model = payload.get("model")
+        url = self.pick(config, role, model, "stream")
+        if url is None:
+            log.warning(f"{agent} skipped: no reachable Ollama endpoint.")
+            return
+
+        deadline = breaker_for(url).percentile(model, "stream", HEDGE_QUANTILE)
+        if config.get("ollama_hedging", False) and deadline is not None and len(self.endpoints(config, role)) > 1:
+            yield from self._hedged_stream(config, role, url, payload, timeout, agent,
+                                           max(deadline, config.get("ollama_hedge_min_delay", 1)))
+            return
+
+        started = False
+        for chunk in self._stream(url, payload, timeout, agent):
+            started = True
+            yield chunk
+        if not started:
+            other = self.pick(config, role, model, "stream", exclude={url})
+            if other is not None:
+                log.warning(f"{agent} failed on {url}, retrying on {other}")
+                yield from self._stream(other, payload, timeout, agent)
+
+    def status(self, config) -> dict:
+        """Per-endpoint breaker state and load, for /health and the HUD."""
+        endpoints = []
+        for url in self.endpoints(config):
+            status = breaker_for(url).status()
+            with self._lock:
+                status["outstanding"] = self._outstanding.get(url, 0)
+            status["pools"] = [role for role in ROLES if url in self.endpoints(config, role)]
+            endpoints.append(status)
+        state = "open" if endpoints and all(e["state"] == "open" for e in endpoints) else "closed"
+        return {"state": state, "balancing": config.get("ollama_balancing", "least_outstanding"),
+                "endpoints": endpoints}
+
+    def _call(self, url: str, payload: dict, timeout: float, agent: str):
+        model = payload.get("model")
+        start = time.perf_counter()
+        result = None
+        try:
+            result = llm_client.generate(url, payload, timeout=timeout, agent=agent)
+        finally:
+            self.release(url, model, "generate", time.perf_counter() - start if result is not None else None)
+        return result
+
+    def _hedged(self, config, role: str, url: str, payload: dict, timeout: float, agent: str, deadline: float):
+        """Runs the request on `url` and, if it misses the deadline, on a second endpoint too."""
+        model = payload.get("model")
+        cancelled = threading.Event()
+        first = self._submit(url, payload, timeout, agent, cancelled)
+        try:
+            result = first.result(timeout=deadline)
+            if result is not None:
+                return result
+        except concurrent.futures.TimeoutError:
+            pass
+
+        other = self.pick(config, role, model, "generate", exclude={url})
+        if other is None:
+            return first.result()
+        late = not first.done()
+        if late:
+            log.info(f"{agent} missed its {deadline:.2f}s p95 on {url}, hedging on {other}")
+        second = self._submit(other, payload, timeout, agent, cancelled)
+        try:
+            for future in concurrent.futures.as_completed([first, second]):
+                result = future.result()
+                if result is not None:
+                    if late:
+                        registry.inc("voice2code_hedged_total", agent=agent,
+                                     winner="hedge" if future is second else "first")
+                    return result
+            return None
+        finally:
+            # The slower request stops at its next chunk
+            cancelled.set()
+
+    def _stream(self, url: str, payload: dict, timeout: float, agent: str):
+        """Streams a request from a picked endpoint and releases it, timed by its first chunk."""
+        model = payload.get("model")
+        start = time.perf_counter()
+        first_chunk = None
+        chunks = llm_client.stream_generate(url, payload, timeout=timeout, agent=agent)
+        try:
+            for chunk in chunks:
+                if first_chunk is None:
+                    first_chunk = time.perf_counter() - start
+                yield chunk
+        finally:
+            chunks.close()
+            self.release(url, model, "stream", first_chunk)
+
+    def _hedged_stream(self, config, role: str, url: str, payload: dict, timeout: float, agent: str,
+                       deadline: float):
+        """
+        Streams from `url` and, if no chunk has arrived by the deadline, from a second
+        endpoint too. The first stream to send a chunk is the one yielded; the other is
+        cancelled. If the only stream fails before its first chunk, it is retried on
+        another endpoint like an unhedged one.
+        """
+        model = payload.get("model")
+        chunks = queue.Queue()  # (stream index, chunk), with chunk None once that stream has ended
+        cancels = [self._pump(0, url, payload, timeout, agent, chunks)]
+        urls, ended, winner, late, wait = [url], set(), None, False, deadline
+        try:
+            while winner is None:
+                try:
+                    index, chunk = chunks.get(timeout=wait)
+                except queue.Empty:
+                    wait = None
+                    other = self.pick(config, role, model, "stream", exclude=set(urls))
+                    if other is not None:
+                        log.info(f"{agent} got no chunk within its {deadline:.2f}s p95 on {url}, hedging on {other}")
+                        late = True
+                        urls.append(other)
+                        cancels.append(self._pump(1, other, payload, timeout, agent, chunks))
+                    continue
+                if chunk is not None:
+                    winner = index
+                    break
+                ended.add(index)
+                if len(ended) < len(cancels):
+                    continue
+                other = None if len(cancels) > 1 else self.pick(config, role, model, "stream", exclude=set(urls))
+                if other is None:
+                    return
+                log.warning(f"{agent} failed on {url}, retrying on {other}")
+                wait = None
+                urls.append(other)
+                cancels.append(self._pump(len(cancels), other, payload, timeout, agent, chunks))
+
+            for index, cancelled in enumerate(cancels):
+                if index != winner:
+                    cancelled.set()
+            if late:
+                registry.inc("voice2code_hedged_total", agent=agent, winner="hedge" if winner else "first")
+            while chunk is not None:
+                yield chunk
+                index, chunk = chunks.get()
+                while index != winner:
+                    index, chunk = chunks.get()
+        finally:
+            # The other streams stop at their next chunk
+            for cancelled in cancels:
+                cancelled.set()
+
+    def _pump(self, index: int, url: str, payload: dict, timeout: float, agent: str, chunks: queue.Queue):
+        """
+        Streams a request on its own thread into `chunks` as (index, chunk) and then
+        (index, None). Returns the event that cancels it at its next chunk.
+        """
+        cancelled = threading.Event()
+
+        def pump():
+            stream = self._stream(url, payload, timeout, agent)
+            try:
+                for chunk in stream:
+                    if cancelled.is_set():
+                        return
+                    chunks.put((index, chunk))
+            finally:
+                stream.close()
+                chunks.put((index, None))
+
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(pump,), name=f"stream-{index}", daemon=True).start()
+        return cancelled
+
+    def _submit(self, url: str, payload: dict, timeout: float, agent: str, cancelled: threading.Event):
+        context = contextvars.copy_context()
+        return self._hedges.submit(context.run, self._collect, url, payload, timeout, agent, cancelled)
+
+    def _collect(self, url: str, payload: dict, timeout: float, agent: str, cancelled: threading.Event):
+        """
+        Streams a request and joins it into the response a non-streaming call returns,
+        so a hedge that loses can be cancelled part-way. Returns None if it failed or was cancelled.
+        """
+        model = payload.get("model")
+        start = time.perf_counter()
+        parts, final = [], None
+        chunks = llm_client.stream_generate(url, dict(payload, stream=True), timeout=timeout, agent=agent)
+        try:
+            for chunk in chunks:
+                if cancelled.is_set():
+                    return None
+                parts.append(chunk.get("response", ""))
+                if chunk.get("done"):
+                    final = chunk
+        finally:
+            chunks.close()
+            seconds = time.perf_counter() - start if final is not None else None
+            self.release(url, model, "generate", seconds)
+        if final is None:
+            return None
+        # Keeps the latencies the hedging deadline is based on up to date
+        breaker_for(url).record_success(model, "generate", seconds)
+        return dict(final, response="".join(parts))
+
+
+# Shared by all agents
+router = Router()
@@ -0,0 +1,337 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+
+from config import get_settings
+from metrics import registry
+from router import router
+
+log = logging.getLogger("voice2code.scheduler")
+
+PRIORITIES = ("interactive", "batch", "background")  # Served in this order
+DEFAULT_DEADLINES = {"interactive": 120, "batch": 0, "background": 0}  # Seconds, 0 = none
+MAX_FINISHED_JOBS = 256  # Finished jobs kept for /jobs/<id>
+FINISHED = ("done", "failed", "cancelled", "expired")
+
+# Job whose pipeline is running in this task or thread
+_current_job = contextvars.ContextVar("voice2code_job", default=None)
+
+
+class JobDeadlineExceeded(Exception):
+    """Raised when a job is still queued or running at its deadline."""
+
+
+class Job:
+    """
+    One pipeline run: its priority and deadline, the stage it is in, how long
+    each stage waited for and held its resource, and its result once finished.
+    """
+
+    def __init__(self, kind: str, priority: str = "interactive", deadline_seconds: float = None, job_id: str = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.kind = kind
+        self.priority = priority
+        self.created = time.time()
+        self.deadline = self.created + deadline_seconds if deadline_seconds else None
+        self.status = "queued"  # queued, running, done, failed, cancelled or expired
+        self.stage = None
+        self.waiting_for = None  # Resource the current stage is queued for
+        self.stages = {}  # stage -> {"resource", "wait", "run"}
+        self.result = None  # (response_body, status_code) once done
+        self.finished = None
+
+    @property
+    def rank(self) -> int:
+        return PRIORITIES.index(self.priority)
+
+    def remaining(self):
+        """Seconds left until the deadline, or None without one."""
+        return None if self.deadline is None else self.deadline - time.time()
+
+    def to_dict(self) -> dict:
+        job = {"id": self.id, "kind": self.kind, "priority": self.priority, "status": self.status,
+               "stage": self.stage, "waiting_for": self.waiting_for, "stages": {name: dict(stage) for name, stage in self.stages.items()},
+               "age": round((self.finished or time.time()) - self.created, 3)}
+        if self.deadline is not None:
+            job["deadline_in"] = round(self.deadline - time.time(), 3)
+        if self.status == "done" and isinstance(self.result, tuple):
+            job["result"], job["http_status"] = self.result
+        return job
+
+
+class _Resource:
+    """
+    The slots of one resource (the whisper workers, or one Ollama model), handed
+    to waiters by priority, then earliest deadline, then arrival. Only touched
+    on the pipeline event loop.
+    """
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.running = 0
+        self._waiters = []  # heap of (priority rank, deadline, arrival, future)
+        self._arrivals = itertools.count()
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for *_, future in self._waiters if not future.done())
+
+    async def acquire(self, rank: int, deadline: float = None):
+        self._wake()
+        if self.running < self.limit:
+            self.running += 1
+            self._publish()
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (rank, deadline if deadline is not None else math.inf, next(self._arrivals), future))
+        self._publish()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as this waiter was cancelled
+                self.release()
+            else:
+                self._publish()
+            raise
+
+    def release(self):
+        self.running -= 1
+        self._wake()
+        self._publish()
+
+    def _wake(self):
+        # Cancelled waiters are dropped on the way
+        while self._waiters and self.running < self.limit:
+            *_, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.running += 1
+                future.set_result(None)
+
+    def _publish(self):
+        registry.set_gauge("voice2code_scheduler_queue_depth", self.queued, resource=self.name)
+        registry.set_gauge("voice2code_scheduler_running", self.running, resource=self.name)
+
+
+class Scheduler:
+    """
+    Stage-level admission for the pipelines on the event loop.
+
+    Each pipeline run is a Job with a priority (interactive before batch before
+    background) and an optional deadline. Its stages (transcribe, optimize,
+    code) each take a slot of the resource they use: "whisper", or
+    "ollama:<model>" per Ollama model. A resource has `scheduler_limits` slots
+    (by resource name, or by kind: "whisper", "ollama"; whisper defaults to
+    `whisper_engine_workers`, an Ollama model to one per endpoint in the router
+    pool of each role that uses it), so dictations queue for a busy model
+    instead of running five generations on one CPU. A job still queued or
+    running at its deadline is cancelled.
+    """
+
+    def __init__(self, max_finished: int = MAX_FINISHED_JOBS):
+        self.max_finished = max_finished
+        self._resources = {}
+        self._jobs = OrderedDict()  # id -> Job, oldest first
+        self._lock = threading.Lock()
+
+    # --- Jobs
+
+    def create_job(self, kind: str, priority: str = "interactive", deadline: float = None, job_id: str = None) -> Job:
+        """
+        Registers a job. `deadline` is in seconds from now; None takes the default
+        for the priority from `scheduler_deadlines`.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority {priority!r}, expected one of {', '.join(PRIORITIES)}")
+        if deadline is None:
+            deadline = {**DEFAULT_DEADLINES, **(get_settings().get("scheduler_deadlines") or {})}.get(priority, 0)
+        job = Job(kind, priority, deadline, job_id)
+        with self._lock:
+            existing = self._jobs.get(job.id)
+            if existing is not None and existing.status not in FINISHED:
+                raise ValueError(f"Job {job.id} is still {existing.status}")
+            self._jobs[job.id] = job
+            self._jobs.move_to_end(job.id)
+        return job
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def active(self) -> list:
+        with self._lock:
+            return [job for job in self._jobs.values() if job.status not in FINISHED]
+
+    def finish(self, job: Job, status: str, result=None):
+        """Marks a job finished; later calls for the same job are ignored."""
+        if job.status in FINISHED:
+            return
+        job.status, job.result, job.finished, job.stage, job.waiting_for = status, result, time.time(), None, None
+        registry.inc("voice2code_jobs_total", kind=job.kind, priority=job.priority, status=status)
+        registry.observe("voice2code_job_seconds", job.finished - job.created, kind=job.kind, priority=job.priority)
+        with self._lock:
+            self._jobs.move_to_end(job.id)
+            finished = [key for key, other in self._jobs.items() if other.status in FINISHED]
+            for key in finished[:max(0, len(finished) - self.max_finished)]:
+                del self._jobs[key]
+
+    async def run(self, job: Job, coro):
+        """
+        Runs a pipeline coroutine as `job` and returns its (response_body, status_code).
+        Raises JobDeadlineExceeded when the deadline passes first.
+        """
+        token = _current_job.set(job)
+        job.status = "running"
+        try:
+            remaining = job.remaining()
+            if remaining is None:
+                result = await coro
+            elif remaining <= 0:
+                coro.close()
+                raise asyncio.TimeoutError()
+            else:
+                result = await asyncio.wait_for(coro, remaining)
+        except asyncio.TimeoutError:
+            if job.remaining() is None or job.remaining() > 0:
+                self.finish(job, "failed")
+                raise
+            self.finish(job, "expired")
+            log.warning(f"Job {job.id} ({job.kind}) missed its deadline in stage {job.stage}")
+            raise JobDeadlineExceeded(f"Job {job.id} missed its deadline") from None
+        except JobDeadlineExceeded:
+            # Raised by hold() in a worker thread
+            self.finish(job, "expired")
+            raise
+        except asyncio.CancelledError:
+            self.finish(job, "cancelled")
+            raise
+        except Exception:
+            self.finish(job, "failed")
+            raise
+        finally:
+            _current_job.reset(token)
+        self.finish(job, "done", result)
+        return result
+
+    # --- Resources
+
+    def limit(self, resource: str) -> int:
+        settings = get_settings()
+        limits = settings.get("scheduler_limits") or {}
+        kind = resource.split(":", 1)[0]
+        if resource in limits:
+            return max(1, int(limits[resource]))
+        if kind in limits:
+            return max(1, int(limits[kind]))
+        if kind == "whisper":
+            return max(1, settings.get("whisper_engine_workers", 1))
+        return max(1, self._ollama_slots(settings, resource.split(":", 1)[-1]))
+
+    @staticmethod
+    def _ollama_slots(settings, model: str) -> int:
+        """One slot per endpoint in the router pool of each role that runs `model`."""
+        roles = {"optimizer": settings.optimizer_model, "coder": settings.ollama_model}
+        return sum(len(router.endpoints(settings, role)) for role, role_model in roles.items() if role_model == model)
+
+    def _resource(self, name: str) -> _Resource:
+        with self._lock:
+            resource = self._resources.get(name)
+            if resource is None:
+                resource = self._resources[name] = _Resource(name, self.limit(name))
+            else:
+                resource.limit = self.limit(name)
+            return resource
+
+    def resources(self) -> dict:
+        with self._lock:
+            return {name: {"limit": r.limit, "running": r.running, "queued": r.queued}
+                    for name, r in sorted(self._resources.items())}
+
+    @staticmethod
+    def _queue(job: Job, stage: str, resource: str):
+        if job is not None:
+            job.stage, job.waiting_for = stage, resource
+
+    def _enter(self, job: Job, stage: str, resource: str, waited: float):
+        registry.observe("voice2code_scheduler_wait_seconds", waited, resource=resource,
+                         priority=job.priority if job else "interactive")
+        if job is not None:
+            job.stage, job.waiting_for = stage, None
+            job.stages[stage] = {"resource": resource, "wait": round(waited, 3), "run": None}
+        return time.perf_counter()
+
+    @staticmethod
+    def _leave(job: Job, stage: str, started: float):
+        if job is not None and stage in job.stages:
+            job.stages[stage]["run"] = round(time.perf_counter() - started, 3)
+
+    @asynccontextmanager
+    async def stage(self, stage: str, resource: str):
+        """
+        Holds a slot of `resource` for the block, on the pipeline event loop. Work
+        outside a job (session windows, direct calls) queues as interactive.
+        """
+        if not get_settings().get("scheduler_enabled", True):
+            yield
+            return
+        job = _current_job.get()
+        slot = self._resource(resource)
+        self._queue(job, stage, resource)
+        queued = time.perf_counter()
+        await slot.acquire(job.rank if job else 0, job.deadline if job else None)
+        started = self._enter(job, stage, resource, time.perf_counter() - queued)
+        try:
+            yield
+        finally:
+            slot.release()
+            self._leave(job, stage, started)
+
+    @contextmanager
+    def hold(self, loop: asyncio.AbstractEventLoop, stage: str, resource: str, job: Job = None):
+        """
+        stage() for code running in a request thread rather than on the loop
+        (the streaming endpoint, Agent 1's worker thread): blocks until a slot is
+        free or the job's deadline passes, which raises JobDeadlineExceeded.
+        `job` defaults to the job of the calling context.
+        """
+        if not get_settings().get("scheduler_enabled", True):
+            yield
+            return
+        job = job or _current_job.get()
+        slot = self._resource(resource)
+        self._queue(job, stage, resource)
+        queued = time.perf_counter()
+        future = asyncio.run_coroutine_threadsafe(
+            slot.acquire(job.rank if job else 0, job.deadline if job else None), loop)
+        remaining = job.remaining() if job else None
+        try:
+            future.result(max(0.0, remaining) if remaining is not None else None)
+        except concurrent.futures.TimeoutError:
+            if not future.cancel():
+                # Acquired at the last moment
+                loop.call_soon_threadsafe(slot.release)
+            raise JobDeadlineExceeded(f"Job {job.id} missed its deadline waiting for {resource}") from None
+        started = self._enter(job, stage, resource, time.perf_counter() - queued)
+        try:
+            yield
+        finally:
+            loop.call_soon_threadsafe(slot.release)
+            self._leave(job, stage, started)
+
+
+def ollama_resource(model: str) -> str:
+    return f"ollama:{model}"
+
+
+# Shared by every pipeline on the event loop
+scheduler = Scheduler()
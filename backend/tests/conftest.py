@@ -0,0 +1,77 @@
+"""
+Shared fixtures for the backend tests
+"""
+
+import sys
+import os
+
+import pytest
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import app as backend
+import fused_agent
+import llm_client
+import ollama_wrapper
+import prompt_optimizer
+import response_cache
+import scheduler
+import transcript_cache
+from circuit_breaker import reset_breakers
+from config import Settings
+
+# Modules of the dictation pipeline that read the settings
+PIPELINE_MODULES = (backend, fused_agent, ollama_wrapper, prompt_optimizer, scheduler)
+
+
+@pytest.fixture(autouse=True)
+def isolated_caches(tmp_path, monkeypatch):
+    """Points the on-disk caches at the test's own directory instead of backend/cache."""
+    monkeypatch.setattr(response_cache, "DEFAULT_CACHE_PATH", str(tmp_path / "cache" / "responses.sqlite3"))
+    monkeypatch.setattr(transcript_cache, "DEFAULT_CACHE_PATH", str(tmp_path / "cache" / "transcripts.sqlite3"))
+
+
+@pytest.fixture(autouse=True)
+def closed_breakers():
+    """Forgets the circuit breakers a test opened, e.g. against an unreachable Ollama."""
+    yield
+    reset_breakers()
+
+
+@pytest.fixture
+def use_settings(monkeypatch):
+    """use_settings(**values) makes the pipeline modules read a settings snapshot of `values` and returns it."""
+    def use(**values):
+        settings = Settings.from_values(values, 1)
+        for module in PIPELINE_MODULES:
+            monkeypatch.setattr(module, "get_settings", lambda: settings)
+        return settings
+    return use
+
+
+@pytest.fixture
+def transcribe_as(monkeypatch):
+    """transcribe_as(text) makes whisper hear `text` in every dictation."""
+    def transcribe(text):
+        async def transcribe_async(path, **kwargs):
+            return text
+        monkeypatch.setattr(backend, "transcribe_async", transcribe_async)
+    return transcribe
+
+
+@pytest.fixture
+def dictate(monkeypatch, transcribe_as):
+    """
+    dictate(text) posts a dictation of `text` to /process-audio, with VAD and the
+    response cache out of the way, and returns the response.
+    """
+    def post(text, **body):
+        transcribe_as(text)
+        monkeypatch.setattr(backend, "get_cache", lambda settings: None)
+        monkeypatch.setattr(backend, "trim_silence", lambda path, samples, timings: (None, False))
+        try:
+            return backend.app.test_client().post('/process-audio', json={"path": "clip.wav", **body})
+        finally:
+            llm_client.close_session()
+    return post
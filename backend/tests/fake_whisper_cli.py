@@ -0,0 +1,63 @@
+"""
+Fake whisper-cli used by the tests and benchmarks in place of whisper-cli.exe
+
+Accepts the same command-line flags. With `--file -` it reads WAV data from
+stdin and prints the transcript; with a file path and `--output-json` it writes
+the <file>.json sidecar the way whisper-cli does. The transcript is picked from
+FAKE_WHISPER_TRANSCRIPTS (a JSON list) by the clip's dominant frequency in 20 Hz
+steps, so a clip keeps its text after the backend resamples, downmixes or trims
+it, and FAKE_WHISPER_DELAY seconds are slept to stand in for model load plus inference.
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import time
+import wave
+
+import numpy as np
+
+DEFAULT_TRANSCRIPTS = ["create a function that adds two numbers"]
+
+
+def pick_transcript(audio: bytes) -> str:
+    transcripts = json.loads(os.environ.get("FAKE_WHISPER_TRANSCRIPTS", "null")) or DEFAULT_TRANSCRIPTS
+    with wave.open(io.BytesIO(audio)) as w:
+        rate, channels = w.getframerate(), w.getnchannels()
+        samples = np.frombuffer(w.readframes(w.getnframes()), dtype="<i2")[::channels].astype(np.float64)
+    if len(samples) < 2:
+        return transcripts[0]
+    spectrum = np.abs(np.fft.rfft(samples))
+    frequency = (np.argmax(spectrum[1:]) + 1) * rate / len(samples)
+    return transcripts[int(round(frequency / 20)) % len(transcripts)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model")
+    parser.add_argument("--file", required=True)
+    parser.add_argument("--language", default="en")
+    parser.add_argument("--output-json", action="store_true")
+    parser.add_argument("--no-timestamps", action="store_true")
+    parser.add_argument("--no-prints", action="store_true")
+    args = parser.parse_args()
+
+    if args.file == "-":
+        audio = sys.stdin.buffer.read()
+    else:
+        with open(args.file, "rb") as f:
+            audio = f.read()
+    if not audio.startswith(b"RIFF"):
+        print("error: input is not a WAV file", file=sys.stderr)
+        sys.exit(1)
+
+    time.sleep(float(os.environ.get("FAKE_WHISPER_DELAY", "0")))
+    text = pick_transcript(audio)
+
+    if args.file != "-" and args.output_json:
+        with open(args.file + ".json", "w", encoding="utf-8") as f:
+            json.dump({"transcription": [{"text": " " + text}]}, f)
+    else:
+        print(" " + text)
@@ -0,0 +1,43 @@
+"""
+Fake whisper.cpp server used by the tests in place of whisper-server.exe
+
+Accepts the same command-line flags, pretends to load the model once at
+startup and answers every /inference request with a fixed transcript.
+"""
+
+import argparse
+import json
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAKE_TRANSCRIPT = "create a function that adds two numbers"
+
+
+class InferenceHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+
+        if self.path != "/inference":
+            self.send_error(404)
+            return
+
+        body = json.dumps({"text": " " + FAKE_TRANSCRIPT, "pid": os.getpid()}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args, _ = parser.parse_known_args()
+
+    ThreadingHTTPServer((args.host, args.port), InferenceHandler).serve_forever()
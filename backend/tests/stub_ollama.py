@@ -0,0 +1,156 @@
+"""
+Stub Ollama server for tests and benchmarks
+
+Serves /api/generate on a local port and answers with a scripted list of
+response tokens, either as a single JSON object or as an NDJSON stream,
+sleeping `request_delay` seconds once per request, `prompt_delay` seconds per
+1000 characters of prompt text (prompt processing; tokens passed back as
+`context` are free) and `token_delay` seconds per token to imitate generation
+speed. Every final response carries a `context` array like Ollama's. Requests with a
+`format` get the tokens wrapped in the fused agent's {"clarified", "code"}
+object unless `structured` is False. GET /api/version answers like Ollama's
+health check. While `down` is set, every request gets a 503.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubOllama:
+    def __init__(self, tokens=None, token_delay: float = 0.0, request_delay: float = 0.0, structured: bool = True,
+                 prompt_delay: float = 0.0):
+        self.tokens = list(tokens or ["print('hello')"])
+        self.token_delay = token_delay
+        self.request_delay = request_delay
+        self.prompt_delay = prompt_delay
+        self.structured = structured
+        self.requests = []
+        self.peers = []
+        self.disconnects = 0
+        self.down = False
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/api/generate"
+
+    def stats(self) -> dict:
+        """The token counts and nanosecond durations Ollama reports on its final response."""
+        eval_ns = int(self.token_delay * len(self.tokens) * 1e9)
+        prompt_ns = int(self.request_delay * 1e9) + 1000
+        return {"eval_count": len(self.tokens), "eval_duration": eval_ns,
+                "prompt_eval_count": 10, "prompt_eval_duration": prompt_ns,
+                "load_duration": 1000, "total_duration": eval_ns + prompt_ns + 1000}
+
+    def prompt_seconds(self, payload: dict) -> float:
+        return self.request_delay + self.prompt_delay * len(payload.get("prompt", "")) / 1000
+
+    @staticmethod
+    def context(payload: dict) -> list:
+        """Stands in for Ollama's token context: the previous context plus one id per prompt word."""
+        words = payload.get("prompt", "").split()
+        return list(payload.get("context") or []) + [len(w) for w in words]
+
+    def response_text(self, payload: dict) -> str:
+        text = "".join(self.tokens)
+        if payload.get("format") and self.structured:
+            return json.dumps({"clarified": payload.get("prompt", "").splitlines()[-1], "code": text})
+        return text
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                if stub.down or self.path != "/api/version":
+                    self._error(503 if stub.down else 404)
+                    return
+                body = b'{"version": "stub"}'
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if stub.down:
+                    self._error(503)
+                    return
+                stub.requests.append(payload)
+                stub.peers.append(self.client_address)
+                if payload.get("stream", True):
+                    self._stream(payload)
+                else:
+                    self._single(payload)
+
+            def _single(self, payload):
+                time.sleep(stub.prompt_seconds(payload) + stub.token_delay * len(stub.tokens))
+                body = json.dumps({
+                    "model": payload.get("model"),
+                    "response": stub.response_text(payload),
+                    "done": True,
+                    "context": stub.context(payload),
+                    **stub.stats()
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _stream(self, payload):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    time.sleep(stub.prompt_seconds(payload))
+                    for token in stub.tokens:
+                        time.sleep(stub.token_delay)
+                        self._write_chunk({"model": payload.get("model"), "response": token, "done": False})
+                    self._write_chunk({"model": payload.get("model"), "response": "", "done": True,
+                                       "context": stub.context(payload), **stub.stats()})
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client hung up mid-stream, which is how Ollama generations are cancelled
+                    stub.disconnects += 1
+
+            def _error(self, status):
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def _write_chunk(self, data):
+                line = json.dumps(data).encode() + b"\n"
+                self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                self.wfile.flush()
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
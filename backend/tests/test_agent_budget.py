@@ -0,0 +1,124 @@
+"""
+Test script for the per-agent latency budgets
+
+Runs the coder and optimizer against a stub Ollama server and checks the
+reasoning switches and stop sequences in the payload, early stop once a code
+block is complete, the wall-time limit (also while waiting for the first
+chunk), and the token report in timings.
+"""
+
+import sys
+import os
+import time
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import agent_budget
+import llm_client
+import ollama_wrapper
+import prompt_optimizer
+from config import Settings, validate
+from metrics import reporting
+from stub_ollama import StubOllama
+
+BLOCK = ["```python\n", "def add(a, b):\n", "    return a + b\n", "```\n"]
+PROSE = ["This function ", "adds two numbers. "] * 20
+
+
+def _use(monkeypatch, stub, **values):
+    settings = Settings.from_values({"ollama_endpoint": stub.url, "ollama_model": "coder",
+                                     "optimizer_model": "optimizer", "language": "python",
+                                     "ollama_prefix_context": False, **values})
+    monkeypatch.setattr(ollama_wrapper, "get_settings", lambda: settings)
+    monkeypatch.setattr(prompt_optimizer, "get_settings", lambda: settings)
+    return settings
+
+
+def test_thinking_and_stop_sequences_in_payload(monkeypatch):
+    with StubOllama(["x = 1"]) as stub:
+        _use(monkeypatch, stub, coder_thinking="off", coder_stop_sequences=True, optimizer_thinking="no_think")
+        assert ollama_wrapper.get_raw_code("make x") == "x = 1"
+        prompt_optimizer.optimize_prompt("make x")
+    llm_client.close_session()
+
+    coder, optimizer = stub.requests
+    assert coder["think"] is False and coder["stream"] is False
+    assert "\n# Example usage" in coder["options"]["stop"]
+    assert "think" not in optimizer and optimizer["prompt"].endswith("\n/no_think")
+    assert "stop" not in optimizer["options"]
+
+
+def test_defaults_leave_payload_alone(monkeypatch):
+    with StubOllama(["x = 1"]) as stub:
+        _use(monkeypatch, stub)
+        ollama_wrapper.get_raw_code("make x")
+    llm_client.close_session()
+    assert "think" not in stub.requests[0] and "stop" not in stub.requests[0]["options"]
+
+
+def test_early_stop_after_code_block(monkeypatch):
+    timings = {}
+    with StubOllama(BLOCK + PROSE, token_delay=0.01) as stub:
+        _use(monkeypatch, stub, coder_early_stop=True, coder_max_tokens=500)
+        with reporting(timings):
+            raw = ollama_wrapper.get_raw_code("add two numbers")
+        time.sleep(0.2)
+    llm_client.close_session()
+
+    assert raw == "".join(BLOCK).strip()
+    assert stub.requests[0]["stream"] is True
+    assert stub.disconnects == 1
+    report = timings["agent2_tokens"]
+    assert report == {"generated": len(BLOCK), "thinking": 0, "budget": 500, "stopped": "block",
+                      "saved": 500 - len(BLOCK)}
+    assert timings["tokens_saved"] == 500 - len(BLOCK)
+
+
+def test_wall_time_limit(monkeypatch):
+    timings = {}
+    with StubOllama(["x = 1\n"] * 100, token_delay=0.02) as stub:
+        _use(monkeypatch, stub, coder_max_seconds=0.2, optimizer_max_seconds=0.2)
+        with reporting(timings):
+            start = time.time()
+            raw = ollama_wrapper.get_raw_code("lots of x")
+            optimized = prompt_optimizer.optimize_prompt("lots of x")
+            elapsed = time.time() - start
+    llm_client.close_session()
+
+    assert raw.startswith("x = 1") and raw.count("x = 1") < 100
+    # A cut-short optimizer answer falls back to the transcript
+    assert optimized == "lots of x"
+    assert elapsed < 1.5
+    assert timings["agent2_tokens"]["stopped"] == "time" and timings["agent1_tokens"]["stopped"] == "time"
+    assert timings["tokens_saved"] > 0
+
+
+def test_wall_time_limit_bounds_the_first_chunk(monkeypatch):
+    monkeypatch.setattr(llm_client, "MAX_RETRIES", 1)
+    with StubOllama(["x = 1"], request_delay=2) as stub:
+        _use(monkeypatch, stub, optimizer_max_seconds=0.2)
+        start = time.time()
+        optimized = prompt_optimizer.optimize_prompt("make x")
+        elapsed = time.time() - start
+    llm_client.close_session()
+    assert optimized == "make x"
+    assert elapsed < 1
+
+
+def test_complete_answer_saves_nothing(monkeypatch):
+    timings = {}
+    with StubOllama(["x = 1"]) as stub:
+        _use(monkeypatch, stub, coder_early_stop=True)
+        with reporting(timings):
+            ollama_wrapper.get_raw_code("make x")
+    llm_client.close_session()
+    assert timings["agent2_tokens"]["stopped"] == "stop" and "tokens_saved" not in timings
+
+
+def test_strip_reasoning_and_settings():
+    assert agent_budget.strip_reasoning("<think>\nhmm\n</think>\nAdd two numbers.").strip() == "Add two numbers."
+    assert agent_budget.strip_reasoning("Add two numbers.<think>unfinished") == "Add two numbers."
+    assert agent_budget.stop_sequences("sql")[0] == "\n-- Example usage"
+    assert validate({"coder_thinking": "off", "coder_max_seconds": 30}) == []
+    assert validate({"coder_thinking": "sometimes"}) and validate({"optimizer_max_seconds": -1})
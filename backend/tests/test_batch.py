@@ -0,0 +1,107 @@
+"""
+Test script for batch processing
+
+Runs a directory of synthetic dictations through /process-batch with the fake
+whisper-cli and a stub Ollama server, and checks the streamed JSON Lines, the
+output file and resuming from it, that each file's transcription holds a
+whisper slot, and that requests cannot reach outside the batch directory.
+"""
+
+import sys
+import os
+import json
+import tempfile
+from contextlib import contextmanager
+
+# Add the backend and benchmarks directories to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+import app as backend
+import batch
+import bench_pipeline
+from stub_ollama import StubOllama
+
+
+def _post(client, **body):
+    response = client.post('/process-batch', json=body)
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_collect_audio_files():
+    with tempfile.TemporaryDirectory() as directory:
+        for name in ("b.wav", "a.WAV", "notes.txt", "c.flac"):
+            open(os.path.join(directory, name), "w").close()
+        files = batch.collect_audio_files([directory, "extra.wav"])
+    assert [os.path.basename(f) for f in files] == ["a.WAV", "b.wav", "c.flac", "extra.wav"]
+
+
+def test_batch_streams_results_and_resumes():
+    with tempfile.TemporaryDirectory() as directory, StubOllama(bench_pipeline.CODE_TOKENS) as stub:
+        clips = bench_pipeline.make_corpus(directory, count=4)
+        output = os.path.join(directory, "results.jsonl")
+        with bench_pipeline.offline_backend(stub.url, concurrency=2, whisper_delay=0,
+                                            overrides={"batch_workers": 2, "batch_base_dir": directory}):
+            client = backend.app.test_client()
+            records = _post(client, directory=directory, output=output)
+            files, summary = records[:-1], records[-1]["summary"]
+
+            assert sorted(r["path"] for r in files) == clips
+            assert all(r["status"] == 200 and r["code"] for r in files), files
+            transcripts = {r["transcript"] for r in files}
+            assert len(transcripts) == 4 and transcripts <= set(bench_pipeline.TRANSCRIPTS)
+            assert all(r["timings"]["whisper"] > 0 for r in files)
+            assert summary["ok"] == 4 and summary["skipped"] == 0 and summary["workers"] == 2
+
+            with open(output) as f:
+                assert len(f.readlines()) == 5
+
+            # Only the file that changed since the first run is redone
+            os.utime(clips[1], ns=(0, 0))
+            requests_before = len(stub.requests)
+            records = _post(client, directory=directory, output=output, resume=True)
+            assert [r["path"] for r in records[:-1]] == [clips[1]]
+            assert records[-1]["summary"]["skipped"] == 3
+            assert len(stub.requests) > requests_before
+
+
+def test_paths_stay_inside_the_batch_directory(tmp_path, use_settings):
+    base = tmp_path / "recordings"
+    base.mkdir()
+    (tmp_path / "outside").mkdir()
+    os.symlink(tmp_path / "outside", base / "link")
+    assert batch.resolve_under(str(base), "day1") == str(base / "day1")
+    for path in ("..", "../outside", str(tmp_path / "outside"), "link/clip.wav", ""):
+        try:
+            batch.resolve_under(str(base), path)
+        except ValueError:
+            continue
+        raise AssertionError(f"{path!r} was accepted")
+
+    use_settings(batch_base_dir=str(base))
+    client = backend.app.test_client()
+    for body in ({"directory": str(tmp_path)}, {"paths": ["a.wav", "../b.wav"]},
+                 {"directory": ".", "output": str(tmp_path / "results.jsonl")}):
+        response = client.post('/process-batch', json=body)
+        assert response.status_code == 400 and response.get_json()["error_type"] == "bad_path"
+    assert not (tmp_path / "results.jsonl").exists()
+
+
+def test_missing_file_is_reported():
+    records = list(batch.run_batch(["does_not_exist.mp3"], lambda text, timings: ({}, 200), workers=1))
+    assert records[0]["status"] == 500 and "not found" in records[0]["error"]
+    assert records[1]["summary"]["failed"] == 1
+
+
+def test_each_transcription_holds_a_slot():
+    held = []
+
+    @contextmanager
+    def slot():
+        held.append(True)
+        yield
+
+    records = list(batch.run_batch(["a.mp3", "b.mp3"], lambda text, timings: ({}, 200), workers=2, slot=slot))
+    assert len(held) == 2 and records[-1]["summary"]["failed"] == 2
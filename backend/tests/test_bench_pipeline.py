@@ -0,0 +1,50 @@
+"""
+Test script for the offline pipeline benchmark
+
+Runs a few dictations through benchmarks/bench_pipeline.py against the fake
+whisper-cli and stub Ollama, and checks the report and the regression gate.
+"""
+
+import sys
+import os
+
+# Add the backend and benchmarks directories to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+import bench_pipeline
+import config
+import whisper_wrapper
+
+
+def test_benchmark_runs_offline_and_reports_stages():
+    settings = config.get_settings()
+    result = bench_pipeline.run(dictations=6, concurrency=2, token_delay=0.001, whisper_delay=0)
+
+    assert result["statuses"] == {"200": 6}
+    assert result["throughput_per_s"] > 0
+    for stage in ("pipeline", "pipeline/vad", "pipeline/whisper/model", "pipeline/agent2/http"):
+        assert result["stages"][stage]["count"] == 6
+    # The hedged transcripts in the corpus go through Agent 1 as well
+    assert result["ollama"]["requests"] > 6
+    assert result["ollama"]["eval_tokens"] == result["ollama"]["requests"] * len(bench_pipeline.CODE_TOKENS)
+    # The backend is put back the way it was
+    assert config.get_settings() is settings and whisper_wrapper._engine is None
+
+
+def test_regression_gate():
+    baseline = {"throughput_per_s": 10.0, "stages": {"pipeline/whisper": {"p95_ms": 100.0}}}
+    same = {"throughput_per_s": 9.5, "stages": {"pipeline/whisper": {"p95_ms": 110.0}}}
+    slower = {"throughput_per_s": 5.0, "stages": {"pipeline/whisper": {"p95_ms": 200.0}}}
+    assert bench_pipeline.compare(same, baseline) == []
+    assert len(bench_pipeline.compare(slower, baseline)) == 2
+
+
+def test_transcript_cache_skips_whisper_for_repeated_clips():
+    result = bench_pipeline.run(dictations=12, concurrency=1, token_delay=0, whisper_delay=0,
+                                settings={"transcript_cache_enabled": True})
+
+    assert result["statuses"] == {"200": 12}
+    # The unmeasured warm-up dictation already cached the first of the six clips
+    assert result["transcript_cache"] == {"hit": 7, "miss": 5}
+    assert result["stages"]["pipeline/whisper/model"]["count"] == 5
@@ -0,0 +1,107 @@
+"""
+Test script for multi-candidate code generation
+
+Covers the syntax checkers, the seed and temperature spread, picking the first
+valid candidate over a faster broken one and cancelling the rest, the fallback
+when none is valid, and checks that /process-audio sends one streamed request
+per candidate to a stub Ollama server.
+"""
+
+import sys
+import os
+import time
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import app as backend
+import candidates
+from config import Settings
+from stub_ollama import StubOllama
+
+
+def _fake_generation(monkeypatch, answers):
+    """
+    Replaces get_raw_code_cancellable() so candidate i answers answers[i] = (delay, code),
+    and returns the list of candidates that saw the cancellation.
+    """
+    cancelled_early = []
+
+    def generate(prompt, cancelled, options):
+        delay, code = answers[options["seed"]]
+        if cancelled.wait(delay):
+            cancelled_early.append(options["seed"])
+            return None
+        return code
+
+    monkeypatch.setattr(candidates.random, "randrange", lambda stop: 0)
+    monkeypatch.setattr(candidates, "get_raw_code_cancellable", generate)
+    return cancelled_early
+
+
+def test_python_checker_accepts_fragments_and_rejects_broken_code():
+    assert candidates.check_python("def add(a, b):\n    return a + b") is None
+    assert candidates.check_python("return total") is None
+    assert candidates.check_python("def add(a, b)\n    return a + b").startswith("line 1:")
+    assert candidates.check_json('{"a": [1, 2]}') is None
+    assert candidates.check_json('{"a": [1, 2}') is not None
+
+
+def test_sampling_options_step_around_the_coder_temperature():
+    settings = Settings.from_values({"coder_temperature": 0.2, "coder_candidate_temperature_spread": 0.3}, 1)
+    options = candidates.sampling_options(settings, 4, seed=100)
+    assert [o["temperature"] for o in options] == [0.2, 0.5, 0.0, 0.8]
+    assert [o["seed"] for o in options] == [100, 101, 102, 103]
+
+
+def test_first_valid_candidate_wins_and_the_rest_are_cancelled(monkeypatch):
+    cancelled_early = _fake_generation(monkeypatch, [
+        (0.01, "def add(a, b)\n    return a + b"),  # Fastest, but broken
+        (0.05, "def add(a, b):\n    return a + b"),
+        (5.0, "def add(a, b):\n    return b + a"),
+    ])
+    settings = Settings.from_values({"coder_candidates": 3, "language": "python"}, 1)
+
+    start = time.time()
+    raw_code, report = candidates.generate("add two numbers", settings)
+    assert time.time() - start < 1
+    assert raw_code == "def add(a, b):\n    return a + b"
+    assert report == {"count": 3, "checked": True, "valid": 1, "invalid": 1, "failed": 0, "cancelled": 1, "chosen": 1}
+    time.sleep(0.05)
+    assert cancelled_early == [2]
+
+
+def test_falls_back_to_the_first_answer_when_none_is_valid(monkeypatch):
+    _fake_generation(monkeypatch, [(0.05, "print(("), (0.01, "x = [1,"), (0.02, "")])
+    settings = Settings.from_values({"coder_candidates": 3, "language": "python"}, 1)
+
+    raw_code, report = candidates.generate("make a list", settings)
+    assert raw_code == "x = [1,"
+    assert report["chosen"] == 1 and report["invalid"] == 2 and report["failed"] == 1
+
+
+def test_registered_checker_validates_other_languages(monkeypatch):
+    _fake_generation(monkeypatch, [(0.01, "SELECT * FROM"), (0.03, "SELECT * FROM users;")])
+    monkeypatch.setattr(candidates, "CHECKERS", dict(candidates.CHECKERS))
+    candidates.register_checker("SQL", lambda code: None if code.endswith(";") else "missing semicolon")
+    settings = Settings.from_values({"coder_candidates": 2, "language": "sql"}, 1)
+
+    raw_code, report = candidates.generate("select every user", settings)
+    assert raw_code == "SELECT * FROM users;"
+    assert report["checked"] and report["chosen"] == 1
+
+
+def test_process_audio_generates_candidates(monkeypatch, use_settings, dictate):
+    with StubOllama(["def add(a, b):", "\n    return a + b"], token_delay=0.05) as stub:
+        use_settings(ollama_endpoint=stub.url, ollama_model="coder", language="python", coder_candidates=3,
+                     coder_temperature=0.4, optimizer_skip_enabled=False)
+        monkeypatch.setattr(backend, "optimize_prompt", lambda text: "Write a function that adds two numbers.")
+        response = dictate("a function that adds two numbers")
+        body = response.get_json()
+
+    assert response.status_code == 200, body
+    assert body["code"] == "def add(a, b):\n    return a + b"
+    assert body["timings"]["candidates"]["valid"] == 1
+    assert len(stub.requests) == 3 and all(r["stream"] for r in stub.requests)
+    assert sorted(r["options"]["temperature"] for r in stub.requests) == [0.2, 0.4, 0.6]
+    assert len({r["options"]["seed"] for r in stub.requests}) == 3
@@ -0,0 +1,114 @@
+"""
+Test script for the Ollama circuit breaker
+
+Checks against a stub Ollama server that repeated outages open the breaker,
+that requests and dictations then fail fast with the transcript only, that
+the health probe closes it again, and that the adaptive timeout notices a
+stuck server in a fraction of the configured timeout.
+"""
+
+import sys
+import os
+import socket
+import time
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import app as backend
+import circuit_breaker
+import llm_client
+from config import Settings
+from stub_ollama import StubOllama
+
+
+def _settings(monkeypatch, endpoint, **values):
+    settings = Settings.from_values({"ollama_endpoint": endpoint, "ollama_model": "coder",
+                                     "ollama_breaker_failures": 2, "ollama_breaker_probe_interval": 0.1,
+                                     "ollama_timeout_min": 0.2, **values})
+    monkeypatch.setattr(circuit_breaker, "get_settings", lambda: settings)
+    monkeypatch.setattr(backend, "get_settings", lambda: settings)
+    monkeypatch.setattr(llm_client, "RETRY_DELAY", 0.01)
+    return settings
+
+
+def _closed_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_refused_connections_open_the_breaker(monkeypatch):
+    endpoint = f"http://127.0.0.1:{_closed_port()}/api/generate"
+    _settings(monkeypatch, endpoint, ollama_breaker_probe_interval=60)
+    payload = {"model": "coder", "prompt": "x", "stream": False}
+
+    assert llm_client.generate(endpoint, payload, timeout=30, agent="Coder Agent") is None
+    breaker = circuit_breaker.breaker_for(endpoint)
+    assert breaker.state == circuit_breaker.OPEN and breaker.trips == 1
+
+    # Open: no connection attempt, no retry sleeps
+    start = time.time()
+    assert llm_client.generate(endpoint, payload, timeout=30, agent="Coder Agent") is None
+    assert list(llm_client.stream_generate(endpoint, payload, timeout=30, agent="Coder Agent")) == []
+    assert time.time() - start < 0.05
+
+    # The dictation returns its transcript at once
+    result = backend.get_runner().submit(backend.code_from_transcript("make x one", {}, time.time())).result()
+    body, status = result
+    assert status == 503 and body["error_type"] == "ollama_unavailable"
+    assert body["transcript"] == "make x one" and body["ollama"]["state"] == "open"
+
+    health = backend.app.test_client().get('/health').get_json()
+    assert health["ollama"]["state"] == "open" and health["ollama"]["endpoints"][0]["url"] == breaker.url
+
+
+def test_probe_closes_the_breaker(monkeypatch):
+    with StubOllama(["x = 1"]) as stub:
+        _settings(monkeypatch, stub.url)
+        payload = {"model": "coder", "prompt": "x", "stream": False}
+        stub.down = True
+        assert llm_client.generate(stub.url, payload, timeout=5, agent="Coder Agent") is None
+        breaker = circuit_breaker.breaker_for(stub.url)
+        assert breaker.state == circuit_breaker.OPEN and len(stub.requests) == 0
+
+        stub.down = False
+        deadline = time.time() + 2
+        while breaker.state == circuit_breaker.OPEN and time.time() < deadline:
+            time.sleep(0.05)
+        assert breaker.state == circuit_breaker.CLOSED
+        assert llm_client.generate(stub.url, payload, timeout=5, agent="Coder Agent")["response"] == "x = 1"
+    llm_client.close_session()
+
+
+def test_adaptive_timeout_detects_a_stuck_server(monkeypatch):
+    with StubOllama(["x = 1"]) as stub:
+        _settings(monkeypatch, stub.url, ollama_breaker_failures=3, ollama_breaker_probe_interval=60)
+        payload = {"model": "coder", "prompt": "x", "stream": False}
+        breaker = circuit_breaker.breaker_for(stub.url)
+        for _ in range(circuit_breaker.MIN_SAMPLES):
+            assert llm_client.generate(stub.url, payload, timeout=30, agent="Coder Agent") is not None
+        assert breaker.timeout("coder", "generate", 30) == 0.2
+        assert breaker.status()["timeouts"] == {"coder/generate": 0.2}
+
+        stub.request_delay = 5
+        start = time.time()
+        assert llm_client.generate(stub.url, payload, timeout=30, agent="Coder Agent") is None
+        # 0.2 + 0.4 + 0.8s instead of 3 x 30s
+        assert time.time() - start < 3
+        assert breaker.state == circuit_breaker.OPEN
+    llm_client.close_session()
+
+
+def test_adaptive_timeout_bounds(monkeypatch):
+    _settings(monkeypatch, "http://unused/api/generate", ollama_timeout_multiplier=3, ollama_timeout_min=1)
+    breaker = circuit_breaker.CircuitBreaker("http://unused")
+    assert breaker.timeout("coder", "stream", 30) == 30
+    for seconds in [0.5] * 9 + [2.0]:
+        breaker.record_success("coder", "stream", seconds)
+    assert breaker.timeout("coder", "stream", 30) == 6.0
+    assert breaker.timeout("coder", "stream", 4) == 4
+    for _ in range(circuit_breaker.LATENCY_WINDOW):
+        breaker.record_success("coder", "stream", 0.01)
+    assert breaker.timeout("coder", "stream", 30) == 1
+    assert circuit_breaker.base_url("http://localhost:11434/api/generate") == "http://localhost:11434"
@@ -0,0 +1,109 @@
+"""
+Test script for the code extractor
+
+Besides fixed cases, builds seeded random LLM answers out of reasoning blocks,
+prose and fenced blocks in several languages, where the expected code is known
+by construction, and checks that extraction finds it however the answer is
+split into streamed chunks.
+"""
+
+import sys
+import os
+import random
+
+# Add the backend and benchmarks directories to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from code_extractor import CodeExtractor, extract_code, normalize_language
+
+CODE_LINES = ["def add(a, b):", "    return a + b", "x = [1, 2, 3]", "for i in range(3):", "    print(f'<{i}>')",
+              "s = '``' + 'a'", "if x:", "        pass", "", "# comment: ``` not a fence"]
+PROSE = ["Here is the code:", "Sure! This should work.", "Let me know if you need anything else.",
+         "Note: run it with python3."]
+THOUGHTS = ["The user wants a function.", "Maybe use a loop?\nNo, a comprehension.", ""]
+
+
+def _stream(text: str, language: str, rng: random.Random) -> str:
+    extractor = CodeExtractor(language)
+    out, i = [], 0
+    while i < len(text):
+        step = rng.randint(1, 12)
+        out.append(extractor.feed(text[i:i + step]))
+        i += step
+    out.append(extractor.finish())
+    return "".join(out)
+
+
+def _code(rng: random.Random) -> str:
+    lines = [rng.choice(CODE_LINES) for _ in range(rng.randint(1, 6))]
+    lines[0] = lines[0] or "x = 0"  # Code never starts or ends with a blank line
+    lines[-1] = lines[-1] or "x = 0"
+    return "\n".join(lines)
+
+
+def _answer(rng: random.Random):
+    """Returns (answer, expected code) for a random answer in one of the shapes models produce."""
+    parts = []
+    if rng.random() < 0.4:
+        parts.append(f"<think>\n{rng.choice(THOUGHTS)}\n</think>\n")
+    code = _code(rng)
+    shape = rng.choice(["plain", "fenced", "prose", "other_first", "only_other"])
+    if shape == "plain":
+        parts.append(code + rng.choice(["", "\n", "\n```", "```\n"]))
+        return "".join(parts), code.strip()
+    if shape != "fenced":
+        parts.append(rng.choice(PROSE) + "\n" * rng.randint(1, 2))
+    if shape in ("other_first", "only_other"):
+        parts.append(f"```bash\npip install thing\n```\n{rng.choice(PROSE)}\n")
+        if shape == "only_other":
+            return "".join(parts), "pip install thing"
+    parts.append(f"```{rng.choice(['python', 'py', 'Python3', ''])}\n{code}\n```")
+    if rng.random() < 0.5:
+        parts.append(f"\n{rng.choice(PROSE)}\n```js\nconsole.log(1)\n```\n")
+    return "".join(parts), code.strip()
+
+
+def test_random_answers_in_random_chunks():
+    rng = random.Random(2024)
+    for _ in range(500):
+        answer, expected = _answer(rng)
+        assert extract_code(answer, "python") == expected, answer
+        for _ in range(5):
+            assert _stream(answer, "python", rng) == expected, answer
+
+
+def test_picks_block_in_configured_language():
+    answer = "Install it first:\n```sh\nnpm i left-pad\n```\nThen:\n```js\nleftPad('a', 3)\n```\n```python\nx = 1\n```"
+    assert extract_code(answer, "javascript") == "leftPad('a', 3)"
+    assert extract_code(answer, "python") == "x = 1"
+    # No block matches: the first one is used
+    assert extract_code(answer, "rust") == "npm i left-pad"
+    assert normalize_language("Python3 title=demo") == "python"
+
+
+def test_reasoning_is_dropped():
+    assert extract_code("<think>\nUse ```python``` maybe\n</think>\nx = 1") == "x = 1"
+    assert extract_code("x = 1\n<think>second thoughts") == "x = 1"
+    assert extract_code("<think>never finished") == ""
+
+
+def test_done_after_the_chosen_block():
+    extractor = CodeExtractor("python")
+    assert extractor.feed("```python\nx = 1\n") == "x = 1"
+    assert not extractor.done
+    extractor.feed("```\nThis explains it.")
+    assert extractor.done
+    assert extractor.feed("more prose") == "" and extractor.finish() == ""
+
+
+def test_unfenced_code_streams_without_waiting_for_the_end():
+    extractor = CodeExtractor("python")
+    streamed = "".join(extractor.feed(line + "\n") for line in ["import os", "import sys", "print(os.sep)", "x = 1"])
+    assert streamed.startswith("import os\nimport sys\nprint(os.sep)")
+
+
+def test_benchmark_smoke():
+    import bench_code_extractor
+    result = bench_code_extractor.run(size=20_000, repeats=1)
+    assert result["mb_per_s"]["one_shot"] > 0 and result["mb_per_s"]["streamed"] > 0
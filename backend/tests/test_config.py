@@ -0,0 +1,73 @@
+"""
+Test script for the cached configuration layer
+
+Checks that settings are parsed once, reloaded only when a file changes,
+and that an invalid edit is rejected at reload time.
+"""
+
+import sys
+import os
+import json
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import config
+from config import SettingsStore, Settings
+
+
+def _write(path, data, mtime_ns):
+    path.write_text(json.dumps(data))
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_settings_cached_until_file_changes(tmp_path):
+    _write(tmp_path / "paths.json", {"ollama_endpoint": "http://localhost:11434/api/generate"}, 1_000_000_000)
+    _write(tmp_path / "settings.json", {"language": "python", "coder_prompt": "Write {language} code."}, 1_000_000_000)
+    store = SettingsStore(str(tmp_path))
+
+    first = store.get()
+    assert store.get() is first
+    assert first.prompt("coder_prompt") == "Write Python code."
+    assert first.ollama_endpoint == "http://localhost:11434/api/generate"
+
+    _write(tmp_path / "settings.json", {"language": "rust", "coder_prompt": "Write {language} code."}, 2_000_000_000)
+    second = store.get()
+    assert second.version == first.version + 1
+    assert second.prompt("coder_prompt") == "Write Rust code."
+
+
+def test_invalid_reload_keeps_previous_settings(tmp_path):
+    _write(tmp_path / "settings.json", {"coder_temperature": 0.2}, 1_000_000_000)
+    store = SettingsStore(str(tmp_path))
+    good = store.get()
+
+    _write(tmp_path / "settings.json", {"coder_temperature": "hot"}, 2_000_000_000)
+    assert store.get() is good
+
+    (tmp_path / "settings.json").write_text("{not json")
+    os.utime(tmp_path / "settings.json", ns=(3_000_000_000, 3_000_000_000))
+    assert store.get() is good
+
+
+def test_validate_reports_types_and_ranges():
+    problems = config.validate({"coder_max_tokens": 0, "optimizer_top_p": 1.5, "whisper_engine_enabled": "yes",
+                                "coder_top_k": True, "unknown_key": object()})
+    assert len(problems) == 4
+
+
+def test_validate_reports_unknown_choices():
+    assert config.validate({"pipeline_mode": "fused", "log_level": "debug"}) == []
+    assert len(config.validate({"pipeline_mode": "three_agent"})) == 1
+
+
+def test_settings_are_immutable():
+    settings = Settings.from_values({"language": "python"})
+    try:
+        settings.values["language"] = "go"
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("settings values should be read-only")
+    assert settings.optimizer_model == "gemma3:1b"
+    assert settings.prompt("optimizer_prompt") == config.DEFAULT_OPTIMIZER_PROMPT
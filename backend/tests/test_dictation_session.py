@@ -0,0 +1,116 @@
+"""
+Test script for incremental dictation sessions
+
+Checks transcript stitching across overlapping windows, and drives
+/session/start, /session/chunk and /session/finish with a fake whisper that
+"hears" one word per half second of audio, so each window's transcript is known.
+Also checks that chunks are only joined per window and that the session store
+drops idle sessions on lookup and caps how many are open.
+"""
+
+import sys
+import os
+import time
+
+import numpy as np
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import app as backend
+import dictation_session
+from config import Settings
+from dictation_session import DictationSession, SessionStore, stitch
+
+WORDS = "create a function called average that takes a list of numbers and returns their mean".split()
+WORD_SAMPLES = 8000  # Half a second at 16 kHz
+
+
+def test_stitch_removes_repeated_words():
+    assert stitch("create a function called", "function called average that") == "create a function called average that"
+    assert stitch("", "hello there") == "hello there"
+    assert stitch("hello there", "") == "hello there"
+    # Punctuation and case differ between windows
+    assert stitch("Create a function.", "a function, called average") == "Create a function, called average"
+
+
+def test_stitch_tolerates_words_cut_at_the_window_edges():
+    # The previous window heard "aver" of "average"; the next one opens with a fragment of "called"
+    assert stitch("a function called aver", "led average that takes") == "a function called average that takes"
+    # A single short word must match exactly
+    assert stitch("takes a", "apple pie") == "takes a apple pie"
+
+
+def _speech():
+    """Audio whose sample values encode which word is being "said"."""
+    return np.repeat(np.arange(1, len(WORDS) + 1, dtype=np.float32) / 100, WORD_SAMPLES)
+
+
+def _fake_whisper(calls):
+    async def transcribe(samples):
+        calls.append(len(samples))
+        indices = sorted(set(np.round(samples * 100).astype(int)))
+        return " ".join(WORDS[i - 1] for i in indices if i > 0)
+    return transcribe
+
+
+def _wait_for_catch_up(session):
+    deadline = time.time() + 5
+    while session._catching_up and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_session_transcribes_while_recording(monkeypatch):
+    settings = Settings.from_values({"session_window_ms": 2000, "session_overlap_ms": 500, "vad_enabled": False})
+    monkeypatch.setattr(backend, "get_settings", lambda: settings)
+    calls = []
+    monkeypatch.setattr(dictation_session, "transcribe_pcm_async", _fake_whisper(calls))
+
+    async def fake_code(transcribed_text, timings, pipeline_start_time):
+        return {"transcript": transcribed_text, "timings": timings}, 200
+
+    monkeypatch.setattr(backend, "code_from_transcript", fake_code)
+    client = backend.app.test_client()
+    session_id = client.post('/session/start').get_json()["session_id"]
+
+    audio = (_speech() * 32767).astype("<i2")
+    chunks = np.array_split(audio, 10)
+    headers = {"X-Session-Id": session_id, "Content-Type": "audio/L16; rate=16000; channels=1"}
+    for chunk in chunks[:-1]:
+        response = client.post('/session/chunk', data=chunk.tobytes(), headers=headers)
+        assert response.status_code == 200
+        # Stands in for the time the user keeps talking
+        _wait_for_catch_up(dictation_session.sessions.get(session_id))
+
+    # A chunk without audio just reports the partial transcript
+    partial = client.post('/session/chunk', headers={"X-Session-Id": session_id}).get_json()
+    assert partial["windows"] >= 2
+    assert " ".join(WORDS).startswith(partial["partial"])
+
+    response = client.post('/session/finish', data=chunks[-1].tobytes(), headers=headers)
+    body = response.get_json()
+    assert response.status_code == 200, body
+    assert body["transcript"] == " ".join(WORDS)
+    assert body["timings"]["session_windows"] == len(calls)
+    # After release only the audio past the last window (plus the overlap) was decoded
+    assert calls[-1] < len(audio) / 2
+    assert client.post('/session/chunk', data=b"\0\0", headers=headers).status_code == 404
+
+
+def test_chunks_are_joined_per_window_not_per_chunk():
+    session = DictationSession(window_ms=1000, overlap_ms=0)
+    for _ in range(3):
+        assert not session.add(np.zeros(4000, dtype=np.float32))
+    assert session.buffered_seconds == 0.75 and len(session._samples) == 0
+    assert session.add(np.zeros(4000, dtype=np.float32))
+
+
+def test_session_store_evicts_idle_sessions_and_caps_the_count():
+    store = SessionStore(max_sessions=2)
+    idle = store.start(4000, 1000, idle_timeout=60)
+    idle.last_used -= 120
+    assert store.get(idle.id) is None
+
+    first, second, third = (store.start(4000, 1000, idle_timeout=60) for _ in range(3))
+    assert store.get(first.id) is None
+    assert store.get(second.id) is second and store.pop(third.id) is third
@@ -0,0 +1,52 @@
+"""
+Test script for the fused single-call agent
+
+Checks parsing of the structured {"clarified", "code"} answer, that the fused
+mode makes one Ollama request with a JSON format, and that an unparseable
+answer falls back to the two-agent pipeline.
+"""
+
+import sys
+import os
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import fused_agent
+from fused_agent import parse_fused_response
+from stub_ollama import StubOllama
+
+HEDGED = "um so I think maybe a function that adds two numbers"
+
+
+def test_parse_fused_response():
+    assert parse_fused_response('{"clarified": " Add a and b. ", "code": "a + b"}') == ("Add a and b.", "a + b")
+    assert parse_fused_response('{"code": "x = 1"}') == ("", "x = 1")
+    assert parse_fused_response('{"clarified": "x", "code": "  "}') is None
+    assert parse_fused_response('["x = 1"]') is None
+    assert parse_fused_response("x = 1") is None
+    assert parse_fused_response(None) is None
+
+
+def _run(use_settings, dictate, stub):
+    use_settings(ollama_endpoint=stub.url, ollama_model="coder", optimizer_model="optimizer", pipeline_mode="fused")
+    response = dictate(HEDGED)
+    return response.status_code, response.get_json()
+
+
+def test_fused_mode_makes_one_request(use_settings, dictate):
+    with StubOllama(["def add(a, b):\n", "    return a + b"]) as stub:
+        status, body = _run(use_settings, dictate, stub)
+    assert status == 200, body
+    assert body["pipeline_mode"] == "fused" and "fused" in body["timings"]
+    assert body["code"] == "def add(a, b):\n    return a + b"
+    assert len(stub.requests) == 1
+    assert stub.requests[0]["model"] == "coder" and stub.requests[0]["format"] == fused_agent.FUSED_FORMAT
+
+
+def test_invalid_json_falls_back_to_two_agents(use_settings, dictate):
+    with StubOllama(["x = 1"], structured=False) as stub:
+        status, body = _run(use_settings, dictate, stub)
+    assert status == 200, body
+    assert body["pipeline_mode"] == "two_agent" and body["code"] == "x = 1"
+    assert [p["model"] for p in stub.requests] == ["coder", "optimizer", "coder"]
@@ -0,0 +1,43 @@
+"""
+Test script for the shared LLM client
+
+Checks against a stub Ollama server that both agents reuse one pooled
+connection, send keep_alive, and use per-model timeouts.
+"""
+
+import sys
+import os
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import llm_client
+import ollama_wrapper
+import prompt_optimizer
+from config import Settings
+from stub_ollama import StubOllama
+
+
+def test_agents_share_one_keep_alive_connection(monkeypatch):
+    llm_client.close_session()
+    with StubOllama(["x = 1"]) as stub:
+        settings = Settings.from_values({"ollama_endpoint": stub.url, "ollama_model": "coder",
+                                         "optimizer_model": "optimizer", "ollama_keep_alive": "10m"})
+        monkeypatch.setattr(ollama_wrapper, "get_settings", lambda: settings)
+        monkeypatch.setattr(prompt_optimizer, "get_settings", lambda: settings)
+
+        assert prompt_optimizer.optimize_prompt("set x to one") == "x = 1"
+        assert ollama_wrapper.get_raw_code("set x to one") == "x = 1"
+        assert ollama_wrapper.get_raw_code("set x to one") == "x = 1"
+
+    assert len(set(stub.peers)) == 1
+    assert [p["model"] for p in stub.requests] == ["optimizer", "coder", "coder"]
+    assert all(p["keep_alive"] == "10m" for p in stub.requests)
+    llm_client.close_session()
+
+
+def test_model_timeout_lookup():
+    config = {"ollama_timeout": 20, "ollama_timeouts": {"qwen3:1.7b": 45}}
+    assert llm_client.model_timeout(config, "qwen3:1.7b") == 45
+    assert llm_client.model_timeout(config, "gemma3:1b") == 20
+    assert llm_client.model_timeout({}, "gemma3:1b") == llm_client.DEFAULT_TIMEOUT
@@ -1,48 +1,27 @@
 """
-Quick test for the markdown stripping function
+Quick test for the markdown stripping done by code_extractor
 """
 
-def strip_markdown_code_blocks(code: str) -> str:
-    """
-    Strips markdown code block formatting from generated code.
-    Removes ```language and ``` delimiters.
-    """
-    code = code.strip()
-    
-    # Remove opening code block with language specifier (e.g., ```python, ```javascript)
-    if code.startswith('```'):
-        # Find the first newline after the opening ```
-        first_newline = code.find('\n')
-        if first_newline != -1:
-            code = code[first_newline + 1:]
-    
-    # Remove closing code block
-    if code.endswith('```'):
-        code = code[:-3]
-    
-    return code.strip()
-
-# Test cases
-test1 = """```python
-print("Hello, World!")
-```"""
+import sys
+import os
 
-test2 = """```javascript
-console.log("Hello, World!");
-```"""
+# Add the backend directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-test3 = """print("Already clean")"""
+from code_extractor import extract_code
 
-print("Test 1 - Python with markdown:")
-print(f"Input:\n{test1}")
-print(f"\nOutput:\n{strip_markdown_code_blocks(test1)}")
-print("\n" + "="*50 + "\n")
 
-print("Test 2 - JavaScript with markdown:")
-print(f"Input:\n{test2}")
-print(f"\nOutput:\n{strip_markdown_code_blocks(test2)}")
-print("\n" + "="*50 + "\n")
+def test_python_with_markdown():
+    assert extract_code("""```python
+print("Hello, World!")
+```""") == 'print("Hello, World!")'
+
+
+def test_javascript_with_markdown():
+    assert extract_code("""```javascript
+console.log("Hello, World!");
+```""") == 'console.log("Hello, World!");'
+
 
-print("Test 3 - Already clean:")
-print(f"Input:\n{test3}")
-print(f"\nOutput:\n{strip_markdown_code_blocks(test3)}")
+def test_already_clean():
+    assert extract_code("""print("Already clean")""") == 'print("Already clean")'
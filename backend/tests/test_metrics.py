@@ -0,0 +1,97 @@
+"""
+Test script for pipeline instrumentation
+
+Checks the rolling percentiles, nested span names, Ollama statistics from a
+stub server, and the Prometheus text served at /metrics.
+"""
+
+import sys
+import os
+import asyncio
+import logging
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import app as backend
+import llm_client
+import metrics
+from metrics import RollingHistogram, MetricsRegistry, STAGE_SECONDS, registry, span
+from stub_ollama import StubOllama
+
+
+def test_rolling_percentiles_use_only_the_window():
+    histogram = RollingHistogram(window=100)
+    for value in range(1000):
+        histogram.observe(value)
+    p = histogram.percentiles()
+    assert p[0.5] == 949 and p[0.95] == 994 and p[0.99] == 998
+    assert histogram.count == 1000 and histogram.total == sum(range(1000))
+
+
+def test_nested_spans_follow_into_threads():
+    registry.reset()
+
+    def work():
+        with span("inner"):
+            pass
+
+    async def pipeline():
+        with span("outer"):
+            await asyncio.to_thread(work)
+
+    asyncio.run(pipeline())
+    assert registry.histogram(STAGE_SECONDS, stage="outer/inner").count == 1
+    assert registry.histogram(STAGE_SECONDS, stage="outer").count == 1
+    assert registry.histogram(STAGE_SECONDS, stage="inner") is None
+
+
+def test_ollama_statistics_are_recorded():
+    registry.reset()
+    llm_client.close_session()
+    with StubOllama(["a", "b", "c"], token_delay=0.01) as stub:
+        payload = {"model": "coder", "prompt": "x", "stream": False}
+        assert llm_client.generate(stub.url, payload, timeout=5, agent="Coder Agent")["response"] == "abc"
+        chunks = list(llm_client.stream_generate(stub.url, dict(payload, stream=True), timeout=5, agent="Coder Agent"))
+        assert chunks[-1]["done"]
+    llm_client.close_session()
+
+    labels = {"agent": "Coder Agent", "model": "coder"}
+    tokens = registry.histogram("voice2code_ollama_eval_tokens", **labels)
+    assert tokens.count == 2 and tokens.total == 6
+    assert abs(registry.histogram("voice2code_ollama_eval_seconds", **labels).total - 0.06) < 1e-6
+    assert registry.histogram("voice2code_ollama_load_seconds", **labels).count == 2
+    assert registry.histogram(STAGE_SECONDS, stage="http").count == 2
+
+
+def test_prometheus_rendering_escapes_labels():
+    reg = MetricsRegistry()
+    reg.observe("voice2code_stage_seconds", 0.25, stage='say "hi"')
+    reg.inc("voice2code_requests_total", endpoint="/process-audio", status=200)
+    text = reg.render_prometheus()
+    assert "# TYPE voice2code_stage_seconds summary" in text
+    assert 'voice2code_stage_seconds{stage="say \\"hi\\"",quantile="0.95"} 0.25' in text
+    assert 'voice2code_stage_seconds_count{stage="say \\"hi\\""} 1' in text
+    assert 'voice2code_requests_total{endpoint="/process-audio",status="200"} 1' in text
+
+
+def test_metrics_endpoint_reports_pipeline_stages(monkeypatch, dictate):
+    registry.reset()
+    monkeypatch.setattr(backend, "get_raw_code", lambda prompt: "```python\ndef add(a, b):\n    return a + b\n```")
+    assert dictate("write a function that adds two numbers").status_code == 200
+
+    response = backend.app.test_client().get('/metrics')
+    assert response.status_code == 200 and response.mimetype == "text/plain"
+    text = response.get_data(as_text=True)
+    for stage in ("pipeline", "pipeline/config", "pipeline/whisper", "pipeline/agent1", "pipeline/agent2", "pipeline/strip"):
+        assert f'voice2code_stage_seconds_count{{stage="{stage}"}} 1' in text
+    assert 'voice2code_requests_total{endpoint="/process-audio",status="200"} 1' in text
+
+
+def test_log_level_off_silences_backend(monkeypatch):
+    monkeypatch.setattr(metrics, "_applied_level", None)
+    metrics.apply_log_level({"log_level": "OFF"})
+    assert not logging.getLogger("voice2code").isEnabledFor(logging.ERROR)
+    metrics.apply_log_level({"log_level": "info"})
+    assert logging.getLogger("voice2code").isEnabledFor(logging.INFO)
+    assert not logging.getLogger("voice2code").isEnabledFor(logging.DEBUG)
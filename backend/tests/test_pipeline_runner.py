@@ -0,0 +1,169 @@
+"""
+Test script for the async pipeline runner
+
+Checks that overlapping dictations run concurrently, that a newer dictation
+from the same named client cancels the older one (and unnamed ones never do),
+and that admission is bounded.
+"""
+
+import sys
+import os
+import asyncio
+import threading
+import time
+
+import numpy as np
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import app as backend
+import whisper_wrapper
+from pipeline_runner import PipelineRunner, PipelineBusy, PipelineSuperseded
+
+
+def _run_in_thread(target, results, key):
+    def wrapper():
+        try:
+            results[key] = target()
+        except Exception as e:
+            results[key] = e
+    thread = threading.Thread(target=wrapper)
+    thread.start()
+    return thread
+
+
+def test_pipelines_overlap_instead_of_serializing():
+    runner = PipelineRunner(max_concurrent=4)
+    results = {}
+    start = time.time()
+    threads = [_run_in_thread(lambda i=i: runner.run(f"client-{i}", asyncio.sleep(0.2, result=i)), results, i)
+               for i in range(4)]
+    for thread in threads:
+        thread.join()
+    assert results == {0: 0, 1: 1, 2: 2, 3: 3}
+    assert time.time() - start < 0.6
+    runner.stop()
+
+
+def test_newer_dictation_supersedes_older_one():
+    runner = PipelineRunner()
+    results = {}
+    first = _run_in_thread(lambda: runner.run("hud", asyncio.sleep(5, result="old")), results, "old")
+    time.sleep(0.1)
+    second = _run_in_thread(lambda: runner.run("hud", asyncio.sleep(0.05, result="new")), results, "new")
+    first.join(2)
+    second.join(2)
+    assert isinstance(results["old"], PipelineSuperseded)
+    assert results["new"] == "new"
+    runner.stop()
+
+
+def test_unnamed_dictations_do_not_supersede_each_other():
+    runner = PipelineRunner()
+    results = {}
+    first = _run_in_thread(lambda: runner.run(None, asyncio.sleep(0.2, result="first")), results, "first")
+    time.sleep(0.05)
+    second = _run_in_thread(lambda: runner.run(None, asyncio.sleep(0.05, result="second")), results, "second")
+    first.join(2)
+    second.join(2)
+    assert results == {"first": "first", "second": "second"}
+    runner.stop()
+
+
+def test_backpressure_rejects_when_queue_is_full():
+    runner = PipelineRunner(max_concurrent=1, max_pending=2)
+    results = {}
+    threads = [_run_in_thread(lambda i=i: runner.run(f"client-{i}", asyncio.sleep(0.3)), results, i)
+               for i in range(2)]
+    time.sleep(0.1)
+    try:
+        runner.run("client-late", asyncio.sleep(0))
+    except PipelineBusy:
+        pass
+    else:
+        raise AssertionError("expected PipelineBusy")
+    for thread in threads:
+        thread.join()
+    assert runner.pending == 0
+    runner.stop()
+
+
+def test_cancelled_cli_transcription_kills_whisper(monkeypatch, tmp_path):
+    """A superseded dictation must not leave the whisper subprocess running."""
+    marker = tmp_path / "pid"
+    script = f"import os, time; open({str(marker)!r}, 'w').write(str(os.getpid())); time.sleep(30)"
+    monkeypatch.setattr(whisper_wrapper, "_engine", None)
+    monkeypatch.setattr(whisper_wrapper, "_cli_command", lambda audio_file: [sys.executable, "-c", script])
+
+    runner = PipelineRunner()
+    results = {}
+    thread = _run_in_thread(lambda: runner.run("hud", whisper_wrapper.transcribe_async("audio.wav")), results, "old")
+    deadline = time.time() + 5
+    while not marker.exists() and time.time() < deadline:
+        time.sleep(0.05)
+    runner.run("hud", asyncio.sleep(0))
+    thread.join(5)
+    assert isinstance(results["old"], PipelineSuperseded)
+
+    _assert_exited(int(marker.read_text()))
+    runner.stop()
+
+
+def test_cancelled_pcm_transcription_kills_whisper(monkeypatch, tmp_path):
+    """The stdin path that VAD-trimmed and raw dictations take is killed on supersede too."""
+    marker = tmp_path / "pid"
+    script = f"import os, time; open({str(marker)!r}, 'w').write(str(os.getpid())); time.sleep(30)"
+    monkeypatch.setattr(whisper_wrapper, "_engine", None)
+    monkeypatch.setattr(whisper_wrapper, "_cli_stdin_command", lambda: [sys.executable, "-c", script])
+
+    runner = PipelineRunner()
+    results = {}
+    samples = np.zeros(1600, dtype=np.float32)
+    thread = _run_in_thread(lambda: runner.run("hud", whisper_wrapper.transcribe_pcm_async(samples, cached=False)),
+                            results, "old")
+    deadline = time.time() + 5
+    while not marker.exists() and time.time() < deadline:
+        time.sleep(0.05)
+    runner.run("hud", asyncio.sleep(0))
+    thread.join(5)
+    assert isinstance(results["old"], PipelineSuperseded)
+
+    _assert_exited(int(marker.read_text()))
+    runner.stop()
+
+
+def _assert_exited(pid, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            os.kill(pid, 0)
+        except OSError:
+            return
+        time.sleep(0.05)
+    raise AssertionError("whisper subprocess still running")
+
+
+def test_process_audio_reports_superseded(monkeypatch):
+    async def slow_transcribe(path):
+        await asyncio.sleep(5 if path == "first.wav" else 0)
+        return "[BLANK_AUDIO]"
+
+    monkeypatch.setattr(backend, "transcribe_async", slow_transcribe)
+    client = backend.app.test_client()
+    results = {}
+    first = _run_in_thread(lambda: client.post('/process-audio', json={"path": "first.wav", "client_id": "hud"}),
+                           results, "first")
+    time.sleep(0.2)
+    # From the same address but another caller: left alone
+    other = client.post('/process-audio', json={"path": "other.wav"})
+    assert other.get_json()["error_type"] == "no_audio"
+    assert first.is_alive()
+
+    second = client.post('/process-audio/raw?client_id=hud', data=b"\0\0" * 1600,
+                         content_type="audio/L16; rate=16000")
+    first.join(2)
+
+    assert results["first"].status_code == 409
+    assert results["first"].get_json()["error_type"] == "superseded"
+    assert second.status_code != 409
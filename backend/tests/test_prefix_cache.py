@@ -0,0 +1,61 @@
+"""
+Test script for prompt-prefix reuse
+
+Checks against a stub Ollama server that each agent's template is sent as the
+system prompt with only the dictation as the prompt, and that nothing is sent
+that way when the feature is off.
+"""
+
+import sys
+import os
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import llm_client
+import ollama_wrapper
+import prompt_optimizer
+from config import Settings
+from prefix_cache import split_prefix
+from stub_ollama import StubOllama
+
+
+def _settings(url, version=1, **values):
+    return Settings.from_values({"ollama_endpoint": url, "ollama_model": "coder", "optimizer_model": "optimizer",
+                                 "coder_prompt": "Write {language} code.", "optimizer_prompt": "Clarify this.",
+                                 "ollama_prefix_context": True, **values}, version)
+
+
+def test_split_prefix():
+    assert split_prefix("Write code.\n\nadd two numbers", "Write code.") == "add two numbers"
+    assert split_prefix("Write code.", "Write code.") is None
+    assert split_prefix("Something else", "Write code.") is None
+
+
+def test_templates_are_sent_as_system_prompts(monkeypatch):
+    with StubOllama(["x = 1"]) as stub:
+        settings = _settings(stub.url)
+        monkeypatch.setattr(ollama_wrapper, "get_settings", lambda: settings)
+        monkeypatch.setattr(prompt_optimizer, "get_settings", lambda: settings)
+
+        assert prompt_optimizer.optimize_prompt("set x to one") == "x = 1"
+        assert ollama_wrapper.get_raw_code("Write Python code.\n\nset x to one") == "x = 1"
+        assert list(ollama_wrapper.stream_raw_code("Write Python code.\n\nset x to two")) == ["x = 1"]
+        # A prompt that does not start with the template is sent as it is
+        assert ollama_wrapper.get_raw_code("set x to three") == "x = 1"
+    llm_client.close_session()
+
+    assert [p.get("system") for p in stub.requests] == ["Clarify this.", "Write Python code.", "Write Python code.", None]
+    assert [p["prompt"] for p in stub.requests] == ["USER REQUEST:\nset x to one", "set x to one", "set x to two",
+                                                    "set x to three"]
+    assert not any("context" in p for p in stub.requests)
+
+
+def test_disabled_sends_full_prompt(monkeypatch):
+    with StubOllama(["x = 1"]) as stub:
+        settings = _settings(stub.url, ollama_prefix_context=False)
+        monkeypatch.setattr(ollama_wrapper, "get_settings", lambda: settings)
+        ollama_wrapper.get_raw_code("Write Python code.\n\nset x to one")
+    llm_client.close_session()
+    assert len(stub.requests) == 1 and "system" not in stub.requests[0]
+    assert stub.requests[0]["prompt"] == "Write Python code.\n\nset x to one"
@@ -0,0 +1,108 @@
+"""
+Test script for the raw audio upload endpoint (/process-audio/raw)
+
+Checks PCM and WAV decoding (resampling and downmixing with NumPy) and that
+the samples reach whisper-cli on stdin with the transcript read from stdout.
+"""
+
+import sys
+import os
+import io
+import wave
+
+import numpy as np
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import app as backend
+import whisper_wrapper
+from audio_io import decode_audio_body, encode_wav, decode_wav, AudioFormatError
+
+# Stands in for whisper-cli: checks it was given WAV data on stdin and prints a transcript
+FAKE_CLI = (
+    "import sys, io, wave;"
+    "w = wave.open(io.BytesIO(sys.stdin.buffer.read()));"
+    "assert w.getframerate() == 16000 and w.getnchannels() == 1;"
+    "print(' print hello world');"
+    "print(f' ({w.getnframes()} frames)')"
+)
+
+
+def _tone(rate, seconds, channels=1):
+    t = np.arange(int(rate * seconds)) / rate
+    mono = (0.5 * np.sin(2 * np.pi * 440 * t) * 32767).astype("<i2")
+    return np.repeat(mono, channels) if channels > 1 else mono
+
+
+def _wav_bytes(pcm, rate, channels):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def test_raw_pcm_defaults_to_16khz_mono():
+    pcm = _tone(16000, 0.5)
+    samples = decode_audio_body(pcm.tobytes(), "audio/L16")
+    assert samples.dtype == np.float32 and len(samples) == 8000
+
+
+def test_wav_is_resampled_and_downmixed():
+    samples = decode_audio_body(_wav_bytes(_tone(44100, 1.0, channels=2), 44100, 2), "audio/wav")
+    assert len(samples) == 16000
+    assert 0.45 < np.abs(samples).max() < 0.55
+
+
+def test_pcm_rate_parameter_is_honoured():
+    samples = decode_audio_body(_tone(8000, 1.0).tobytes(), "audio/L16; rate=8000; channels=1")
+    assert len(samples) == 16000
+
+
+def test_encode_wav_round_trip():
+    samples = decode_audio_body(_tone(16000, 0.25).tobytes(), "audio/L16")
+    assert np.allclose(decode_wav(encode_wav(samples)), samples, atol=1e-3)
+
+
+def test_unsupported_type_is_rejected():
+    try:
+        decode_audio_body(b"OggS....", "audio/ogg")
+    except AudioFormatError:
+        pass
+    else:
+        raise AssertionError("expected AudioFormatError")
+
+
+def test_transcribe_pcm_uses_stdin_and_stdout(monkeypatch):
+    monkeypatch.setattr(whisper_wrapper, "_engine", None)
+    monkeypatch.setattr(whisper_wrapper, "_cli_stdin_command", lambda: [sys.executable, "-c", FAKE_CLI])
+    samples = decode_audio_body(_tone(16000, 0.5).tobytes(), "audio/L16")
+    assert whisper_wrapper.transcribe_pcm(samples, cached=False) == "print hello world (8000 frames)"
+
+
+def test_raw_endpoint_runs_pipeline(monkeypatch):
+    monkeypatch.setattr(whisper_wrapper, "_engine", None)
+    monkeypatch.setattr(whisper_wrapper, "_cli_stdin_command", lambda: [sys.executable, "-c", FAKE_CLI])
+    monkeypatch.setattr(backend, "get_cache", lambda settings: None)
+    prompts = []
+    monkeypatch.setattr(backend, "get_raw_code", lambda prompt: prompts.append(prompt) or "print('hello world')")
+
+    client = backend.app.test_client()
+    response = client.post('/process-audio/raw', data=_wav_bytes(_tone(48000, 0.5), 48000, 1),
+                           content_type="audio/wav")
+    body = response.get_json()
+    assert response.status_code == 200, body
+    assert body["code"] == "print('hello world')"
+    # The cleaner drops the parenthesised part before the prompt reaches the coder
+    assert prompts[0].endswith("print hello world")
+
+    for data, content_type in ((b"not audio", "audio/ogg"), (b"\x00\x00" * 100, "audio/L16; rate=0"),
+                               (b"\x00\x00" * 100, "audio/L16; rate=16000; channels=0"),
+                               # A WAV header claiming 0 Hz (the rate field starts at byte 24)
+                               (_wav_bytes(_tone(16000, 0.1), 16000, 1)[:24] + b"\x00" * 4
+                                + _wav_bytes(_tone(16000, 0.1), 16000, 1)[28:], "audio/wav")):
+        bad = client.post('/process-audio/raw', data=data, content_type=content_type)
+        assert bad.status_code == 400 and bad.get_json()["error_type"] == "bad_audio", content_type
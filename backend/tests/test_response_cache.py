@@ -0,0 +1,134 @@
+"""
+Test script for the response cache
+
+Covers the exact and fuzzy tiers, TTL and LRU eviction in memory and on disk,
+SQLite persistence with batched last-used writes, and checks that a cache hit
+in /process-audio skips both agents and reports its tier.
+"""
+
+import sys
+import os
+import sqlite3
+import time
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import app as backend
+from response_cache import ResponseCache, normalize_transcript
+
+
+def test_exact_tier_ignores_case_and_punctuation():
+    cache = ResponseCache()
+    cache.store("Sort list in reverse.", "ctx", "Sort a list descending.", "items.sort(reverse=True)")
+    entry, tier = cache.lookup("sort list, in REVERSE", "ctx")
+    assert tier == "exact" and entry.code == "items.sort(reverse=True)"
+    assert cache.lookup("sort list in reverse", "other-model")[1] == "miss"
+    assert cache.stats() == {"hits": 1, "fuzzy_hits": 0, "misses": 1, "entries": 1}
+
+
+def test_fuzzy_tier_is_optional():
+    exact_only = ResponseCache()
+    exact_only.store("function to check if number is even", "ctx", "", "def is_even(n): ...")
+    assert exact_only.lookup("function to check if a number is even", "ctx")[1] == "miss"
+
+    fuzzy = ResponseCache(fuzzy_threshold=0.8)
+    fuzzy.store("function to check if number is even", "ctx", "", "def is_even(n): ...")
+    assert fuzzy.lookup("function to check if a number is even", "ctx")[1] == "fuzzy"
+    assert fuzzy.lookup("function to check if number is odd", "ctx")[1] == "miss"
+
+
+def test_ttl_and_lru_eviction():
+    cache = ResponseCache(max_entries=2, ttl=0.05)
+    cache.store("one", "ctx", "", "1")
+    cache.store("two", "ctx", "", "2")
+    cache.lookup("one", "ctx")
+    cache.store("three", "ctx", "", "3")
+    # "two" was the least recently used entry
+    assert cache.lookup("two", "ctx")[1] == "miss"
+    time.sleep(0.06)
+    assert cache.lookup("one", "ctx")[1] == "miss"
+
+
+def test_entries_persist_across_restarts(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    cache = ResponseCache(path)
+    cache.store("print hello world", "ctx", "Print 'hello world'.", "print('hello world')")
+    cache.close()
+
+    reopened = ResponseCache(path)
+    entry, tier = reopened.lookup("Print hello world", "ctx")
+    assert tier == "exact" and entry.optimized == "Print 'hello world'."
+    reopened.close()
+
+
+def test_eviction_deletes_rows_from_disk(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+
+    def rows():
+        with sqlite3.connect(path) as db:
+            return db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    cache = ResponseCache(path, max_entries=4, ttl=0.2)
+    for i in range(6):
+        cache.store(f"dictation {i}", "ctx", "", str(i))
+    assert rows() == 4
+    cache.close()
+
+    # A smaller cache deletes what it no longer loads, and expired rows go on the next eviction
+    smaller = ResponseCache(path, max_entries=2, ttl=0.2)
+    assert rows() == 2
+    time.sleep(0.25)
+    smaller.store("dictation 6", "ctx", "", "6")
+    assert rows() == 1 and smaller.stats()["entries"] == 1
+    smaller.close()
+
+
+def test_hits_reach_disk_before_eviction(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+
+    def stored():
+        with sqlite3.connect(path) as db:
+            return {row[0] for row in db.execute("SELECT code FROM responses")}
+
+    def last_used(code):
+        with sqlite3.connect(path) as db:
+            return db.execute("SELECT last_used FROM responses WHERE code = ?", (code,)).fetchone()[0]
+
+    cache = ResponseCache(path, max_entries=2)
+    cache.store("one", "ctx", "", "1")
+    cache.store("two", "ctx", "", "2")
+    written = last_used("1")
+    time.sleep(0.01)
+    cache.lookup("one", "ctx")
+    # A hit is not written on its own
+    assert last_used("1") == written
+    cache.store("three", "ctx", "", "3")
+    # ...but the disk-side eviction saw it, so "two" was the least recently used row
+    assert stored() == {"1", "3"} and last_used("1") > written
+    cache.close()
+
+
+def test_cache_hit_skips_both_agents(monkeypatch, transcribe_as):
+    cache = ResponseCache()
+    calls = []
+    monkeypatch.setattr(backend, "get_cache", lambda settings: cache)
+    # Hedged dictation, so Agent 1 is not skipped by the local cleaner
+    transcribe_as("maybe sort the list in reverse")
+    monkeypatch.setattr(backend, "optimize_prompt", lambda text: calls.append("agent1") or text)
+    monkeypatch.setattr(backend, "get_raw_code", lambda prompt: calls.append("agent2") or "items.sort(reverse=True)")
+
+    client = backend.app.test_client()
+    first = client.post('/process-audio', json={"path": "audio.wav"}).get_json()
+    second = client.post('/process-audio', json={"path": "audio.wav"}).get_json()
+
+    assert calls == ["agent1", "agent2"]
+    assert first["timings"]["cache"]["result"] == "miss"
+    assert second["timings"]["cache"]["result"] == "exact"
+    assert second["code"] == "items.sort(reverse=True)"
+    assert "agent1" not in second["timings"] and second["cached"] == "exact"
+    assert "cached" not in first and "agent1_skipped" not in second
+
+
+def test_normalize_transcript():
+    assert normalize_transcript("  Sort   the LIST!  ") == "sort the list"
@@ -0,0 +1,177 @@
+"""
+Test script for the multi-endpoint Ollama router
+
+Runs several stub Ollama servers and checks how requests are spread over
+them: least outstanding requests, latency-aware picks, separate pools for
+the optimizer and coder, skipping and failing over from a server that is
+down (streamed agent requests under the default budgets too), and a hedged
+request or stream on a second server when the first stalls.
+"""
+
+import sys
+import os
+import threading
+import time
+from contextlib import ExitStack
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import circuit_breaker
+import llm_client
+import ollama_wrapper
+import prompt_optimizer
+from config import Settings
+from metrics import registry
+from router import Router, generate_url
+from stub_ollama import StubOllama
+
+PAYLOAD = {"model": "coder", "prompt": "x", "stream": False}
+
+
+def _stubs(stack, count, **options):
+    return [stack.enter_context(StubOllama([f"x = {i}"], **options)) for i in range(count)]
+
+
+def _settings(monkeypatch, **values):
+    settings = Settings.from_values({"ollama_model": "coder", "optimizer_model": "optimizer",
+                                     "ollama_breaker_failures": 1, "ollama_breaker_probe_interval": 60, **values})
+    monkeypatch.setattr(circuit_breaker, "get_settings", lambda: settings)
+    monkeypatch.setattr(llm_client, "RETRY_DELAY", 0.01)
+    return settings
+
+
+def test_least_outstanding_spreads_concurrent_requests(monkeypatch):
+    router = Router()
+    with ExitStack() as stack:
+        stubs = _stubs(stack, 3, request_delay=0.2)
+        settings = _settings(monkeypatch, ollama_endpoints=[stub.url for stub in stubs])
+        threads = [threading.Thread(target=router.generate, args=(settings, "coder", dict(PAYLOAD), 5, "Coder Agent"))
+                   for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    llm_client.close_session()
+    assert [len(stub.requests) for stub in stubs] == [2, 2, 2]
+    assert router.status(settings)["endpoints"][0]["outstanding"] == 0
+
+
+def test_latency_aware_prefers_the_fast_server(monkeypatch):
+    router = Router()
+    with ExitStack() as stack:
+        slow, fast = _stubs(stack, 2)
+        slow.request_delay = 0.15
+        settings = _settings(monkeypatch, ollama_endpoints=[slow.url, fast.url], ollama_balancing="latency")
+        for _ in range(10):
+            assert router.generate(settings, "coder", dict(PAYLOAD), 5, "Coder Agent") is not None
+    llm_client.close_session()
+    # One request to measure the slow server, the rest go to the fast one
+    assert len(slow.requests) == 1 and len(fast.requests) == 9
+
+
+def test_pools_per_role(monkeypatch):
+    with ExitStack() as stack:
+        optimizer_box, coder_box = _stubs(stack, 2)
+        settings = _settings(monkeypatch, ollama_endpoint=optimizer_box.url,
+                             ollama_pools={"optimizer": [optimizer_box.url],
+                                           # A bare server URL works too
+                                           "coder": [coder_box.url.replace("/api/generate", "")]})
+        monkeypatch.setattr(ollama_wrapper, "get_settings", lambda: settings)
+        monkeypatch.setattr(prompt_optimizer, "get_settings", lambda: settings)
+        assert prompt_optimizer.optimize_prompt("set x") == "x = 0"
+        assert ollama_wrapper.get_raw_code("set x") == "x = 1"
+    llm_client.close_session()
+    assert [p["model"] for p in optimizer_box.requests] == ["optimizer"]
+    assert [p["model"] for p in coder_box.requests] == ["coder"]
+
+
+def test_down_server_is_skipped(monkeypatch):
+    router = Router()
+    with ExitStack() as stack:
+        down, up = _stubs(stack, 2)
+        down.down = True
+        settings = _settings(monkeypatch, ollama_endpoints=[down.url, up.url])
+        results = [router.generate(settings, "coder", dict(PAYLOAD), 5, "Coder Agent") for _ in range(4)]
+        assert all(result["response"] == "x = 1" for result in results)
+        status = router.status(settings)
+    llm_client.close_session()
+    # The first request to reach the down server opened its breaker and failed over
+    assert len(up.requests) == 4
+    assert [e["state"] for e in status["endpoints"]] == ["open", "closed"] and status["state"] == "closed"
+    assert router.available(settings)
+
+
+def test_hedged_request_wins_on_second_server(monkeypatch):
+    router = Router()
+    registry.reset()
+    with ExitStack() as stack:
+        stalled, spare = _stubs(stack, 2)
+        settings = _settings(monkeypatch, ollama_endpoints=[stalled.url, spare.url], ollama_balancing="latency",
+                             ollama_hedging=True, ollama_hedge_min_delay=0.1)
+        # The stalled server has a record of answering in 50ms and looks like the faster one
+        for _ in range(circuit_breaker.MIN_SAMPLES):
+            circuit_breaker.breaker_for(stalled.url).record_success("coder", "generate", 0.05)
+        router.release(stalled.url, "coder", "generate", 0.05)
+        router.release(spare.url, "coder", "generate", 0.5)
+        stalled.tokens, stalled.token_delay = ["x = 0\n"] * 10, 0.2
+
+        start = time.time()
+        result = router.generate(settings, "coder", dict(PAYLOAD), 5, "Coder Agent")
+        elapsed = time.time() - start
+        deadline = time.time() + 3
+        while stalled.disconnects == 0 and time.time() < deadline:
+            time.sleep(0.05)
+    llm_client.close_session()
+
+    assert result["response"] == "x = 1" and result["done"] is True
+    assert elapsed < 1
+    assert len(stalled.requests) == 1 and len(spare.requests) == 1
+    # Hedges stream, so the losing request is cancelled
+    assert stalled.requests[0]["stream"] is True and stalled.disconnects == 1
+    assert registry.counter("voice2code_hedged_total", agent="Coder Agent", winner="hedge") == 1
+
+
+def test_streamed_agents_fail_over_under_the_default_budgets(monkeypatch):
+    with ExitStack() as stack:
+        down, up = _stubs(stack, 2)
+        down.down = True
+        # The shipped budgets stream both agents through agent_budget
+        settings = _settings(monkeypatch, ollama_endpoints=[down.url, up.url], ollama_breaker_failures=3,
+                             optimizer_max_seconds=10, coder_max_seconds=30, coder_early_stop=True)
+        monkeypatch.setattr(ollama_wrapper, "get_settings", lambda: settings)
+        monkeypatch.setattr(prompt_optimizer, "get_settings", lambda: settings)
+        results = [(prompt_optimizer.optimize_prompt("set x"), ollama_wrapper.get_raw_code("set x")) for _ in range(2)]
+    llm_client.close_session()
+    assert results == [("x = 1", "x = 1")] * 2
+    assert len(up.requests) == 4 and all(p["stream"] for p in up.requests)
+
+
+def test_hedged_stream_wins_on_second_server(monkeypatch):
+    router = Router()
+    registry.reset()
+    with ExitStack() as stack:
+        stalled, spare = _stubs(stack, 2)
+        settings = _settings(monkeypatch, ollama_endpoints=[stalled.url, spare.url], ollama_balancing="latency",
+                             ollama_hedging=True, ollama_hedge_min_delay=0.1)
+        # The stalled server has a record of sending its first chunk in 50ms and looks like the faster one
+        for _ in range(circuit_breaker.MIN_SAMPLES):
+            circuit_breaker.breaker_for(stalled.url).record_success("coder", "stream", 0.05)
+        router.release(stalled.url, "coder", "stream", 0.05)
+        router.release(spare.url, "coder", "stream", 0.5)
+        stalled.request_delay = 2
+
+        start = time.time()
+        chunks = list(router.stream_generate(settings, "coder", dict(PAYLOAD, stream=True), 5, "Coder Agent"))
+        elapsed = time.time() - start
+    llm_client.close_session()
+
+    assert "".join(chunk.get("response", "") for chunk in chunks) == "x = 1" and chunks[-1]["done"] is True
+    assert elapsed < 1
+    assert len(stalled.requests) == 1 and len(spare.requests) == 1
+    assert registry.counter("voice2code_hedged_total", agent="Coder Agent", winner="hedge") == 1
+
+
+def test_generate_url():
+    assert generate_url("http://box:11434/") == "http://box:11434/api/generate"
+    assert generate_url("http://box:11434/api/generate") == "http://box:11434/api/generate"
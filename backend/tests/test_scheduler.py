@@ -0,0 +1,165 @@
+"""
+Test script for the stage scheduler
+
+Checks that a resource hands its slots to interactive work before batch work
+and by deadline within a priority, that jobs past their deadline are expired,
+and that /jobs/<id> reports a dictation queued behind a busy model.
+"""
+
+import sys
+import os
+import asyncio
+import time
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import app as backend
+import scheduler as scheduler_module
+from scheduler import Scheduler, JobDeadlineExceeded, _current_job
+
+
+def _drain(job_ids, timeout: float = 5):
+    """Waits for the jobs to finish."""
+    deadline = time.time() + timeout
+    for job_id in job_ids:
+        job = scheduler_module.scheduler.get(job_id)
+        while job is not None and job.status not in scheduler_module.FINISHED and time.time() < deadline:
+            time.sleep(0.02)
+
+
+def test_slots_go_to_priority_then_deadline(use_settings):
+    use_settings(scheduler_limits={"ollama": 1})
+    scheduler = Scheduler()
+    order = []
+
+    async def stage(job):
+        _current_job.set(job)
+        async with scheduler.stage("code", "ollama:coder"):
+            order.append(job.kind)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        holder = asyncio.create_task(stage(scheduler.create_job("first")))
+        await asyncio.sleep(0)
+        jobs = [scheduler.create_job("background", "background"), scheduler.create_job("batch", "batch"),
+                scheduler.create_job("late", deadline=60), scheduler.create_job("soon", deadline=5)]
+        waiting = [asyncio.create_task(stage(job)) for job in jobs]
+        await asyncio.sleep(0)
+        assert scheduler.resources()["ollama:coder"] == {"limit": 1, "running": 1, "queued": 4}
+        await asyncio.gather(holder, *waiting)
+
+    asyncio.run(main())
+    assert order == ["first", "soon", "late", "batch", "background"]
+    assert scheduler.resources()["ollama:coder"] == {"limit": 1, "running": 0, "queued": 0}
+
+
+def test_limits_by_resource_and_kind(use_settings):
+    use_settings(whisper_engine_workers=2, scheduler_limits={"ollama": 2, "ollama:big": 1})
+    scheduler = Scheduler()
+    assert scheduler.limit("whisper") == 2
+    assert scheduler.limit("ollama:small") == 2
+    assert scheduler.limit("ollama:big") == 1
+
+
+def test_ollama_limits_default_to_the_router_pools(use_settings):
+    use_settings(ollama_model="coder", optimizer_model="optimizer",
+                 ollama_pools={"optimizer": ["http://a:11434"], "coder": ["http://b:11434", "http://c:11434"]})
+    scheduler = Scheduler()
+    assert scheduler.limit("ollama:coder") == 2
+    assert scheduler.limit("ollama:optimizer") == 1
+    # Both agents on one model and one server still get a slot each
+    use_settings(ollama_model="shared", ollama_endpoint="http://a:11434")
+    assert scheduler.limit("ollama:shared") == 2
+
+
+def test_cancelled_waiter_gives_up_its_place(use_settings):
+    use_settings()
+    scheduler = Scheduler()
+
+    async def main():
+        async with scheduler.stage("transcribe", "whisper"):
+            waiter = asyncio.create_task(scheduler.stage("transcribe", "whisper").__aenter__())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+        async with scheduler.stage("transcribe", "whisper"):
+            return scheduler.resources()["whisper"]
+
+    assert asyncio.run(main()) == {"limit": 1, "running": 1, "queued": 0}
+
+
+def test_job_past_its_deadline_expires(use_settings):
+    use_settings()
+    scheduler = Scheduler()
+    job = scheduler.create_job("dictation", deadline=0.05)
+
+    async def slow():
+        await asyncio.sleep(1)
+        return {}, 200
+
+    try:
+        asyncio.run(scheduler.run(job, slow()))
+    except JobDeadlineExceeded:
+        pass
+    else:
+        raise AssertionError("expected JobDeadlineExceeded")
+    assert job.status == "expired"
+    assert scheduler.active() == []
+
+    done = scheduler.create_job("dictation")
+    assert asyncio.run(scheduler.run(done, asyncio.sleep(0, result=({"code": "x = 1"}, 200)))) == ({"code": "x = 1"}, 200)
+    assert done.to_dict()["result"] == {"code": "x = 1"} and done.to_dict()["http_status"] == 200
+
+
+def test_unknown_priority_is_rejected(use_settings):
+    use_settings()
+    client = backend.app.test_client()
+    response = client.post('/process-audio', json={"path": "clip.wav", "priority": "urgent"})
+    assert response.status_code == 400
+    assert response.get_json()["error_type"] == "bad_job"
+
+
+def test_async_dictation_is_polled_at_jobs(monkeypatch, use_settings, transcribe_as):
+    # A separate optimizer model, so only the code stage queues on ollama:coder
+    use_settings(ollama_model="coder", optimizer_model="optimizer", vad_enabled=False,
+                 response_cache_enabled=False, optimizer_skip_enabled=False)
+    transcribe_as("maybe print hello world")
+
+    def slow_code(prompt):
+        time.sleep(0.3)
+        return "print('hello world')"
+
+    monkeypatch.setattr(backend, "optimize_prompt", lambda text: "Print hello world.")
+    monkeypatch.setattr(backend.router, "available", lambda settings: True)
+    monkeypatch.setattr(backend, "get_raw_code", slow_code)
+
+    client = backend.app.test_client()
+    first = client.post('/process-audio?async=1', json={"path": "a.wav", "client_id": "one"})
+    second = client.post('/process-audio', json={"path": "b.wav", "client_id": "two", "async": True,
+                                                 "id": "second-dictation"})
+    assert first.status_code == 202 and second.status_code == 202
+    assert second.get_json()["job_id"] == "second-dictation"
+    assert second.headers["Location"] == "/jobs/second-dictation"
+
+    job_ids = (first.get_json()["job_id"], "second-dictation")
+    try:
+        # One coder slot: whichever dictation asks for it second waits for the other's
+        deadline = time.time() + 5
+        waiting = []
+        while not waiting and time.time() < deadline:
+            time.sleep(0.02)
+            waiting = [job for job in (client.get(f'/jobs/{job_id}').get_json() for job_id in job_ids)
+                       if job["waiting_for"] == "ollama:coder"]
+        assert len(waiting) == 1
+        assert waiting[0]["status"] == "running" and waiting[0]["stage"] == "code"
+        assert client.get('/jobs').get_json()["resources"]["ollama:coder"]["limit"] == 1
+    finally:
+        # Never leave either pipeline running into the next test
+        _drain(job_ids)
+
+    for job_id in job_ids:
+        done = client.get(f'/jobs/{job_id}').get_json()
+        assert done["http_status"] == 200 and done["result"]["code"] == "print('hello world')"
+    assert client.get(f'/jobs/{waiting[0]["id"]}').get_json()["stages"]["code"]["wait"] >= 0.1
+    assert client.get('/jobs/unknown').status_code == 404
@@ -0,0 +1,80 @@
+"""
+Test script for the speculative optimizer/coder overlap
+
+Runs the pipeline against a stub Ollama server with Agent 1 replaced by a
+scripted optimizer, and checks that speculative code is kept when the
+optimized prompt barely changed and cancelled and regenerated when it did
+or when the speculative request failed.
+"""
+
+import sys
+import os
+import time
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+import app as backend
+from stub_ollama import StubOllama
+
+HEDGED = "um so I think maybe a function that adds two numbers"
+
+
+@pytest.fixture
+def run(monkeypatch, use_settings, dictate):
+    def run(stub, optimized, optimizer_delay=0.05, enabled=True):
+        use_settings(ollama_endpoint=stub.url, ollama_model="coder", speculative_coder_enabled=enabled,
+                     speculative_min_similarity=0.6)
+
+        def fake_optimize(text):
+            time.sleep(optimizer_delay)
+            return optimized
+
+        monkeypatch.setattr(backend, "optimize_prompt", fake_optimize)
+        response = dictate(HEDGED)
+        return response.status_code, response.get_json()
+    return run
+
+
+def test_speculation_wins_when_optimizer_changes_little(run):
+    with StubOllama(["def add(a, b):", "\n    return a + b"], token_delay=0.05) as stub:
+        status, body = run(stub, "I think a function that adds two numbers")
+    assert status == 200, body
+    assert body["speculation"] == "won"
+    assert body["code"] == "def add(a, b):\n    return a + b"
+    # Only the speculative coder request was made
+    assert len(stub.requests) == 1 and stub.requests[0]["stream"] is True
+    assert stub.requests[0]["prompt"].endswith("I think maybe a function that adds two numbers")
+
+
+def test_speculation_loses_and_is_cancelled(run):
+    with StubOllama(["x = 1\n"] * 40, token_delay=0.02) as stub:
+        status, body = run(stub, "Create a class BankAccount with deposit and withdraw methods.")
+        time.sleep(0.1)
+    assert status == 200, body
+    assert body["speculation"] == "lost"
+    assert len(stub.requests) == 2
+    assert stub.requests[1]["prompt"].endswith("Create a class BankAccount with deposit and withdraw methods.")
+    # The speculative stream was abandoned long before its 40 tokens were generated
+    assert stub.disconnects == 1
+
+
+def test_failed_speculation_regenerates(run, monkeypatch):
+    def failing_coder(prompt, cancelled):
+        raise RuntimeError("connection reset")
+    monkeypatch.setattr(backend, "get_raw_code_cancellable", failing_coder)
+    with StubOllama(["x = 1"]) as stub:
+        status, body = run(stub, "I think a function that adds two numbers")
+    assert status == 200, body
+    assert body["speculation"] == "lost"
+    assert body["code"] == "x = 1"
+    assert len(stub.requests) == 1 and stub.requests[0]["stream"] is False
+
+
+def test_speculation_disabled_runs_agents_in_sequence(run):
+    with StubOllama(["x = 1"]) as stub:
+        status, body = run(stub, "Set x to one.", enabled=False)
+    assert status == 200 and "speculation" not in body
+    assert len(stub.requests) == 1 and stub.requests[0]["stream"] is False
@@ -0,0 +1,83 @@
+"""
+Test script for the streaming endpoint (/process-audio/stream)
+
+Drives the endpoint through Flask's test client against a stub Ollama
+server and checks that code chunks arrive with the markdown fences removed.
+"""
+
+import sys
+import os
+import json
+import random
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import app as backend
+import ollama_wrapper
+from code_extractor import CodeExtractor, extract_code
+from config import Settings
+from stub_ollama import StubOllama
+
+
+def _parse_events(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = block.split("\n")
+        events.append((lines[0][len("event: "):], json.loads(lines[1][len("data: "):])))
+    return events
+
+
+def test_extractor_matches_batch_extract():
+    """Any chunking of the stream must give the same result as extracting from the whole text."""
+    samples = [
+        "```python\nprint('hi')\n```",
+        "  ```javascript\nconsole.log(1);\n```  \n",
+        "x = [1, 2]\nx.sort(reverse=True)",
+        "```\nfor i in range(3):\n    print(i)\n```",
+        "s = '``' + 'a'\nprint(s)```",
+        "```python",
+        "",
+    ]
+    rng = random.Random(7)
+    for text in samples:
+        for _ in range(50):
+            extractor = CodeExtractor("python")
+            out, i = [], 0
+            while i < len(text):
+                step = rng.randint(1, 5)
+                out.append(extractor.feed(text[i:i + step]))
+                i += step
+            out.append(extractor.finish())
+            assert "".join(out) == extract_code(text, "python"), text
+
+
+def test_stream_endpoint_emits_stages(monkeypatch):
+    tokens = ["```python\n", "def add(a, b):\n", "    return a + b", "\n```"]
+    with StubOllama(tokens) as stub:
+        settings = Settings.from_values({"ollama_endpoint": stub.url, "ollama_model": "stub"})
+        monkeypatch.setattr(ollama_wrapper, "get_settings", lambda: settings)
+        monkeypatch.setattr(backend, "get_cache", lambda settings: None)
+        monkeypatch.setattr(backend, "transcribe", lambda path, **kwargs: "function to add two numbers")
+        monkeypatch.setattr(backend, "optimize_prompt", lambda text: "Create a function add(a, b).")
+
+        client = backend.app.test_client()
+        response = client.post('/process-audio/stream', json={"path": "audio.wav"})
+        assert response.mimetype == "text/event-stream"
+        events = _parse_events(response.get_data(as_text=True))
+
+    names = [name for name, _ in events]
+    assert names[0] == "transcript" and names[1] == "optimized" and names[-1] == "done"
+    code_chunks = [data["text"] for name, data in events if name == "code"]
+    assert len(code_chunks) > 1
+    assert "```" not in "".join(code_chunks)
+    assert events[-1][1]["code"] == "def add(a, b):\n    return a + b"
+    assert stub.requests[0]["stream"] is True
+
+
+def test_stream_endpoint_reports_no_audio(monkeypatch):
+    monkeypatch.setattr(backend, "transcribe", lambda path, **kwargs: "[BLANK_AUDIO]")
+    client = backend.app.test_client()
+    response = client.post('/process-audio/stream', json={"path": "audio.wav"})
+    events = _parse_events(response.get_data(as_text=True))
+    assert events == [("error", backend.NO_AUDIO_ERROR)]
@@ -0,0 +1,114 @@
+"""
+Test script for the transcript cache
+
+Covers audio fingerprints, LRU eviction and SQLite persistence, and checks
+that re-sent audio is answered without running whisper again.
+"""
+
+import sys
+import os
+
+import numpy as np
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import app as backend
+import whisper_wrapper
+from config import Settings
+from transcript_cache import TranscriptCache, fingerprint_file, fingerprint_samples
+
+
+def _settings(tmp_path, **values):
+    return Settings.from_values({"transcript_cache_path": str(tmp_path / "transcripts.sqlite3"),
+                                 "response_cache_enabled": False, **values}, 1)
+
+
+def test_fingerprints_follow_the_content(tmp_path):
+    samples = np.linspace(-1, 1, 16000, dtype=np.float32)
+    assert fingerprint_samples(samples) == fingerprint_samples(samples.copy())
+    assert fingerprint_samples(samples) == fingerprint_samples(samples.astype(np.float64))
+    assert fingerprint_samples(samples) != fingerprint_samples(samples[:-1])
+
+    first, second, empty = tmp_path / "a.wav", tmp_path / "b.wav", tmp_path / "empty.wav"
+    first.write_bytes(b"RIFF" + bytes(100))
+    second.write_bytes(b"RIFF" + bytes(100))
+    empty.write_bytes(b"")
+    assert fingerprint_file(str(first)) == fingerprint_file(str(second))
+    assert fingerprint_file(str(empty)) != fingerprint_file(str(first))
+
+
+def test_lru_eviction_and_persistence(tmp_path):
+    path = str(tmp_path / "transcripts.sqlite3")
+    cache = TranscriptCache(path, max_entries=2)
+    cache.store("one", "first")
+    cache.store("two", "second")
+    assert cache.get("one") == "first"
+    cache.store("three", "third")
+    # "two" was the least recently used entry
+    assert cache.get("two") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 2}
+    cache.close()
+
+    reopened = TranscriptCache(path, max_entries=2)
+    assert reopened.get("one") == "first" and reopened.get("three") == "third"
+    reopened.close()
+
+
+def test_key_includes_model_and_language():
+    assert TranscriptCache.key("pcm:1", "base.bin", "en") != TranscriptCache.key("pcm:1", "small.bin", "en")
+    assert TranscriptCache.key("pcm:1", "base.bin", "en") != TranscriptCache.key("pcm:1", "base.bin", "de")
+
+
+def test_repeated_audio_skips_whisper(tmp_path, monkeypatch):
+    settings = _settings(tmp_path)
+    calls = []
+    monkeypatch.setattr(whisper_wrapper, "get_settings", lambda: settings)
+    monkeypatch.setattr(whisper_wrapper, "_transcribe_pcm", lambda samples: calls.append(len(samples)) or "print hello")
+
+    samples = np.sin(np.arange(8000, dtype=np.float32) / 10)
+    assert whisper_wrapper.transcribe_pcm(samples) == "print hello"
+    assert whisper_wrapper.transcribe_pcm(samples.copy()) == "print hello"
+    assert whisper_wrapper.transcribe_pcm(samples[:4000]) == "print hello"
+    assert whisper_wrapper.transcribe_pcm(samples, cached=False) == "print hello"
+    assert calls == [8000, 4000, 8000]
+
+
+def test_failed_transcriptions_are_not_cached(tmp_path, monkeypatch):
+    settings = _settings(tmp_path)
+    results = ["", "print hello"]
+    monkeypatch.setattr(whisper_wrapper, "get_settings", lambda: settings)
+    monkeypatch.setattr(whisper_wrapper, "_transcribe", lambda path: results.pop(0))
+
+    audio = tmp_path / "audio.wav"
+    audio.write_bytes(b"RIFF" + bytes(100))
+    assert whisper_wrapper.transcribe(str(audio)) == ""
+    assert whisper_wrapper.transcribe(str(audio)) == "print hello"
+    assert whisper_wrapper.transcribe(str(audio)) == "print hello"
+
+
+def test_process_audio_reports_cache_hits(tmp_path, monkeypatch):
+    settings = _settings(tmp_path, vad_enabled=False)
+    calls = []
+
+    async def transcribe_async(path):
+        calls.append(path)
+        return "print hello world"
+
+    monkeypatch.setattr(whisper_wrapper, "get_settings", lambda: settings)
+    monkeypatch.setattr(backend, "get_settings", lambda: settings)
+    monkeypatch.setattr(whisper_wrapper, "_transcribe_async", transcribe_async)
+    monkeypatch.setattr(backend.router, "available", lambda settings: True)
+    monkeypatch.setattr(backend, "optimize_prompt", lambda text: text)
+    monkeypatch.setattr(backend, "get_raw_code", lambda prompt: "print('hello world')")
+
+    audio = tmp_path / "audio.wav"
+    audio.write_bytes(b"RIFF" + bytes(100))
+    client = backend.app.test_client()
+    first = client.post('/process-audio', json={"path": str(audio)}).get_json()
+    second = client.post('/process-audio', json={"path": str(audio)}).get_json()
+
+    assert len(calls) == 1
+    assert first["timings"]["transcript_cache"] == "miss"
+    assert second["timings"]["transcript_cache"] == "hit"
+    assert second["code"] == "print('hello world')"
@@ -0,0 +1,73 @@
+"""
+Test script for the transcript cleaner (Agent 1 fast path)
+
+Checks filler and stutter removal, the skip decision, and that
+/process-audio routes around the optimizer when the decision is to skip.
+"""
+
+import sys
+import os
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import app as backend
+from config import Settings
+from transcript_cleaner import clean_transcript, assess_transcript
+
+SETTINGS = Settings.from_values({})
+
+
+def test_clean_transcript_removes_fillers_and_stutters():
+    assert clean_transcript("Um, so sort the the list in reverse.") == "sort the list in reverse."
+    assert clean_transcript("create a, you know, function called Sum [MUSIC]") == "create a function called Sum"
+    assert clean_transcript("print print hello world") == "print hello world"
+    assert clean_transcript("sort the sort the list") == "sort the list"
+
+
+def test_right_and_now_are_only_stripped_before_a_comma():
+    assert clean_transcript("right, now, sort the list") == "sort the list"
+    assert clean_transcript("right align the header text") == "right align the header text"
+    assert clean_transcript("now return the total") == "now return the total"
+
+
+def test_kind_of_and_sort_of_keep_their_meaning():
+    for text in ("add a function that returns the kind of token", "make a list of kind of errors"):
+        assert clean_transcript(text) == text
+    assessed = assess_transcript("add a function that returns the kind of token", SETTINGS)
+    assert assessed.text == "add a function that returns the kind of token" and assessed.skip_optimizer
+
+
+def test_removed_filler_phrase_does_not_skip_the_optimizer():
+    assessed = assess_transcript("create a, you know, function called Sum", SETTINGS)
+    assert assessed.text == "create a function called Sum"
+    assert not assessed.skip_optimizer and "filler phrase removed" in assessed.reason
+
+
+def test_short_clear_transcripts_skip_the_optimizer():
+    cases = {
+        "function to check if number is even": True,
+        "uh create a function called add that adds two numbers": True,
+        "I think maybe we need something like a loop or something": False,
+        "no wait scratch that make it a list instead": False,
+        "the weather is nice": False,
+        "okay so I need a class for a user with a name an email address and a method to print them nicely": False,
+    }
+    for text, expected in cases.items():
+        assert assess_transcript(text, SETTINGS).skip_optimizer is expected, text
+
+
+def test_skip_can_be_disabled():
+    settings = Settings.from_values({"optimizer_skip_enabled": False})
+    assert not assess_transcript("print hello world", settings).skip_optimizer
+
+
+def test_skipped_optimizer_is_never_called(monkeypatch, dictate):
+    calls = []
+    monkeypatch.setattr(backend, "optimize_prompt", lambda text: calls.append(text) or text)
+    monkeypatch.setattr(backend, "get_raw_code", lambda prompt: calls.append(prompt) or "print('hello world')")
+
+    response = dictate("um print hello world").get_json()
+
+    assert response["agent1_skipped"] is True
+    assert len(calls) == 1 and calls[0].endswith("\n\nprint hello world")
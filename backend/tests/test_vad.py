@@ -0,0 +1,90 @@
+"""
+Test script for voice-activity detection
+
+Uses synthetic clips (silence, background noise, a speech-like burst) to check
+that silence is trimmed, silent clips are rejected before whisper runs, and the
+trimmed durations are reported in timings.
+"""
+
+import sys
+import os
+import wave
+
+import numpy as np
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import app as backend
+from audio_io import SAMPLE_RATE
+from vad import detect_speech
+
+RNG = np.random.default_rng(3)
+
+
+def _noise(seconds, level_db=-60):
+    return (RNG.standard_normal(int(SAMPLE_RATE * seconds)) * 10 ** (level_db / 20)).astype(np.float32)
+
+
+def _speech(seconds):
+    """A 150 Hz buzz with a syllable-like envelope, plus a burst of hiss at the end."""
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    envelope = 0.5 + 0.5 * np.abs(np.sin(2 * np.pi * 3 * t))
+    voiced = 0.3 * envelope * np.sign(np.sin(2 * np.pi * 150 * t))
+    hiss = RNG.standard_normal(len(t)) * 0.05 * (t > seconds * 0.8)
+    return (voiced + hiss).astype(np.float32)
+
+
+def _write(path, samples):
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        w.writeframes((np.clip(samples, -1, 1) * 32767).astype("<i2").tobytes())
+    return str(path)
+
+
+def test_leading_and_trailing_silence_is_trimmed():
+    clip = np.concatenate([_noise(0.8), _speech(1.0), _noise(1.2)])
+    result = detect_speech(clip)
+    assert not result.silent
+    # Speech starts at 0.8s and ends at 1.8s; allow for the 200 ms padding and frame rounding
+    assert 0.55 * SAMPLE_RATE <= result.start <= 0.8 * SAMPLE_RATE
+    assert 1.8 * SAMPLE_RATE <= result.end <= 2.05 * SAMPLE_RATE
+    assert 1.5 < result.trimmed_ms / 1000 < 2.1
+
+
+def test_silence_and_steady_noise_are_rejected():
+    assert detect_speech(np.zeros(SAMPLE_RATE, dtype=np.float32)).silent
+    assert detect_speech(_noise(2.0, level_db=-50)).silent
+    assert detect_speech(np.concatenate([_noise(1.0), _speech(0.06), _noise(1.0)])).silent
+
+
+def test_speech_from_start_to_end_is_kept():
+    clip = _speech(1.5)
+    result = detect_speech(clip)
+    assert result.start == 0 and result.end == len(clip)
+
+
+def test_silent_clip_never_reaches_whisper(monkeypatch, tmp_path):
+    calls = []
+
+    async def transcribe_pcm_async(samples):
+        calls.append(len(samples))
+        return "print hello"
+
+    monkeypatch.setattr(backend, "transcribe_pcm_async", transcribe_pcm_async)
+    client = backend.app.test_client()
+
+    silent = client.post('/process-audio', json={"path": _write(tmp_path / "silent.wav", _noise(3.0))})
+    assert silent.status_code == 400
+    assert silent.get_json()["error_type"] == "no_audio"
+    assert calls == []
+
+    monkeypatch.setattr(backend, "get_cache", lambda settings: None)
+    monkeypatch.setattr(backend, "get_raw_code", lambda prompt: "print('hello')")
+    clip = np.concatenate([_noise(1.0), _speech(1.0), _noise(1.0)])
+    spoken = client.post('/process-audio', json={"path": _write(tmp_path / "spoken.wav", clip)}).get_json()
+    assert calls and calls[0] < len(clip)
+    assert spoken["timings"]["audio_duration"] == 3.0
+    assert spoken["timings"]["trimmed_duration"] > 1.0
@@ -0,0 +1,77 @@
+"""
+Test script for the startup warm-up
+
+Runs the warm-up against a stub Ollama server and the fake whisper-cli, and
+checks what it loads plus the /health and /ready endpoints around it.
+"""
+
+import sys
+import os
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import app as backend
+import llm_client
+import warmup as warmup_module
+import whisper_wrapper
+from config import Settings
+from stub_ollama import StubOllama
+
+FAKE_WHISPER_CLI = os.path.join(os.path.dirname(__file__), "fake_whisper_cli.py")
+
+
+def _settings(url, **values):
+    return Settings.from_values({"ollama_endpoint": url, "ollama_model": "coder", "optimizer_model": "optimizer",
+                                 "ollama_keep_alive": "1h", **values})
+
+
+def _patch(monkeypatch, settings):
+    for module in (warmup_module, backend):
+        monkeypatch.setattr(module, "get_settings", lambda: settings)
+    monkeypatch.setattr(whisper_wrapper, "_engine", None)
+    monkeypatch.setattr(whisper_wrapper, "_cli_stdin_command",
+                        lambda: [sys.executable, FAKE_WHISPER_CLI, "--file", "-", "--no-timestamps"])
+
+
+def test_warmup_loads_models_and_reports_ready(monkeypatch):
+    with StubOllama(["x = 1"]) as stub:
+        _patch(monkeypatch, _settings(stub.url, ollama_prefix_context=True))
+        warmup = warmup_module.Warmup()
+        monkeypatch.setattr(backend, "warmup", warmup)
+        client = backend.app.test_client()
+
+        assert client.get('/health').status_code == 200
+        assert client.get('/ready').status_code == 503
+        warmup.run()
+    llm_client.close_session()
+
+    response = client.get('/ready')
+    assert response.status_code == 200
+    steps = response.get_json()["steps"]
+    assert {name: step["status"] for name, step in steps.items()} == {"config": "ok", "ollama": "ok", "whisper": "ok"}
+
+    loads = [p for p in stub.requests if "prompt" not in p]
+    assert [p["model"] for p in loads] == ["optimizer", "coder"]
+    assert all(p["keep_alive"] == "1h" for p in loads)
+    # Both agents' templates were evaluated as system prompts too
+    primes = [p for p in stub.requests if "system" in p]
+    assert [p["model"] for p in primes] == ["optimizer", "coder"]
+    assert all(p["options"]["num_predict"] == 1 for p in primes)
+
+
+def test_failed_step_still_becomes_ready(monkeypatch):
+    _patch(monkeypatch, _settings("http://127.0.0.1:9/api/generate"))
+    monkeypatch.setattr(llm_client, "MAX_RETRIES", 1)
+    warmup = warmup_module.Warmup()
+    warmup.run()
+    assert warmup.ready
+    assert warmup.steps["ollama"]["status"] == "failed"
+    assert warmup.steps["whisper"]["status"] == "ok"
+
+
+def test_disabled_warmup_is_ready_immediately(monkeypatch):
+    _patch(monkeypatch, _settings("", warmup_enabled=False))
+    warmup = warmup_module.Warmup()
+    warmup.start()
+    assert warmup.ready and warmup.steps == {}
@@ -0,0 +1,145 @@
+"""
+Test script for the resident whisper engine
+
+Runs the engine against a fake whisper-server binary and checks that the
+workers stay warm between requests, that dead workers come back in the
+background even after a failed restart without holding up a request, and that
+transcribe() falls back to the one-shot CLI once the engine dies.
+"""
+
+import sys
+import os
+import threading
+import time
+import wave
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import whisper_engine
+import whisper_wrapper
+from config import Settings
+from whisper_engine import WhisperEngine
+
+FAKE_SERVER = [sys.executable, os.path.join(os.path.dirname(__file__), 'fake_whisper_server.py')]
+FAKE_TRANSCRIPT = "create a function that adds two numbers"
+
+
+def _write_silence(path):
+    with wave.open(str(path), 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(16000)
+        w.writeframes(b'\x00\x00' * 1600)
+    return str(path)
+
+
+def _wait_until_available(engine, timeout=10):
+    deadline = time.time() + timeout
+    while not engine.available() and time.time() < deadline:
+        time.sleep(0.05)
+    return engine.available()
+
+
+def test_engine_reuses_warm_workers(tmp_path):
+    audio = _write_silence(tmp_path / "audio.wav")
+    engine = WhisperEngine(FAKE_SERVER, workers=2)
+    try:
+        assert engine.start()
+        pids = {worker.process.pid for worker in engine._workers}
+        for _ in range(4):
+            assert engine.transcribe(audio) == FAKE_TRANSCRIPT
+        # No worker was respawned, so the model was loaded once per worker
+        assert {worker.process.pid for worker in engine._workers} == pids
+    finally:
+        engine.stop()
+
+
+def test_engine_restarts_dead_worker(tmp_path):
+    audio = _write_silence(tmp_path / "audio.wav")
+    engine = WhisperEngine(FAKE_SERVER, workers=1)
+    try:
+        assert engine.start()
+        worker = engine._workers[0]
+        worker.process.kill()
+        worker.process.wait()
+        # A single dead worker makes the engine unavailable until it is revived in the background
+        assert engine.transcribe(audio) is None
+        assert _wait_until_available(engine)
+        assert engine.transcribe(audio) == FAKE_TRANSCRIPT
+    finally:
+        engine.stop()
+
+
+def test_engine_keeps_reviving_after_a_failed_restart(tmp_path, monkeypatch):
+    audio = _write_silence(tmp_path / "audio.wav")
+    monkeypatch.setattr(whisper_engine, "REVIVE_BACKOFF", 0.01)
+    engine = WhisperEngine(FAKE_SERVER, workers=1)
+    try:
+        assert engine.start()
+        worker = engine._workers[0]
+        revive, attempts = engine._revive, []
+
+        def flaky_revive(w):
+            attempts.append(w)
+            return revive(w) if len(attempts) > 2 else False
+        monkeypatch.setattr(engine, "_revive", flaky_revive)
+
+        worker.process.kill()
+        worker.process.wait()
+        # The first two restarts in the background fail, the third brings the worker back
+        assert engine.transcribe(audio) is None
+        assert _wait_until_available(engine)
+        assert len(attempts) == 3
+        assert engine.transcribe(audio) == FAKE_TRANSCRIPT
+    finally:
+        engine.stop()
+
+
+def test_dead_worker_is_revived_off_the_request_thread(tmp_path, monkeypatch):
+    audio = _write_silence(tmp_path / "audio.wav")
+    engine = WhisperEngine(FAKE_SERVER, workers=2)
+    try:
+        assert engine.start()
+        revive, threads = engine._revive, []
+
+        def recording_revive(w):
+            threads.append(threading.current_thread())
+            return revive(w)
+        monkeypatch.setattr(engine, "_revive", recording_revive)
+
+        # The dead worker is the next idle one, while the other keeps the engine available
+        worker = engine._idle.queue[0]
+        worker.process.kill()
+        worker.process.wait()
+        assert engine.available()
+        assert engine.transcribe(audio) is None
+        deadline = time.time() + 10
+        while not worker.alive() and time.time() < deadline:
+            time.sleep(0.05)
+        assert worker.alive()
+        assert threads and threading.current_thread() not in threads
+    finally:
+        engine.stop()
+
+
+def test_cli_commands_use_the_configured_language(monkeypatch):
+    settings = Settings.from_values({"whisper_language": "de"}, 1)
+    monkeypatch.setattr(whisper_wrapper, "get_settings", lambda: settings)
+    for command in (whisper_wrapper._cli_command("audio.wav"), whisper_wrapper._cli_stdin_command()):
+        assert command[command.index("--language") + 1] == "de"
+
+
+def test_transcribe_falls_back_to_cli(tmp_path, monkeypatch):
+    audio = _write_silence(tmp_path / "audio.wav")
+    monkeypatch.setattr(whisper_wrapper, "_transcribe_cli", lambda path: "cli transcript")
+    try:
+        assert whisper_wrapper.start_engine(command=FAKE_SERVER)
+        assert whisper_wrapper.transcribe(audio, cached=False) == FAKE_TRANSCRIPT
+
+        for worker in whisper_wrapper._engine._workers:
+            worker.process.kill()
+            worker.process.wait()
+        assert whisper_wrapper.transcribe(audio, cached=False) == "cli transcript"
+    finally:
+        whisper_wrapper.stop_engine()
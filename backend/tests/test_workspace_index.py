@@ -0,0 +1,173 @@
+"""
+Test script for the workspace snippet index
+
+Covers term extraction, BM25 ranking, incremental refreshes by mtime and hash,
+compaction into a memory-mapped segment that survives a restart, the token
+budget, and checks that /process-audio adds the snippets to the coder prompt
+and that the lookup benchmark runs on a small tree.
+"""
+
+import sys
+import os
+import threading
+import time
+
+# Add the backend and benchmarks directories to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+import app as backend
+import bench_workspace_index
+from config import Settings
+from workspace_index import WorkspaceIndex, Workspace, chunk_bounds, terms
+
+
+def _write(root, path, text):
+    full = root / path
+    full.parent.mkdir(parents=True, exist_ok=True)
+    full.write_text(text)
+    return full
+
+
+def _project(root):
+    _write(root, "users/repository.py", "class UserRepository:\n    def get_user_by_id(self, user_id):\n"
+                                        "        return self.session.query(User).get(user_id)\n")
+    _write(root, "billing/invoice.py", "def render_invoice_pdf(invoice, template):\n    return template.render(invoice)\n")
+    _write(root, "node_modules/lib/user.js", "function getUserById(id) { return null; }\n")
+    _write(root, "README.md", "get_user_by_id is documented here\n")
+
+
+def test_terms_split_identifiers_and_drop_stopwords():
+    found = terms("please create a function that calls getUserById on the user_repository")
+    assert "getuserbyid" in found and "user_repository" in found
+    assert {"get", "user", "repository"} <= set(found)
+    assert "function" not in found and "the" not in found
+
+
+def test_chunks_break_at_definitions():
+    lines = ["import os", "X = 1", "", "", "def a():", "    pass", "", "", "def b():", "    pass"]
+    assert chunk_bounds(lines) == [(0, 4), (4, 8), (8, 10)]
+
+
+def test_search_ranks_matching_definitions(tmp_path):
+    _project(tmp_path / "project")
+    index = WorkspaceIndex(str(tmp_path / "project"), str(tmp_path / "index"))
+    assert index.refresh() == {"indexed": 2, "unchanged": 0, "removed": 0}
+
+    results = index.search("look up the user by id in the repository")
+    assert [path for _, path, _, _ in results] == ["users/repository.py"]
+    assert index.search("render the invoice as a pdf")[0][1] == "billing/invoice.py"
+    assert index.search("nothing matches this") == []
+
+
+def test_refresh_only_reindexes_changed_files(tmp_path):
+    root = tmp_path / "project"
+    _project(root)
+    index = WorkspaceIndex(str(root), str(tmp_path / "index"))
+    index.refresh()
+
+    invoice = root / "billing" / "invoice.py"
+    # Touched without changes: re-hashed, not re-indexed
+    os.utime(invoice, ns=(time.time_ns(), time.time_ns() + 10**9))
+    assert index.refresh() == {"indexed": 0, "unchanged": 1, "removed": 0}
+
+    invoice.write_text("def send_payment_reminder(customer):\n    mailer.send(customer.email)\n")
+    (root / "users" / "repository.py").unlink()
+    assert index.refresh() == {"indexed": 1, "unchanged": 0, "removed": 1}
+    assert index.search("render invoice pdf") == []
+    assert index.search("user repository") == []
+    assert index.search("send a payment reminder")[0][1] == "billing/invoice.py"
+
+
+def test_compacted_index_is_reloaded_from_disk(tmp_path):
+    root = tmp_path / "project"
+    _project(root)
+    first = WorkspaceIndex(str(root), str(tmp_path / "index"), delta_limit=1)
+    first.refresh()
+    _write(root, "billing/tax.py", "def compute_sales_tax(amount, rate):\n    return amount * rate\n")
+    first.refresh()
+    assert first.stats["compactions"] >= 2
+
+    reopened = WorkspaceIndex(str(root), str(tmp_path / "index"))
+    assert reopened.ready
+    assert reopened.search("compute the sales tax")[0][1] == "billing/tax.py"
+    assert reopened.refresh() == {"indexed": 0, "unchanged": 0, "removed": 0}
+    assert [name for name in os.listdir(tmp_path / "index") if name.startswith("segment-")] == [reopened._segment_name]
+
+
+def test_snippets_fit_the_token_budget(tmp_path):
+    root = tmp_path / "project"
+    body = "\n".join(f"    total_amount += line_item_{n}.amount" for n in range(30))
+    _write(root, "orders.py", f"def order_total_amount(order):\n    total_amount = 0\n{body}\n    return total_amount\n")
+    index = WorkspaceIndex(str(root), str(tmp_path / "index"))
+    index.refresh()
+
+    snippets = index.snippets("order total amount", token_budget=40)
+    assert len(snippets) == 1
+    snippet = snippets[0]
+    assert snippet["path"] == "orders.py" and snippet["start"] == 1
+    assert len(snippet["text"]) <= 40 * 4
+    assert snippet["text"].startswith("def order_total_amount(order):")
+    assert snippet["end"] == snippet["text"].count("\n") + 1
+
+
+def test_each_project_keeps_its_own_index(tmp_path):
+    first, second = tmp_path / "first", tmp_path / "second"
+    _project(first)
+    _write(second, "billing/tax.py", "def compute_sales_tax(amount, rate):\n    return amount * rate\n")
+    options = {"workspace_index_path": str(tmp_path / "index"), "workspace_refresh_seconds": 3600}
+    workspace = Workspace()
+
+    old = workspace.get(Settings.from_values({**options, "workspace_path": str(first)}, 1))
+    old.refresh()
+    new = workspace.get(Settings.from_values({**options, "workspace_path": str(second)}, 2))
+    new.refresh()
+    # Refreshing the old index after the switch must not touch the new one's segment
+    (first / "users" / "repository.py").unlink()
+    old.refresh()
+    workspace.get(Settings.from_values({}, 3))
+
+    assert old.index_dir != new.index_dir
+    assert os.path.dirname(old.index_dir) == os.path.dirname(new.index_dir) == str(tmp_path / "index")
+    assert WorkspaceIndex(str(second), new.index_dir).search("compute the sales tax")[0][1] == "billing/tax.py"
+    assert old.search("user repository") == []
+
+
+def test_refresh_stops_when_asked(tmp_path):
+    _project(tmp_path / "project")
+    index = WorkspaceIndex(str(tmp_path / "project"), str(tmp_path / "index"))
+    stop = threading.Event()
+    stop.set()
+    assert index.refresh(stop) == {"indexed": 0, "unchanged": 0, "removed": 0}
+    assert not index.ready
+
+
+def test_coder_prompt_includes_workspace_snippets(tmp_path, monkeypatch, use_settings, dictate):
+    _project(tmp_path / "project")
+    settings = use_settings(coder_prompt="Write {language} code.", language="python",
+                            workspace_path=str(tmp_path / "project"), workspace_index_path=str(tmp_path / "index"),
+                            optimizer_skip_enabled=False)
+    workspace = Workspace()
+    workspace.get(settings).refresh()
+    prompts = []
+    monkeypatch.setattr(backend, "workspace", workspace)
+    monkeypatch.setattr(backend, "optimize_prompt", lambda text: "Get the user by id from the repository.")
+    monkeypatch.setattr(backend.router, "available", lambda settings: True)
+    monkeypatch.setattr(backend, "get_raw_code", lambda prompt: prompts.append(prompt) or "repo.get_user_by_id(1)")
+
+    response = dictate("get the user by id from the repository").get_json()
+    workspace.get(Settings.from_values({}, 2))
+
+    assert response["code"] == "repo.get_user_by_id(1)"
+    assert response["timings"]["workspace_snippets"] == 1
+    assert response["timings"]["workspace_retrieval"] < 1
+    assert prompts[0].startswith("Write Python code.\n\nRelevant code from the project")
+    assert "--- users/repository.py:1-3\nclass UserRepository:" in prompts[0]
+    assert prompts[0].endswith("\n\nGet the user by id from the repository.")
+
+
+def test_lookup_benchmark_runs_on_a_small_tree(tmp_path):
+    result = bench_workspace_index.run(files=200, repeats=1, workdir=str(tmp_path))
+    assert result["files"] == 200 and result["snippets"] >= 200
+    assert result["hits_per_query"] > 0
+    assert result["search_ms"]["max"] < 1000
@@ -0,0 +1,158 @@
+import hashlib
+import logging
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from metrics import current_timings, registry
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "transcripts.sqlite3")
+
+
+def report(result: str):
+    """Counts a lookup and records it in the current timings (metrics.reporting) as `transcript_cache`."""
+    registry.inc("voice2code_transcript_cache_total", result=result)
+    timings = current_timings()
+    if timings is not None:
+        timings['transcript_cache'] = result
+
+
+def fingerprint_samples(samples) -> str:
+    """blake2b of decoded samples, hashed straight from the array's buffer."""
+    buffer = np.ascontiguousarray(samples, dtype=np.float32)
+    return "pcm:" + hashlib.blake2b(memoryview(buffer).cast("B"), digest_size=16).hexdigest()
+
+
+def fingerprint_file(path: str) -> str:
+    """blake2b of an audio file, read through a memory map instead of a copy."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return "file:" + hashlib.blake2b(b"", digest_size=16).hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return "file:" + hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def model_identity(model_path: str) -> str:
+    """The model file's path, size and mtime, so replacing the model invalidates its transcripts."""
+    try:
+        st = os.stat(model_path)
+        return f"{os.path.abspath(model_path)}:{st.st_size}:{st.st_mtime_ns}"
+    except OSError:
+        return os.path.abspath(model_path)
+
+
+class TranscriptCache:
+    """
+    Content-addressed cache of whisper transcripts.
+
+    Keyed on a fingerprint of the audio plus the model file identity and the
+    language, so the same recording re-sent by a retry returns its transcript
+    without running whisper. The least recently used entries are evicted
+    beyond `max_entries`, and everything is written through to a SQLite file
+    so the cache survives backend restarts.
+    """
+
+    def __init__(self, path: str = None, max_entries: int = 1024):
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> transcript, least recently used first
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._open(path)
+
+    def _open(self, path: str):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Batch transcription processes share the file, so wait for each other's writes
+            self._db = sqlite3.connect(path, timeout=5, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS transcripts (key TEXT PRIMARY KEY, text TEXT, last_used REAL)")
+            rows = self._db.execute(
+                "SELECT key, text FROM transcripts ORDER BY last_used DESC LIMIT ?", (self.max_entries,)
+            ).fetchall()
+            for key, text in reversed(rows):
+                self._entries[key] = text
+            self._db.commit()
+            logging.info(f"Transcript cache loaded {len(rows)} entries from {path}")
+        except sqlite3.Error as e:
+            logging.error(f"Transcript cache could not open {path}, running in memory only: {e}")
+            self._db = None
+
+    @staticmethod
+    def key(fingerprint: str, model: str, language: str) -> str:
+        return hashlib.sha256(f"{fingerprint}\n{model}\n{language}".encode()).hexdigest()
+
+    def _write(self, statement: str, rows: list):
+        if self._db is None:
+            return
+        try:
+            self._db.executemany(statement, rows)
+            self._db.commit()
+        except sqlite3.Error as e:
+            logging.warning(f"Transcript cache write failed, keeping the entry in memory only: {e}")
+
+    def get(self, key: str):
+        """Returns the cached transcript, or None on a miss."""
+        with self._lock:
+            text = self._entries.get(key)
+            if text is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            self._write("UPDATE transcripts SET last_used = ? WHERE key = ?", [(time.time(), key)])
+            return text
+
+    def store(self, key: str, text: str):
+        with self._lock:
+            self._entries[key] = text
+            self._entries.move_to_end(key)
+            self._write("INSERT OR REPLACE INTO transcripts VALUES (?, ?, ?)", [(key, text, time.time())])
+            overflow = len(self._entries) - self.max_entries
+            if overflow > 0:
+                evicted = list(self._entries)[:overflow]
+                for old in evicted:
+                    del self._entries[old]
+                self._write("DELETE FROM transcripts WHERE key = ?", [(old,) for old in evicted])
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+_cache = None
+_cache_options = None
+_cache_lock = threading.Lock()
+
+def get_transcript_cache(settings):
+    """
+    Returns the shared transcript cache configured from settings, or None when disabled.
+    The cache is rebuilt only when one of its own options changes.
+    """
+    global _cache, _cache_options
+    if not settings.get("transcript_cache_enabled", True):
+        return None
+
+    options = (
+        settings.get("transcript_cache_path") or DEFAULT_CACHE_PATH,
+        settings.get("transcript_cache_max_entries", 1024),
+    )
+    with _cache_lock:
+        if options != _cache_options:
+            if _cache is not None:
+                _cache.close()
+            _cache = TranscriptCache(*options)
+            _cache_options = options
+        return _cache
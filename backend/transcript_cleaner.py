@@ -0,0 +1,118 @@
+import re
+from dataclasses import dataclass
+
+# Spoken fillers that never carry meaning in a coding request. "kind of" and "sort of"
+# are left alone: "return the kind of token" needs them
+FILLER_PHRASES = [
+    "you know", "i mean", "like i said", "let me see", "let's see",
+]
+FILLER_PHRASE = re.compile(rf",?\s*\b(?:{'|'.join(FILLER_PHRASES)})\b,?", re.IGNORECASE)
+FILLER_WORDS = {"um", "umm", "uh", "uhh", "uhm", "er", "erm", "ah", "ahh", "hmm", "mm", "mhm"}
+
+# Leading throat-clearing words ("okay so", "so basically", ...)
+LEADING_FILLERS = {"so", "okay", "ok", "alright", "well", "basically", "actually"}
+# Leading words that are only filler when set off by a comma ("right, ..." but not "right align ...")
+COMMA_LEADING_FILLERS = {"right", "now"}
+
+# Whisper annotations such as [MUSIC] or (coughs)
+ANNOTATION = re.compile(r"\[[^\]]*\]|\([^)]*\)")
+
+# Signs the speaker is unsure or corrected themselves, which the optimizer handles better
+HEDGES = re.compile(
+    r"\b(maybe|perhaps|probably|not sure|i think|i guess|something like|or something|"
+    r"no wait|wait no|scratch that|actually no|never mind|or maybe|rather)\b"
+)
+
+# Words that mark an instruction the coder can act on directly
+INSTRUCTION_VERBS = {
+    "create", "make", "write", "define", "add", "sort", "print", "return", "reverse", "import",
+    "loop", "iterate", "declare", "initialize", "call", "read", "open", "convert", "check",
+    "remove", "delete", "append", "insert", "filter", "map", "count", "find", "replace",
+    "split", "join", "raise", "catch", "assert", "generate", "implement", "compute", "calculate",
+    "function", "class", "method", "variable", "list", "dictionary", "dict", "for", "while", "if",
+}
+
+
+@dataclass(frozen=True)
+class CleanedTranscript:
+    text: str
+    confidence: float
+    skip_optimizer: bool
+    reason: str
+
+
+def _bare(word: str) -> str:
+    return word.strip(",.!?;:").lower()
+
+
+def clean_transcript(text: str) -> str:
+    """
+    Strips filler words, whisper annotations and stutters ("the the", "sort sort the")
+    from a transcript without changing anything else about it.
+    """
+    text = ANNOTATION.sub(" ", text)
+    text = FILLER_PHRASE.sub(" ", text)
+
+    words = []
+    for word in text.split():
+        bare = _bare(word)
+        if bare in FILLER_WORDS:
+            continue
+        # Collapse immediate repetitions of the same word
+        if words and bare and bare == _bare(words[-1]):
+            continue
+        words.append(word)
+
+    while words and (_bare(words[0]) in LEADING_FILLERS
+                     or (_bare(words[0]) in COMMA_LEADING_FILLERS and words[0].endswith(","))):
+        words.pop(0)
+
+    cleaned = " ".join(words).strip(" ,")
+    # Collapse repeated two-word phrases ("sort the sort the list")
+    cleaned = re.sub(r"\b(\w+ \w+) \1\b", r"\1", cleaned, flags=re.IGNORECASE)
+    return cleaned
+
+
+def assess_transcript(text: str, settings) -> CleanedTranscript:
+    """
+    Cleans a transcript and decides whether it is already a clear enough instruction
+    to send straight to the coder. The confidence score starts at 1.0 and is reduced
+    for length, heavy disfluency, hedging, and missing instruction words.
+    """
+    cleaned = clean_transcript(text)
+    if not settings.get("optimizer_skip_enabled", True):
+        return CleanedTranscript(cleaned, 0.0, False, "disabled")
+
+    words = cleaned.split()
+    original_words = max(1, len(text.split()))
+    if not words:
+        return CleanedTranscript(cleaned, 0.0, False, "empty after cleaning")
+
+    max_words = settings.get("optimizer_skip_max_words", 12)
+    min_confidence = settings.get("optimizer_skip_min_confidence", 0.8)
+
+    confidence = 1.0
+    reasons = []
+    if len(words) > max_words:
+        confidence -= 0.5
+        reasons.append(f"{len(words)} words")
+    removed = 1 - len(words) / original_words
+    if removed > 0.4:
+        # Mostly filler: the speaker was probably thinking aloud
+        confidence -= removed / 2
+        reasons.append(f"{removed:.0%} filler")
+    if HEDGES.search(cleaned.lower()):
+        confidence -= 0.5
+        reasons.append("hedging or self-correction")
+    if not INSTRUCTION_VERBS.intersection(_bare(w) for w in words):
+        confidence -= 0.4
+        reasons.append("no instruction word")
+    # Removing a phrase may have changed what was asked; let Agent 1 read the whole request
+    phrase_removed = FILLER_PHRASE.search(text) is not None
+    if phrase_removed:
+        reasons.append("filler phrase removed")
+
+    confidence = round(max(0.0, confidence), 2)
+    skip = confidence >= min_confidence and not phrase_removed
+    reason = "clear instruction" if not reasons else ", ".join(reasons)
+    return CleanedTranscript(cleaned, confidence, skip, reason)
@@ -0,0 +1,82 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from audio_io import SAMPLE_RATE
+
+
+@dataclass(frozen=True)
+class VadResult:
+    start: int  # First sample to keep
+    end: int  # One past the last sample to keep
+    speech_ms: float  # Total duration of frames classified as speech
+    total_ms: float  # Duration of the input
+
+    @property
+    def silent(self) -> bool:
+        return self.end <= self.start
+
+    @property
+    def trimmed_ms(self) -> float:
+        return self.total_ms - (self.end - self.start) * 1000 / SAMPLE_RATE
+
+
+def frame_features(samples: np.ndarray, frame_len: int):
+    """
+    Splits samples into non-overlapping frames and returns per-frame energy in dBFS
+    and zero-crossing rate (crossings per sample), both computed in one vectorized pass.
+    """
+    n_frames = len(samples) // frame_len
+    frames = samples[:n_frames * frame_len].reshape(n_frames, frame_len)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    energy_db = 20 * np.log10(np.maximum(rms, 1e-10))
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frame_len - 1)
+    return energy_db, zcr
+
+
+def detect_speech(samples: np.ndarray, settings=None) -> VadResult:
+    """
+    Finds the span of speech in 16 kHz mono samples using frame energy plus zero-crossing rate.
+
+    A frame is speech when its energy is above both an absolute floor and the
+    clip's own noise floor (10th percentile) plus a margin; quiet clips whose
+    energy never rises that margin above the floor are silent. Quieter frames with a
+    high zero-crossing rate also count, so unvoiced consonants such as "s" or "f"
+    at the edges of a word are not cut off. The span is padded on both sides, and
+    clips with less than `vad_min_speech_ms` of speech are reported as silent.
+    """
+    get = settings.get if settings is not None else (lambda key, default=None: default)
+    frame_ms = get("vad_frame_ms", 30)
+    threshold_db = get("vad_energy_threshold_db", -45)
+    margin_db = get("vad_noise_margin_db", 10)
+    zcr_threshold = get("vad_zcr_threshold", 0.3)
+    padding_ms = get("vad_padding_ms", 200)
+    min_speech_ms = get("vad_min_speech_ms", 150)
+
+    total_ms = len(samples) * 1000 / SAMPLE_RATE
+    frame_len = max(2, int(SAMPLE_RATE * frame_ms / 1000))
+    if len(samples) < frame_len:
+        return VadResult(0, 0, 0.0, total_ms)
+
+    energy_db, zcr = frame_features(samples, frame_len)
+    noise_floor = np.percentile(energy_db, 10)
+    peak_db = energy_db.max()
+    if peak_db - noise_floor < margin_db and peak_db < threshold_db + 20:
+        # Quiet and flat all the way through: silence or steady background noise
+        return VadResult(0, 0, 0.0, total_ms)
+
+    # Capped below the peak so a clip that is speech from start to end still passes
+    voiced = energy_db > max(threshold_db, min(noise_floor + margin_db, peak_db - margin_db))
+    unvoiced = (energy_db > threshold_db - 10) & (zcr > zcr_threshold) & (energy_db > noise_floor + margin_db / 2)
+    speech = voiced | unvoiced
+
+    speech_ms = float(np.count_nonzero(speech) * frame_ms)
+    if speech_ms < min_speech_ms:
+        return VadResult(0, 0, speech_ms, total_ms)
+
+    indices = np.flatnonzero(speech)
+    padding = int(SAMPLE_RATE * padding_ms / 1000)
+    start = max(0, int(indices[0]) * frame_len - padding)
+    end = min(len(samples), (int(indices[-1]) + 1) * frame_len + padding)
+    return VadResult(start, end, speech_ms, total_ms)
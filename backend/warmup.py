@@ -0,0 +1,118 @@
+import logging
+import threading
+import time
+
+import numpy as np
+
+import llm_client
+from audio_io import SAMPLE_RATE
+from config import get_settings
+from metrics import registry, span
+from prefix_cache import prime
+from router import router
+from whisper_wrapper import transcribe_pcm
+
+log = logging.getLogger("voice2code.warmup")
+
+
+class Warmup:
+    """
+    Pays the backend's cold-start costs before the first dictation instead of during it:
+    loads and validates the settings (which renders the prompt templates), has Ollama
+    load both agents' models and evaluate their fixed prompts, opens the pooled
+    connection to Ollama, and runs one dummy transcription so the ggml model is paged in.
+
+    Runs once in a background thread; /ready reports it. A step that fails is recorded
+    and skipped, since the pipeline can still serve requests cold.
+    """
+
+    def __init__(self):
+        self.steps = {}  # step -> {"status": "ok" | "failed" | "skipped", "seconds": ...}
+        self.started_at = time.time()
+        self._done = threading.Event()
+        self._thread = None
+
+    @property
+    def ready(self) -> bool:
+        return self._done.is_set()
+
+    def start(self):
+        """Runs the warm-up in the background (or not at all when disabled in settings)."""
+        if self._thread is not None:
+            return
+        if not get_settings().get("warmup_enabled", True):
+            log.info("Warm-up disabled in settings.")
+            self._done.set()
+            return
+        self._thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    def run(self):
+        start = time.time()
+        try:
+            with span("warmup"):
+                self._step("config", self._config)
+                self._step("ollama", self._ollama)
+                self._step("whisper", self._whisper)
+        finally:
+            self._done.set()
+        failed = ", ".join(name for name, step in self.steps.items() if step["status"] == "failed")
+        log.info(f"Warm-up finished in {time.time() - start:.2f}s{f' (failed: {failed})' if failed else ''}")
+
+    def _step(self, name: str, function):
+        step_start = time.time()
+        try:
+            with span(name):
+                status = function()
+        except Exception as e:
+            log.warning(f"Warm-up step '{name}' failed: {e}")
+            status = "failed"
+        self.steps[name] = {"status": status, "seconds": round(time.time() - step_start, 3)}
+        registry.inc("voice2code_warmup_total", step=name, status=status)
+
+    @staticmethod
+    def _config() -> str:
+        settings = get_settings()
+        for name in ("optimizer_prompt", "coder_prompt", "fused_prompt"):
+            settings.prompt(name)
+        return "ok"
+
+    @staticmethod
+    def _ollama() -> str:
+        settings = get_settings()
+        if not router.endpoints(settings):
+            return "skipped"
+        agents = {"Optimizer Agent": (settings.optimizer_model, "optimizer_prompt", "optimizer"),
+                  "Coder Agent": (settings.ollama_model, "coder_prompt", "coder")}
+        loaded = set()
+        for agent, (model, template, role) in agents.items():
+            if not model:
+                continue
+            # Every endpoint in the role's pool loads the model, not just the one the router would pick
+            for url in router.endpoints(settings, role):
+                if (url, model) in loaded:
+                    continue
+                # A generate request without a prompt only loads the model
+                payload = llm_client.with_keep_alive(settings, {"model": model, "stream": False})
+                response = llm_client.generate(url, payload,
+                                               timeout=llm_client.model_timeout(settings, model), agent=f"{agent} (load)")
+                if response is None:
+                    return "failed"
+                loaded.add((url, model))
+                prime(settings, url, model, settings.prompt(template), agent)
+        return "ok" if loaded else "skipped"
+
+    @staticmethod
+    def _whisper() -> str:
+        # Half a second of silence; the transcript is thrown away, and a cached one would not page anything in
+        transcribe_pcm(np.zeros(SAMPLE_RATE // 2, dtype=np.float32), cached=False)
+        return "ok"
+
+    def status(self) -> dict:
+        return {"ready": self.ready, "uptime": round(time.time() - self.started_at, 3), "steps": dict(self.steps)}
+
+
+warmup = Warmup()
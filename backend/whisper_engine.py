@@ -0,0 +1,230 @@
+import logging
+import queue
+import socket
+import subprocess
+import threading
+import time
+
+import requests
+
+REVIVE_BACKOFF = 1.0  # Seconds before retrying a worker that failed to restart, doubling up to REVIVE_BACKOFF_MAX
+REVIVE_BACKOFF_MAX = 30.0
+
+
+def _free_port(host: str) -> int:
+    """Asks the OS for an unused TCP port on the given host."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+class WhisperWorker:
+    """
+    A single resident whisper.cpp server process.
+
+    The process loads the ggml model once when it starts and then serves
+    transcription requests over a local socket until it is stopped.
+    """
+
+    def __init__(self, command: list, host: str, port: int, cwd: str = None):
+        self.command = command
+        self.host = host
+        self.port = port
+        self.cwd = cwd
+        self.process = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/inference"
+
+    def start(self, startup_timeout: float) -> bool:
+        """Spawns the server process and waits until it accepts connections."""
+        # Polled through a local, since stop() may clear self.process while a background revive waits here
+        process = self.process = subprocess.Popen(
+            self.command + ["--host", self.host, "--port", str(self.port)],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            cwd=self.cwd
+        )
+
+        deadline = time.time() + startup_timeout
+        while time.time() < deadline:
+            if process.poll() is not None:
+                logging.error(f"Whisper worker on port {self.port} exited with code {process.returncode} during startup.")
+                return False
+            try:
+                with socket.create_connection((self.host, self.port), timeout=0.5):
+                    return True
+            except OSError:
+                time.sleep(0.05)
+
+        logging.error(f"Whisper worker on port {self.port} did not become ready within {startup_timeout}s.")
+        self.stop()
+        return False
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def transcribe_bytes(self, audio: bytes, language: str, timeout: float) -> str:
+        """Sends WAV bytes to the resident server and returns the transcript."""
+        response = requests.post(
+            self.url,
+            files={"file": ("audio.wav", audio, "audio/wav")},
+            data={"response_format": "json", "language": language},
+            timeout=timeout
+        )
+        response.raise_for_status()
+        return response.json().get("text", "").strip()
+
+    def stop(self):
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+
+
+class WhisperEngine:
+    """
+    A warm pool of whisper.cpp server workers.
+
+    Each worker keeps the model resident, so a transcription only pays for
+    inference. transcribe() returns None whenever the engine cannot serve a
+    request, which tells the caller to fall back to the one-shot CLI path.
+    """
+
+    def __init__(self, command: list, workers: int = 1, host: str = "127.0.0.1",
+                 base_port: int = 0, cwd: str = None, language: str = "en",
+                 startup_timeout: float = 30, request_timeout: float = 60):
+        self.command = list(command)
+        self.worker_count = max(1, workers)
+        self.host = host
+        self.base_port = base_port
+        self.cwd = cwd
+        self.language = language
+        self.startup_timeout = startup_timeout
+        self.request_timeout = request_timeout
+        self._workers = []
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._reviving = set()
+        self._started = False
+
+    def _port_for(self, index: int) -> int:
+        if self.base_port:
+            return self.base_port + index
+        return _free_port(self.host)
+
+    def start(self) -> bool:
+        """Starts every worker. Returns True if at least one came up."""
+        with self._lock:
+            if self._started:
+                return bool(self._workers)
+            for index in range(self.worker_count):
+                worker = WhisperWorker(self.command, self.host, self._port_for(index), self.cwd)
+                if worker.start(self.startup_timeout):
+                    self._workers.append(worker)
+                    self._idle.put(worker)
+            self._started = True
+            logging.info(f"Whisper engine started {len(self._workers)}/{self.worker_count} workers.")
+            return bool(self._workers)
+
+    def available(self) -> bool:
+        return any(worker.alive() for worker in self._workers)
+
+    def _revive(self, worker: WhisperWorker) -> bool:
+        """Restarts a dead worker in place. Returns False if it stays down."""
+        logging.warning(f"Whisper worker on port {worker.port} died, restarting.")
+        worker.stop()
+        return worker.start(self.startup_timeout)
+
+    def _revive_later(self, worker: WhisperWorker):
+        """
+        Restarts a dead worker in a background thread, retrying with backoff until
+        it comes up or the engine stops, then hands it back to the idle pool.
+        """
+        with self._lock:
+            if worker in self._reviving or worker not in self._workers:
+                return
+            self._reviving.add(worker)
+
+        def revive():
+            delay = REVIVE_BACKOFF
+            try:
+                while worker in self._workers:
+                    if self._revive(worker):
+                        if worker in self._workers:
+                            self._idle.put(worker)
+                        else:
+                            worker.stop()
+                        return
+                    time.sleep(delay)
+                    delay = min(delay * 2, REVIVE_BACKOFF_MAX)
+            finally:
+                with self._lock:
+                    self._reviving.discard(worker)
+
+        threading.Thread(target=revive, name=f"whisper-revive-{worker.port}", daemon=True).start()
+
+    def _revive_idle(self):
+        """Takes the dead workers out of the idle pool and revives them in the background."""
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            if worker.alive():
+                self._idle.put(worker)
+                return
+            self._revive_later(worker)
+
+    def transcribe(self, audio_file: str) -> str:
+        """Transcribes a WAV file through the pool, or returns None if the engine is down."""
+        try:
+            with open(audio_file, "rb") as f:
+                audio = f.read()
+        except OSError as e:
+            logging.error(f"Whisper engine could not read '{audio_file}': {e}")
+            return None
+        return self.transcribe_bytes(audio)
+
+    def transcribe_bytes(self, audio: bytes) -> str:
+        """Transcribes in-memory WAV bytes, or returns None if the engine is down."""
+        if not self.available():
+            # Every worker is dead; bring them back for the next requests
+            self._revive_idle()
+            return None
+
+        try:
+            worker = self._idle.get(timeout=self.request_timeout)
+        except queue.Empty:
+            logging.error("Timed out waiting for an idle whisper worker.")
+            return None
+
+        try:
+            if not worker.alive():
+                # Restarting would block this request for the model load; the finally hands it to a reviver
+                return None
+            return worker.transcribe_bytes(audio, self.language, self.request_timeout)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logging.error(f"Whisper worker on port {worker.port} failed: {e}")
+            return None
+        finally:
+            if worker.alive():
+                self._idle.put(worker)
+            else:
+                self._revive_later(worker)
+
+    def stop(self):
+        with self._lock:
+            for worker in self._workers:
+                worker.stop()
+            self._workers = []
+            self._idle = queue.Queue()
+            self._started = False
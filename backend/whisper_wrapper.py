@@ -1,52 +1,353 @@
 import subprocess
 import json
 import os
+import asyncio
+import atexit
+import contextlib
+import logging
+from audio_io import encode_wav
+from config import get_settings
+from metrics import span
+from scheduler import scheduler
+from transcript_cache import get_transcript_cache, fingerprint_file, fingerprint_samples, model_identity, report
+from whisper_engine import WhisperEngine
 
-def transcribe(audio_file: str) -> str:
+log = logging.getLogger("voice2code.whisper")
+
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+executable_dir = os.path.join(backend_dir, "models", "whisper.cpp")
+model_path = os.path.join(backend_dir, "models", "ggml-base.bin")
+
+# Resident transcription engine, created by start_engine() at backend startup
+_engine = None
+
+def start_engine(command: list = None, workers: int = None) -> bool:
     """
-    Transcribes the given audio file using the whisper.cpp executable.
-    It relies on the executable creating a .json file with the same name.
+    Starts the resident whisper.cpp engine so the model is loaded only once.
+    `command` replaces the whisper-server executable (used by tests to run a fake binary).
+    Returns False if the engine is disabled or could not be started; transcribe()
+    then keeps using the one-shot CLI path.
+    """
+    global _engine
+    settings = get_settings()
+    if command is None and not settings.get("whisper_engine_enabled", True):
+        log.info("Whisper engine disabled in settings, using whisper-cli per request.")
+        return False
+
+    if command is None:
+        server_path = os.path.join(executable_dir, settings.get("whisper_server_executable", "whisper-server.exe"))
+        if not os.path.exists(server_path):
+            log.info(f"Whisper server not found at '{server_path}', using whisper-cli per request.")
+            return False
+        command = [server_path]
+
+    stop_engine()
+    _engine = WhisperEngine(
+        command + ["--model", model_path],
+        workers=workers or settings.get("whisper_engine_workers", 1),
+        base_port=settings.get("whisper_engine_port", 0),
+        cwd=executable_dir if os.path.isdir(executable_dir) else None,
+        language=settings.get("whisper_language", "en")
+    )
+    if not _engine.start():
+        log.warning("Whisper engine failed to start, using whisper-cli per request.")
+        _engine = None
+        return False
+    return True
+
+def stop_engine():
+    """Shuts down the resident whisper engine, if any."""
+    global _engine
+    if _engine is not None:
+        _engine.stop()
+        _engine = None
+
+atexit.register(stop_engine)
+
+def _cached_transcript(fingerprint):
+    """
+    Looks the audio up in the transcript cache. `fingerprint` is called only when
+    the cache is enabled. Returns (cache, key, transcript): cache is None when
+    caching is disabled or the audio could not be read, transcript None on a miss.
     """
-    backend_dir = os.path.dirname(os.path.abspath(__file__))
-    executable_dir = os.path.join(backend_dir, "models", "whisper.cpp")
-    executable_path = os.path.join(executable_dir, "whisper-cli.exe")
-    model_path = os.path.join(backend_dir, "models", "ggml-base.bin")
+    settings = get_settings()
+    cache = get_transcript_cache(settings)
+    if cache is None:
+        return None, None, None
+    try:
+        with span("fingerprint"):
+            key = cache.key(fingerprint(), model_identity(model_path), settings.get("whisper_language", "en"))
+    except OSError as e:
+        log.warning(f"Could not fingerprint the audio, transcribing it uncached: {e}")
+        return None, None, None
+    transcribed_text = cache.get(key)
+    report("hit" if transcribed_text is not None else "miss")
+    if transcribed_text is not None:
+        log.debug(f"Transcript cache hit: {transcribed_text}")
+    return cache, key, transcribed_text
+
+def _store_transcript(cache, key: str, transcribed_text: str):
+    # Failed transcriptions come back empty and are retried next time
+    if cache is not None and transcribed_text:
+        cache.store(key, transcribed_text)
+
+def transcribe(audio_file: str, cached: bool = True, slot=contextlib.nullcontext) -> str:
+    """
+    Transcribes the given audio file.
+    Returns the cached transcript when the same file content was transcribed
+    before; otherwise uses the resident engine when it is running and falls
+    back to the one-shot CLI, holding `slot()` meanwhile.
+    """
+    cache, key, transcribed_text = _cached_transcript(lambda: fingerprint_file(audio_file)) if cached else (None, None, None)
+    if transcribed_text is None:
+        with slot():
+            transcribed_text = _transcribe(audio_file)
+        _store_transcript(cache, key, transcribed_text)
+    return transcribed_text
+
+async def transcribe_async(audio_file: str, cached: bool = True) -> str:
+    """
+    Asyncio version of transcribe() for the pipeline event loop, where whisper
+    runs once the scheduler has a free whisper slot for the job.
+    """
+    cache, key, transcribed_text = (await asyncio.to_thread(_cached_transcript, lambda: fingerprint_file(audio_file))
+                                    if cached else (None, None, None))
+    if transcribed_text is None:
+        async with scheduler.stage("transcribe", "whisper"):
+            transcribed_text = await _transcribe_async(audio_file)
+        _store_transcript(cache, key, transcribed_text)
+    return transcribed_text
+
+def transcribe_pcm(samples, cached: bool = True, slot=contextlib.nullcontext) -> str:
+    """
+    Transcribes 16 kHz mono float32 samples without touching the disk, or
+    returns the cached transcript of identical samples.
+    """
+    cache, key, transcribed_text = _cached_transcript(lambda: fingerprint_samples(samples)) if cached else (None, None, None)
+    if transcribed_text is None:
+        with slot():
+            transcribed_text = _transcribe_pcm(samples)
+        _store_transcript(cache, key, transcribed_text)
+    return transcribed_text
+
+async def transcribe_pcm_async(samples, cached: bool = True) -> str:
+    """
+    Asyncio version of transcribe_pcm(), scheduled like transcribe_async(). The
+    lookup runs in the loop's thread pool.
+    """
+    cache, key, transcribed_text = (await asyncio.to_thread(_cached_transcript, lambda: fingerprint_samples(samples))
+                                    if cached else (None, None, None))
+    if transcribed_text is None:
+        async with scheduler.stage("transcribe", "whisper"):
+            transcribed_text = await _transcribe_pcm_async(samples)
+        _store_transcript(cache, key, transcribed_text)
+    return transcribed_text
+
+def _transcribe(audio_file: str) -> str:
+    """Uses the resident engine when it is running and falls back to the one-shot CLI otherwise."""
+    if _engine is not None:
+        with span("engine"):
+            transcribed_text = _engine.transcribe(audio_file)
+        if transcribed_text is not None:
+            log.debug(f"Transcription successful (engine): {transcribed_text}")
+            return transcribed_text
+        log.warning("Whisper engine unavailable, falling back to whisper-cli.")
+    return _transcribe_cli(audio_file)
+
+async def _transcribe_async(audio_file: str) -> str:
+    """
+    Asyncio version of _transcribe().
+    The one-shot CLI runs via asyncio.create_subprocess_exec and is killed if the
+    dictation is cancelled; engine requests run in the loop's thread pool.
+    """
+    if _engine is not None:
+        with span("engine"):
+            transcribed_text = await asyncio.to_thread(_engine.transcribe, audio_file)
+        if transcribed_text is not None:
+            log.debug(f"Transcription successful (engine): {transcribed_text}")
+            return transcribed_text
+        log.warning("Whisper engine unavailable, falling back to whisper-cli.")
+
+    command = _cli_command(audio_file)
+    log.debug(f"Running Whisper.cpp command: {' '.join(command)}")
+    try:
+        with span("spawn"):
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=_cli_cwd()
+            )
+    except OSError as e:
+        log.error(f"Could not start Whisper.cpp: {e}")
+        return ""
+
+    try:
+        # Model load plus inference, until whisper-cli exits
+        with span("model"):
+            _, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        # The dictation was superseded; don't leave whisper running
+        process.kill()
+        await process.wait()
+        raise
+    return _read_cli_output(audio_file, process.returncode, stderr.decode(errors="replace"))
 
-    command = [
-        executable_path,
+def _transcribe_pcm(samples) -> str:
+    """
+    The audio goes to the resident engine over its socket, or to whisper-cli on stdin,
+    and the transcript comes back on stdout instead of a .json sidecar file.
+    """
+    with span("encode"):
+        audio = encode_wav(samples)
+    transcribed_text = _engine_transcribe_bytes(audio)
+    if transcribed_text is not None:
+        return transcribed_text
+
+    command = _cli_stdin_command()
+    log.debug(f"Running Whisper.cpp command: {' '.join(command)}")
+    try:
+        with span("spawn"):
+            process = subprocess.Popen(
+                command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=_cli_cwd()
+            )
+    except OSError as e:
+        log.error(f"Could not start Whisper.cpp: {e}")
+        return ""
+    # Model load plus inference, until whisper-cli exits
+    with span("model"):
+        stdout, stderr = process.communicate(input=audio)
+    return _read_cli_stdout(process.returncode, stdout, stderr)
+
+async def _transcribe_pcm_async(samples) -> str:
+    """
+    Asyncio version of _transcribe_pcm(). Like _transcribe_async(), whisper-cli is
+    killed if the dictation is cancelled.
+    """
+    with span("encode"):
+        audio = encode_wav(samples)
+    transcribed_text = await asyncio.to_thread(_engine_transcribe_bytes, audio)
+    if transcribed_text is not None:
+        return transcribed_text
+
+    command = _cli_stdin_command()
+    log.debug(f"Running Whisper.cpp command: {' '.join(command)}")
+    try:
+        with span("spawn"):
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=_cli_cwd()
+            )
+    except OSError as e:
+        log.error(f"Could not start Whisper.cpp: {e}")
+        return ""
+
+    try:
+        with span("model"):
+            stdout, stderr = await process.communicate(input=audio)
+    except asyncio.CancelledError:
+        # The dictation was superseded; don't leave whisper running
+        process.kill()
+        await process.wait()
+        raise
+    return _read_cli_stdout(process.returncode, stdout, stderr)
+
+def _engine_transcribe_bytes(audio: bytes):
+    """Transcribes WAV bytes on the resident engine, or returns None when the CLI has to take over."""
+    if _engine is None:
+        return None
+    with span("engine"):
+        transcribed_text = _engine.transcribe_bytes(audio)
+    if transcribed_text is not None:
+        log.debug(f"Transcription successful (engine): {transcribed_text}")
+        return transcribed_text
+    log.warning("Whisper engine unavailable, falling back to whisper-cli.")
+    return None
+
+def _cli_executable() -> list:
+    """The `whisper_cli_command` setting, or the whisper-cli.exe next to the models."""
+    return list(get_settings().get("whisper_cli_command") or [os.path.join(executable_dir, "whisper-cli.exe")])
+
+def _language() -> str:
+    return get_settings().get("whisper_language", "en")
+
+def _cli_stdin_command() -> list:
+    return [
+        *_cli_executable(),
+        "--model", model_path,
+        "--file", "-",  # Read the WAV data from stdin
+        "--no-timestamps",  # Plain transcript lines on stdout
+        "--no-prints",
+        "--language", _language()
+    ]
+
+def _read_cli_stdout(returncode: int, stdout: bytes, stderr: bytes) -> str:
+    """Joins the transcript lines whisper-cli printed to stdout."""
+    if returncode != 0:
+        log.error(f"Whisper.cpp process exited with code {returncode}:\n{stderr.decode(errors='replace').strip()}")
+        return ""
+    lines = stdout.decode("utf-8", errors="replace").splitlines()
+    transcribed_text = " ".join(line.strip() for line in lines if line.strip())
+    log.debug(f"Transcription successful: {transcribed_text}")
+    return transcribed_text
+
+def _cli_cwd():
+    return executable_dir if os.path.isdir(executable_dir) else None
+
+def _cli_command(audio_file: str) -> list:
+    return [
+        *_cli_executable(),
         "--model", model_path,
         "--file", audio_file,
         "--output-json", # This flag makes it create a .json file
-        "--language", "en"
+        "--language", _language()
     ]
 
-    print(f"Running Whisper.cpp command: {' '.join(command)}")
-    print(f"Executing in directory: {executable_dir}")
+def _transcribe_cli(audio_file: str) -> str:
+    """
+    Transcribes the given audio file using the whisper.cpp executable.
+    It relies on the executable creating a .json file with the same name.
+    """
+    command = _cli_command(audio_file)
+
+    log.debug(f"Running Whisper.cpp command: {' '.join(command)}")
+    log.debug(f"Executing in directory: {executable_dir}")
+
+    try:
+        with span("cli"):
+            result = subprocess.run(
+                command,
+                capture_output=True,
+                text=True,
+                cwd=_cli_cwd()
+            )
+    except OSError as e:
+        log.error(f"Could not start Whisper.cpp: {e}")
+        return ""
+    return _read_cli_output(audio_file, result.returncode, result.stderr)
+
+def _read_cli_output(audio_file: str, returncode: int, stderr: str) -> str:
+    """Reads the transcript from the .json file written by whisper-cli, then deletes it."""
+    if returncode != 0:
+        log.error(f"Whisper.cpp process exited with code {returncode}:\n{stderr.strip()}")
+        return ""
+    if stderr:
+        # Logged for debugging, but not a fatal error unless the return code is non-zero
+        log.debug(f"Whisper.cpp stderr:\n{stderr.strip()}")
+
+    # The executable creates a .json file, so we read that file instead of stdout.
+    json_file_path = audio_file + ".json"
+    log.debug(f"Attempting to read JSON output from: {json_file_path}")
 
     try:
-        result = subprocess.run(
-            command,
-            capture_output=True,
-            text=True,
-            cwd=executable_dir
-        )
-
-        if result.stderr:
-            # Print stderr for debugging, but don't treat it as a fatal error unless the return code is non-zero
-            print("--- Whisper.cpp STDERR ---")
-            print(result.stderr.strip())
-            print("--------------------------")
-
-        if result.returncode != 0:
-            print(f"FATAL ERROR: Whisper.cpp process exited with code {result.returncode}.")
-            return ""
-
-        # --- KEY CHANGE --- 
-        # The executable creates a .json file, so we read that file instead of stdout.
-        json_file_path = audio_file + ".json"
-        print(f"Attempting to read JSON output from: {json_file_path}")
-
-        with open(json_file_path, 'r', encoding='utf-8') as f:
+        with span("json"), open(json_file_path, 'r', encoding='utf-8') as f:
             data = json.load(f)
         
         # The structure of the JSON might be a list of segments
@@ -56,17 +357,17 @@ def transcribe(audio_file: str) -> str:
             # Fallback for a different JSON structure
             transcribed_text = data.get('text', '').strip()
 
-        print(f"Transcription successful: {transcribed_text}")
+        log.debug(f"Transcription successful: {transcribed_text}")
         # Clean up the generated .json file
         os.remove(json_file_path)
         return transcribed_text.strip()
 
     except FileNotFoundError:
-        print(f"FATAL ERROR: Could not find the generated JSON file at '{json_file_path}'.")
+        log.error(f"Could not find the generated JSON file at '{json_file_path}'.")
         return ""
     except json.JSONDecodeError:
-        print(f"FATAL ERROR: Failed to decode JSON from file '{json_file_path}'.")
+        log.error(f"Failed to decode JSON from file '{json_file_path}'.")
         return ""
     except Exception as e:
-        print(f"An unexpected error occurred in whisper_wrapper: {e}")
+        log.exception(f"An unexpected error occurred in whisper_wrapper: {e}")
         return ""
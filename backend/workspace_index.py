@@ -0,0 +1,522 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+log = logging.getLogger("voice2code.workspace")
+
+DEFAULT_INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "workspace_index")
+DEFAULT_EXTENSIONS = (".py", ".js", ".jsx", ".ts", ".tsx", ".java", ".kt", ".c", ".h", ".cpp", ".hpp", ".cs",
+                      ".go", ".rs", ".rb", ".php", ".swift", ".scala", ".lua", ".sh", ".ps1", ".sql")
+SKIP_DIRS = frozenset({".git", ".hg", ".svn", "node_modules", "__pycache__", ".venv", "venv", "env", "build", "dist",
+                       "target", "out", ".idea", ".vscode", ".mypy_cache", ".pytest_cache", ".tox"})
+MAX_FILE_BYTES = 512 * 1024  # Larger files are generated or data, not code worth quoting
+CHUNK_LINES = 40  # A snippet is one definition, split every this many lines
+MIN_CHUNK_LINES = 4  # Consecutive one-line definitions (constants, imports) stay together
+DELTA_LIMIT = 200_000  # Postings changed since the last compaction before the segment is rewritten
+MAX_DF = 0.05  # Terms in more than this share of the snippets are too common to rank by
+K1, B = 1.2, 0.75  # BM25
+CHARS_PER_TOKEN = 4
+MANIFEST = "manifest.json"
+ARRAYS = ("terms", "offsets", "postings", "freqs", "docs")
+
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_SUBWORD = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+_DEFINITION = re.compile(r"[ \t]{0,4}(?:(?:export|public|private|protected|static|async|pub|default|abstract)\s+)*"
+                         r"(?:def|class|function|func|fn|struct|interface|enum|impl|trait|module|type|const|let|var)\b")
+
+# Words that say nothing about which code is meant: English glue and the dictation's own vocabulary
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have if in into is it its of on or so that the their them then there these
+this to was were will with which while who would should could can may me my we our you your i do does did not no
+create make write add use using function method class code called named new return returns value values takes
+take given print variable variables list file please want need like just also one two all each when what how
+def self none true false null let var const int str string import from
+""".split())
+
+
+def terms(text: str) -> list:
+    """
+    The index terms of a text: each identifier lowercased, plus the words of
+    camelCase and snake_case identifiers so "get user" finds getUserById.
+    """
+    found = []
+    for identifier in _IDENTIFIER.findall(text):
+        lower = identifier.lower()
+        if len(lower) > 1 and lower not in STOPWORDS:
+            found.append(lower)
+        parts = _SUBWORD.findall(identifier)
+        if len(parts) > 1:
+            found.extend(part for part in (p.lower() for p in parts) if len(part) > 2 and part not in STOPWORDS)
+    return found
+
+
+_hashes = {}
+
+
+def term_hash(term: str) -> int:
+    """A stable 63-bit id for a term (Python's hash() changes between runs)."""
+    value = _hashes.get(term)
+    if value is None:
+        if len(_hashes) > 1_000_000:
+            _hashes.clear()
+        value = _hashes[term] = int.from_bytes(hashlib.blake2b(term.encode(), digest_size=8).digest(), "little") >> 1
+    return value
+
+
+def chunk_bounds(lines: list) -> list:
+    """Splits a file's lines into (start, end) snippets at top-level definitions."""
+    bounds = [0]
+    for number, line in enumerate(lines):
+        size = number - bounds[-1]
+        if size >= CHUNK_LINES or (size >= MIN_CHUNK_LINES and _DEFINITION.match(line)):
+            bounds.append(number)
+    bounds.append(len(lines))
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def index_text(text: str) -> list:
+    """The snippets of a file as (start, end, length, term hashes, term frequencies)."""
+    lines = text.splitlines()
+    snippets = []
+    for start, end in chunk_bounds(lines):
+        counts = Counter(terms("\n".join(lines[start:end])))
+        if not counts:
+            continue
+        hashes = np.fromiter((term_hash(term) for term in counts), dtype=np.uint64, count=len(counts))
+        freqs = np.minimum(np.fromiter(counts.values(), dtype=np.int64, count=len(counts)), 65535).astype(np.uint16)
+        snippets.append((start, end, sum(counts.values()), hashes, freqs))
+    return snippets
+
+
+class _Segment:
+    """
+    An immutable on-disk inverted index, memory-mapped:
+    terms (sorted term hashes), offsets (where each term's postings start),
+    postings (snippet ids), freqs (term frequency per posting) and docs
+    (file id, first line, end line, length in terms per snippet).
+    """
+
+    def __init__(self, directory: str = None):
+        self.directory = directory
+        if directory is None:
+            self.terms = np.zeros(0, np.uint64)
+            self.offsets = np.zeros(1, np.int64)
+            self.postings = np.zeros(0, np.int32)
+            self.freqs = np.zeros(0, np.uint16)
+            self.docs = np.zeros((0, 4), np.int32)
+        else:
+            for name in ARRAYS:
+                setattr(self, name, np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r"))
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def lookup(self, term: int):
+        """(snippet ids, frequencies) of a term's postings."""
+        index = int(np.searchsorted(self.terms, np.uint64(term)))
+        if index >= len(self.terms) or int(self.terms[index]) != term:
+            return None
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        return self.postings[start:end], self.freqs[start:end]
+
+    def expanded_terms(self) -> np.ndarray:
+        """The term of every posting."""
+        return np.repeat(np.asarray(self.terms), np.diff(np.asarray(self.offsets)))
+
+    @staticmethod
+    def write(directory: str, terms, docs, freqs, table):
+        """Writes postings given as parallel (term, snippet id, frequency) arrays plus the snippet table."""
+        order = np.lexsort((docs, terms))
+        terms, docs, freqs = terms[order], docs[order], freqs[order]
+        starts = np.flatnonzero(np.r_[True, terms[1:] != terms[:-1]]) if len(terms) else np.zeros(0, np.int64)
+        os.makedirs(directory, exist_ok=True)
+        arrays = {"terms": terms[starts].astype(np.uint64), "offsets": np.r_[starts, len(terms)].astype(np.int64),
+                  "postings": docs.astype(np.int32), "freqs": freqs.astype(np.uint16),
+                  "docs": np.asarray(table, dtype=np.int32).reshape(-1, 4)}
+        for name, array in arrays.items():
+            np.save(os.path.join(directory, f"{name}.npy"), array)
+
+
+class WorkspaceIndex:
+    """
+    BM25 index of the code in a project directory, for the coder prompt.
+
+    Files are split into snippets (a top-level definition, at most CHUNK_LINES
+    lines) and their identifiers into terms. The bulk of the index is a
+    memory-mapped segment on disk; files changed since it was written are kept
+    in a small in-memory delta, and the snippets they replace are masked out,
+    until the delta grows past DELTA_LIMIT postings and both are merged into a
+    new segment. refresh() only re-reads files whose mtime or size changed, and
+    only re-indexes those whose content hash changed too.
+
+    A lookup is one binary search per query term in the segment plus numpy
+    scoring over that term's postings. Terms in more than MAX_DF of the
+    snippets are skipped, which bounds the work per term, but it still grows
+    with the size of the project: benchmarks/bench_workspace_index.py measures
+    it on a synthetic 100,000-file tree.
+    """
+
+    def __init__(self, root: str, index_dir: str = DEFAULT_INDEX_DIR, extensions=DEFAULT_EXTENSIONS,
+                 delta_limit: int = DELTA_LIMIT):
+        self.root = os.path.abspath(root)
+        self.index_dir = index_dir
+        self.extensions = tuple(extension.lower() for extension in extensions)
+        self.delta_limit = delta_limit
+        self.stats = {"indexed": 0, "unchanged": 0, "removed": 0, "compactions": 0, "refresh_seconds": None}
+        self.ready = False
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._files = {}  # relative path -> {"mtime_ns", "size", "hash", "id", "docs"}
+        self._paths = []  # file id -> relative path
+        self._segment = _Segment()
+        self._segment_name = None
+        self._delta_docs = {}  # snippet id -> (file id, start, end, length, hashes, freqs)
+        self._delta_postings = {}  # term -> {snippet id: frequency}
+        self._delta_size = 0
+        self._deleted = set()  # Snippet ids of the segment that changed or were removed
+        self._deleted_array = np.zeros(0, np.int64)
+        self._next_doc = 0
+        self._live_docs = 0
+        self._total_length = 0
+        self._load()
+
+    # --- Lookup
+
+    def search(self, text: str, limit: int = 5) -> list:
+        """The best matching snippets as (score, path, start, end), best first."""
+        query = list(dict.fromkeys(term_hash(term) for term in terms(text)))
+        if not query:
+            return []
+        with self._lock:
+            segment, deleted = self._segment, self._deleted_array
+            live_docs, average = max(1, self._live_docs), max(1.0, self._total_length / max(1, self._live_docs))
+            delta = [(term, dict(self._delta_postings.get(term, {}))) for term in query]
+            delta_docs = {doc: self._delta_docs[doc][:4] for _, postings in delta for doc in postings}
+
+        ids, weights = [], []
+        for term, delta_postings in delta:
+            found = segment.lookup(term)
+            df = (len(found[0]) if found is not None else 0) + len(delta_postings)
+            if not df or df > max(100, MAX_DF * live_docs):
+                continue
+            idf = np.log(1 + (live_docs - df + 0.5) / (df + 0.5))
+            if found is not None:
+                docs, freqs = np.asarray(found[0]), np.asarray(found[1], dtype=np.float64)
+                lengths = segment.docs[docs, 3]
+                ids.append(docs.astype(np.int64))
+                weights.append(idf * freqs * (K1 + 1) / (freqs + K1 * (1 - B + B * lengths / average)))
+            if delta_postings:
+                docs = np.fromiter(delta_postings.keys(), dtype=np.int64, count=len(delta_postings))
+                freqs = np.fromiter(delta_postings.values(), dtype=np.float64, count=len(delta_postings))
+                lengths = np.array([delta_docs[doc][3] for doc in delta_postings], dtype=np.float64)
+                ids.append(docs)
+                weights.append(idf * freqs * (K1 + 1) / (freqs + K1 * (1 - B + B * lengths / average)))
+        if not ids:
+            return []
+
+        unique, inverse = np.unique(np.concatenate(ids), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(weights))
+        if len(deleted):
+            scores[np.isin(unique, deleted, assume_unique=True)] = 0
+        count = min(limit, len(unique))
+        best = np.argpartition(-scores, count - 1)[:count]
+        best = best[np.argsort(-scores[best])]
+
+        results = []
+        for position in best:
+            score, doc = float(scores[position]), int(unique[position])
+            if score <= 0:
+                break
+            file_id, start, end, _ = delta_docs[doc] if doc in delta_docs else segment.docs[doc]
+            results.append((round(score, 3), self._paths[int(file_id)], int(start), int(end)))
+        return results
+
+    def snippets(self, text: str, token_budget: int, limit: int = 3) -> list:
+        """
+        The code of the best matching snippets that fits in `token_budget`
+        (estimated at CHARS_PER_TOKEN characters a token), as dicts with
+        path, start and end line (1-based, inclusive), score and text.
+        """
+        budget = token_budget * CHARS_PER_TOKEN
+        found = []
+        for score, path, start, end in self.search(text, limit * 3):
+            if len(found) >= limit or budget <= 0:
+                break
+            try:
+                with open(os.path.join(self.root, path), "r", encoding="utf-8", errors="replace") as f:
+                    lines = f.read().splitlines()[start:end]
+            except OSError:
+                continue
+            while lines and not lines[-1].strip():
+                lines.pop()
+            code = ""
+            for line in lines:
+                if len(code) + len(line) + 1 > budget:
+                    break
+                code += line + "\n"
+            if code.strip():
+                budget -= len(code)
+                found.append({"path": path, "start": start + 1, "end": start + code.count("\n"),
+                              "score": score, "text": code.rstrip("\n")})
+        return found
+
+    # --- Updates
+
+    def refresh(self, stop: threading.Event = None) -> dict:
+        """
+        Brings the index up to date with the directory and returns what changed.
+        Setting `stop` abandons the walk; the files indexed so far are not saved.
+        """
+        with self._refresh_lock:
+            start = time.perf_counter()
+            counts = {"indexed": 0, "unchanged": 0, "removed": 0}
+            seen = set()
+            for path, stat in self._walk():
+                if stop is not None and stop.is_set():
+                    return counts
+                seen.add(path)
+                entry = self._files.get(path)
+                if entry is not None and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+                    continue
+                try:
+                    with open(os.path.join(self.root, path), "rb") as f:
+                        data = f.read()
+                except OSError:
+                    continue
+                digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+                if entry is not None and entry["hash"] == digest:
+                    # Touched, not changed
+                    entry["mtime_ns"], entry["size"] = stat.st_mtime_ns, stat.st_size
+                    counts["unchanged"] += 1
+                    continue
+                snippets = index_text(data.decode("utf-8", errors="replace"))
+                with self._lock:
+                    self._replace(path, stat, digest, snippets)
+                counts["indexed"] += 1
+                if self._delta_size > self.delta_limit:
+                    self._compact()
+            for path in set(self._files) - seen:
+                with self._lock:
+                    self._remove(path)
+                counts["removed"] += 1
+            if self._delta_size and (self._segment_name is None or self._delta_size > self.delta_limit):
+                self._compact()
+            self.ready = True
+            for key, value in counts.items():
+                self.stats[key] += value
+            self.stats["refresh_seconds"] = round(time.perf_counter() - start, 3)
+            return counts
+
+    def _walk(self):
+        stack = [""]
+        while stack:
+            relative = stack.pop()
+            try:
+                entries = list(os.scandir(os.path.join(self.root, relative)))
+            except OSError:
+                continue
+            for entry in entries:
+                path = f"{relative}/{entry.name}" if relative else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in SKIP_DIRS and not entry.name.startswith("."):
+                        stack.append(path)
+                elif entry.name.lower().endswith(self.extensions):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    if stat.st_size <= MAX_FILE_BYTES:
+                        yield path, stat
+
+    def _replace(self, path: str, stat, digest: str, snippets: list):
+        entry = self._files.get(path)
+        if entry is None:
+            entry = self._files[path] = {"id": len(self._paths), "docs": []}
+            self._paths.append(path)
+        else:
+            self._drop_docs(entry)
+        entry.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size, hash=digest)
+        for start, end, length, hashes, freqs in snippets:
+            doc = self._next_doc
+            self._next_doc += 1
+            self._delta_docs[doc] = (entry["id"], start, end, length, hashes, freqs)
+            for term, freq in zip(hashes.tolist(), freqs.tolist()):
+                self._delta_postings.setdefault(term, {})[doc] = freq
+            self._delta_size += len(hashes)
+            self._live_docs += 1
+            self._total_length += length
+            entry["docs"].append(doc)
+
+    def _remove(self, path: str):
+        entry = self._files.pop(path)
+        self._drop_docs(entry)
+
+    def _drop_docs(self, entry: dict):
+        segment_docs = len(self._segment)
+        for doc in entry["docs"]:
+            if doc < segment_docs:
+                self._deleted.add(doc)
+                self._total_length -= int(self._segment.docs[doc, 3])
+            else:
+                _, _, _, length, hashes, _ = self._delta_docs.pop(doc)
+                for term in hashes.tolist():
+                    postings = self._delta_postings.get(term)
+                    postings.pop(doc, None)
+                    if not postings:
+                        del self._delta_postings[term]
+                self._delta_size -= len(hashes)
+                self._total_length -= length
+            self._live_docs -= 1
+        entry["docs"] = []
+        self._deleted_array = np.array(sorted(self._deleted), dtype=np.int64)
+
+    def _compact(self):
+        """Merges the live part of the segment and the delta into a new segment and switches to it."""
+        start = time.perf_counter()
+        with self._lock:
+            segment, deleted = self._segment, self._deleted_array
+            delta_docs = dict(self._delta_docs)
+
+        # Postings of the segment's live snippets
+        terms = segment.expanded_terms()
+        docs = np.asarray(segment.postings, dtype=np.int64)
+        freqs = np.asarray(segment.freqs)
+        if len(deleted):
+            keep = ~np.isin(docs, deleted)
+            terms, docs, freqs = terms[keep], docs[keep], freqs[keep]
+        if delta_docs:
+            delta_ids = list(delta_docs)
+            terms = np.concatenate([terms] + [delta_docs[doc][4] for doc in delta_ids])
+            docs = np.concatenate([docs] + [np.full(len(delta_docs[doc][4]), doc, np.int64) for doc in delta_ids])
+            freqs = np.concatenate([freqs] + [delta_docs[doc][5] for doc in delta_ids])
+
+        # Renumber the live snippets 0..n-1
+        live = np.setdiff1d(np.arange(len(segment), dtype=np.int64), deleted, assume_unique=True)
+        old_ids = np.concatenate([live, np.array(sorted(delta_docs), dtype=np.int64)])
+        table = np.concatenate([np.asarray(segment.docs)[live].reshape(-1, 4),
+                                np.array([delta_docs[doc][:4] for doc in sorted(delta_docs)], dtype=np.int32).reshape(-1, 4)])
+        new_ids = np.searchsorted(old_ids, docs)
+
+        name = f"segment-{time.time_ns()}"
+        _Segment.write(os.path.join(self.index_dir, name), terms, new_ids, freqs, table)
+        remap = dict(zip(old_ids.tolist(), range(len(old_ids))))
+
+        with self._lock:
+            for entry in self._files.values():
+                entry["docs"] = [remap[doc] for doc in entry["docs"]]
+            self._segment = _Segment(os.path.join(self.index_dir, name))
+            self._segment_name = name
+            self._delta_docs, self._delta_postings, self._delta_size = {}, {}, 0
+            self._deleted, self._deleted_array = set(), np.zeros(0, np.int64)
+            self._next_doc = len(old_ids)
+            self._save()
+        self.stats["compactions"] += 1
+        log.info(f"Workspace index compacted to {len(old_ids)} snippets in {time.perf_counter() - start:.2f}s")
+        self._remove_old_segments()
+
+    # --- Persistence
+
+    def _save(self):
+        manifest = {"root": self.root, "segment": self._segment_name, "paths": self._paths, "files": self._files,
+                    "live_docs": self._live_docs, "total_length": self._total_length}
+        temporary = os.path.join(self.index_dir, f"{MANIFEST}.tmp")
+        with open(temporary, "w") as f:
+            json.dump(manifest, f)
+        os.replace(temporary, os.path.join(self.index_dir, MANIFEST))
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.index_dir, MANIFEST)) as f:
+                manifest = json.load(f)
+            if manifest["root"] != self.root:
+                log.info(f"Workspace index at {self.index_dir} is for {manifest['root']}, rebuilding it")
+                return
+            segment = _Segment(os.path.join(self.index_dir, manifest["segment"]))
+        except (OSError, ValueError, KeyError) as e:
+            if not isinstance(e, FileNotFoundError):
+                log.warning(f"Could not load the workspace index, rebuilding it: {e}")
+            return
+        self._segment, self._segment_name = segment, manifest["segment"]
+        self._paths, self._files = manifest["paths"], manifest["files"]
+        self._live_docs, self._total_length = manifest["live_docs"], manifest["total_length"]
+        self._next_doc = len(segment)
+        self.ready = True
+
+    def _remove_old_segments(self):
+        for name in os.listdir(self.index_dir):
+            if name.startswith("segment-") and name != self._segment_name:
+                # Fails on Windows while a search still maps the old files; retried after the next compaction
+                shutil.rmtree(os.path.join(self.index_dir, name), ignore_errors=True)
+
+
+class Workspace:
+    """
+    The index of the project in the `workspace_path` setting, refreshed in a
+    background thread every `workspace_refresh_seconds`. Reopened when the
+    path changes. Each project gets its own directory under
+    `workspace_index_path`, so an old index still finishing a refresh never
+    removes the segments of the new one, and switching back reuses it.
+    """
+
+    def __init__(self):
+        self.index = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = None
+
+    def get(self, settings):
+        """The index for the current settings, or None when no workspace is configured."""
+        root = settings.get("workspace_path") or ""
+        with self._lock:
+            if not root:
+                self._close()
+                return None
+            if self.index is None or self.index.root != os.path.abspath(root):
+                self._close()
+                self.index = WorkspaceIndex(root, self.index_dir(settings, root),
+                                            settings.get("workspace_extensions") or DEFAULT_EXTENSIONS)
+                self._stop = threading.Event()
+                self._thread = threading.Thread(target=self._run, args=(self.index, self._stop, settings),
+                                                name="workspace-index", daemon=True)
+                self._thread.start()
+            return self.index
+
+    @staticmethod
+    def index_dir(settings, root: str) -> str:
+        """The index directory of one project."""
+        key = hashlib.blake2b(os.path.abspath(root).encode(), digest_size=8).hexdigest()
+        return os.path.join(settings.get("workspace_index_path") or DEFAULT_INDEX_DIR, key)
+
+    def _run(self, index: WorkspaceIndex, stop: threading.Event, settings):
+        while not stop.is_set():
+            try:
+                counts = index.refresh(stop)
+                if counts["indexed"] or counts["removed"]:
+                    log.info(f"Workspace index refreshed in {index.stats['refresh_seconds']}s: {counts}")
+            except Exception as e:
+                log.exception(f"Workspace index refresh failed: {e}")
+            stop.wait(settings.get("workspace_refresh_seconds", 60))
+
+    def _close(self):
+        if self._stop is not None:
+            self._stop.set()
+        self.index = self._thread = self._stop = None
+
+
+def format_snippets(snippets: list) -> str:
+    """The snippets as a prompt section."""
+    parts = ["Relevant code from the project (reuse its names where they fit):"]
+    for snippet in snippets:
+        parts.append(f"--- {snippet['path']}:{snippet['start']}-{snippet['end']}\n{snippet['text']}")
+    return "\n".join(parts)
+
+
+workspace = Workspace()
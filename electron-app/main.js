@@ -1,13 +1,12 @@
 const { app, BrowserWindow, ipcMain, Tray, Menu, screen } = require('electron');
 const path = require('path');
 const { spawn } = require('child_process');
-const fs = require('fs');
-const os = require('os');
 
 let tray = null;
 let mainWindow = null;
 let hudWindow = null;
 let settingsWindow = null;
+let backendReady = Promise.resolve(false);
 
 function createWindow() {
   mainWindow = new BrowserWindow({
@@ -95,6 +94,19 @@ function createSettingsWindow() {
 function showHud() {
   hudWindow.show();
   hudWindow.webContents.send('update-status', 'Listening...');
+  reportOllamaState();
+}
+
+// Tells the HUD, while it is listening, whether Ollama's circuit breaker is open,
+// in which case the dictation will come back as a transcript without code
+function reportOllamaState() {
+  const axios = require('axios');
+  axios.get('http://127.0.0.1:5001/health', { timeout: 1000 })
+    .then(response => {
+      const ollama = response.data.ollama || {};
+      hudWindow.webContents.send('backend-status', ollama.state === 'open' ? 'Ollama offline: transcript only' : '');
+    })
+    .catch(() => hudWindow.webContents.send('backend-status', ''));
 }
 
 function hideHud() {
@@ -102,6 +114,28 @@ function hideHud() {
   hudWindow.webContents.send('update-status', 'Stopped');
 }
 
+// Resolves once the backend's /ready reports the warm-up finished, or after the timeout
+// so a backend that never warms up does not block dictations for good
+function waitForBackend(timeoutMs = 60000) {
+  const axios = require('axios');
+  const deadline = Date.now() + timeoutMs;
+  return new Promise((resolve) => {
+    const poll = () => {
+      axios.get('http://127.0.0.1:5001/ready', { timeout: 2000 })
+        .then(() => resolve(true))
+        .catch(() => {
+          if (Date.now() >= deadline) {
+            console.warn('Backend not ready after warm-up timeout, sending dictations anyway');
+            resolve(false);
+          } else {
+            setTimeout(poll, 500);
+          }
+        });
+    };
+    poll();
+  });
+}
+
 ipcMain.on('close-loading-window', () => {
   if (mainWindow) {
     mainWindow.close();
@@ -112,6 +146,7 @@ app.on('ready', () => {
   createWindow();
   createTray();
   createHudWindow();
+  backendReady = waitForBackend();
 
   const hotkeyListener = spawn('node', [path.join(__dirname, '../node-services/hotkeyListener.js')], { stdio: ['pipe', 'pipe', 'pipe', 'ipc'] });
 
@@ -149,113 +184,121 @@ ipcMain.on('toMain', (event, args) => {
 });
 
 ipcMain.on('audio-data', (event, data) => {
-  const tempPathUnconverted = path.join(os.tmpdir(), 'temp_audio_unconverted.wav');
-  const tempPathConverted = path.join(os.tmpdir(), 'temp_audio_converted.wav');
   const ffmpegPath = path.join(__dirname, '../backend/models/ffmpeg/ffmpeg.exe');
+  const audioBuffer = Buffer.from(data);
 
-  fs.writeFile(tempPathUnconverted, Buffer.from(data), (err) => {
-    if (err) {
-      console.error('Failed to save unconverted audio file:', err);
-      return;
-    }
-    console.log('Unconverted audio file saved to:', tempPathUnconverted);
-
-    try {
-      const stats = fs.statSync(tempPathUnconverted);
-      console.log(`Unconverted audio file size: ${stats.size} bytes`);
-      if (stats.size === 0) {
-        console.error('Error: Unconverted audio file is empty. Aborting conversion.');
-        return;
-      }
-    } catch (e) {
-      console.error('Error getting file stats:', e);
+  if (audioBuffer.length === 0) {
+    console.error('Error: Recorded audio is empty. Aborting conversion.');
+    return;
+  }
+  console.log(`Recorded audio size: ${audioBuffer.length} bytes`);
+
+  // Decode the recording in memory: ffmpeg reads it from stdin and writes
+  // 16-bit signed little-endian PCM at 16kHz mono to stdout, which is sent
+  // straight to the backend. No temp files are written.
+  // -i pipe:0: read input from stdin
+  // -ar 16000: set audio sample rate to 16kHz
+  // -ac 1: set number of audio channels to 1 (mono)
+  // -f s16le pipe:1: raw 16-bit PCM on stdout
+  const ffmpegArgs = [
+    '-i', 'pipe:0',
+    '-ar', '16000',
+    '-ac', '1',
+    '-f', 's16le',
+    'pipe:1'
+  ];
+
+  console.log('Running ffmpeg command:', [ffmpegPath, ...ffmpegArgs].join(' '));
+
+  const ffmpegProcess = spawn(ffmpegPath, ffmpegArgs);
+
+  const pcmChunks = [];
+  ffmpegProcess.stdout.on('data', (chunk) => {
+    pcmChunks.push(chunk);
+  });
+
+  let ffmpegStderr = '';
+  ffmpegProcess.stderr.on('data', (data) => {
+    ffmpegStderr += data.toString();
+  });
+
+  ffmpegProcess.on('error', (err) => {
+    console.error('Failed to start ffmpeg:', err);
+  });
+
+  ffmpegProcess.on('close', (code) => {
+    if (code !== 0) {
+      console.error(`ffmpeg process exited with code ${code}`);
+      console.error(ffmpegStderr);
       return;
     }
+    const pcm = Buffer.concat(pcmChunks);
+    console.log(`Converted audio: ${pcm.length} bytes of 16kHz mono PCM`);
+
+    // Send the PCM samples as the request body, once the backend has warmed up
+    const axios = require('axios');
+    backendReady.then(() => axios.post('http://127.0.0.1:5001/process-audio/raw', pcm, {
+      headers: { 'Content-Type': 'audio/L16; rate=16000; channels=1' },
+      maxBodyLength: Infinity
+    }))
+      .then(response => {
+        const code = response.data.code;
+        const automation = spawn('node', [path.join(__dirname, '../node-services/automation.js'), code], { stdio: ['pipe', 'pipe', 'pipe', 'ipc'] });
+
+        automation.stdout.on('data', (data) => {
+          console.log(`automation.js stdout: ${data}`);
+        });
 
-    // Command to convert the audio file using ffmpeg
-    // -i: input file
-    // -ar 16000: set audio sample rate to 16kHz
-    // -ac 1: set number of audio channels to 1 (mono)
-    // -c:a pcm_s16le: set audio codec to 16-bit signed little-endian PCM
-    // -y: overwrite output file if it exists
-    const ffmpegCommand = [
-      ffmpegPath,
-      '-i', tempPathUnconverted,
-      '-ar', '16000',
-      '-ac', '1',
-      '-c:a', 'pcm_s16le',
-      '-y', tempPathConverted
-    ];
-
-    console.log('Running ffmpeg command:', ffmpegCommand.join(' '));
-
-    const ffmpegProcess = spawn(ffmpegPath, [
-      '-i', tempPathUnconverted,
-      '-ar', '16000',
-      '-ac', '1',
-      '-c:a', 'pcm_s16le',
-      '-y', tempPathConverted
-    ]);
-
-    let ffmpegStderr = '';
-    ffmpegProcess.stderr.on('data', (data) => {
-      ffmpegStderr += data.toString();
-    });
-
-    ffmpegProcess.on('close', (code) => {
-      if (code !== 0) {
-        console.error(`ffmpeg process exited with code ${code}`);
-        return;
-      }
-      console.log('Converted audio file saved to:', tempPathConverted);
-
-      // Now send the CONVERTED file to the backend
-      const axios = require('axios');
-      axios.post('http://127.0.0.1:5001/process-audio', { path: tempPathConverted })
-        .then(response => {
-          const code = response.data.code;
-          const automation = spawn('node', [path.join(__dirname, '../node-services/automation.js'), code], { stdio: ['pipe', 'pipe', 'pipe', 'ipc'] });
-
-          automation.stdout.on('data', (data) => {
-            console.log(`automation.js stdout: ${data}`);
-          });
-
-          automation.stderr.on('data', (data) => {
-            console.error(`automation.js stderr: ${data}`);
-          });
-
-          automation.on('message', (message) => {
-            console.log(`automation.js message: ${JSON.stringify(message)}`);
-          });
-
-          automation.on('close', (code) => {
-            console.log(`automation.js exited with code ${code}`);
-          });
-        })
-        .catch(error => {
-          console.error('Error processing audio:', error);
-
-          // Show user-friendly error dialog
-          const { dialog } = require('electron');
-
-          let errorMessage = 'An error occurred while processing your voice command.';
-
-          // Check if it's a no_audio error (blank transcription)
-          if (error.response && error.response.data) {
-            if (error.response.data.error_type === 'no_audio') {
-              errorMessage = 'No audio was recorded. Please try speaking again.';
-            } else if (error.response.data.error) {
-              errorMessage = error.response.data.error;
-            }
+        automation.stderr.on('data', (data) => {
+          console.error(`automation.js stderr: ${data}`);
+        });
+
+        automation.on('message', (message) => {
+          console.log(`automation.js message: ${JSON.stringify(message)}`);
+        });
+
+        automation.on('close', (code) => {
+          console.log(`automation.js exited with code ${code}`);
+        });
+      })
+      .catch(error => {
+        console.error('Error processing audio:', error);
+
+        // A newer dictation replaced this one; nothing to report
+        if (error.response && error.response.data && error.response.data.error_type === 'superseded') {
+          return;
+        }
+
+        // Show user-friendly error dialog
+        const { dialog } = require('electron');
+
+        let errorMessage = 'An error occurred while processing your voice command.';
+
+        // Check if it's a no_audio error (blank transcription)
+        if (error.response && error.response.data) {
+          if (error.response.data.error_type === 'no_audio') {
+            errorMessage = 'No audio was recorded. Please try speaking again.';
+          } else if (error.response.data.error_type === 'ollama_unavailable') {
+            // Keep the dictation: the transcript goes to the clipboard
+            const { clipboard } = require('electron');
+            clipboard.writeText(error.response.data.transcript || '');
+            errorMessage = 'Ollama is not reachable, so no code was generated. Your transcript was copied to the clipboard.';
+          } else if (error.response.data.error) {
+            errorMessage = error.response.data.error;
           }
+        }
 
-          dialog.showMessageBox({
-            type: 'error',
-            title: 'Voice2Code Error',
-            message: errorMessage,
-            buttons: ['OK']
-          });
+        dialog.showMessageBox({
+          type: 'error',
+          title: 'Voice2Code Error',
+          message: errorMessage,
+          buttons: ['OK']
         });
-    });
+      });
+  });
+
+  ffmpegProcess.stdin.on('error', (err) => {
+    console.error('Failed to write audio to ffmpeg:', err);
   });
+  ffmpegProcess.stdin.end(audioBuffer);
 });
@@ -1,6 +1,7 @@
 let mediaRecorder;
 let audioChunks = [];
 let visualizerInterval = null;
+let backendNotice = '';
 
 const hud = document.getElementById('hud');
 const hudText = document.getElementById('hudText');
@@ -35,7 +36,7 @@ function stopVisualizer() {
 
 // --- Show/Hide HUD based on status ---
 function showHUD(text = 'Listening...') {
-  hudText.textContent = text;
+  hudText.textContent = backendNotice ? `${text} (${backendNotice})` : text;
   hud.classList.add('is-listening');
   startVisualizer();
 }
@@ -45,7 +46,14 @@ function hideHUD() {
   stopVisualizer();
 }
 
-// --- Electron IPC Handler
+// --- Electron IPC Handlers
+window.electronAPI.receive('backend-status', (notice) => {
+  backendNotice = notice;
+  if (hud.classList.contains('is-listening')) {
+    showHUD();
+  }
+});
+
 window.electronAPI.receive('update-status', async (status) => {
   if (status === 'Listening...') {
     // Reset recording state